@@ -0,0 +1,183 @@
+"""
+Compare the compiled-regex lexer in CppTokenizer against the original
+per-character loop it replaced.
+
+    python bench/bench_lexer.py [header ...]
+
+Without arguments the example header is repeated until it's roughly the
+size of a large real world header.
+
+Lexing lines should come out 4-8x faster than the legacy loop. The token
+stream gains less, about 3x, and that's the figure to hold it to rather
+than an order of magnitude: with ~3 tokens a line most of its time is the
+Python side of handing out each token (the iterator call, the list pop
+and the offsets kept for mark()) and reading each line, none of which the
+lexer can speed up.
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.tokenize import CppTokenizer
+from lib.snapshot import BufferSnapshot
+
+
+def legacy_get_tokens(line, trim=True, skip_whitespace=True):
+    """
+    The per-character loop CppTokenizer._get_tokens used before the
+    compiled lexer. Kept verbatim as the reference point.
+    """
+    tokens = []
+    current = ''
+
+    previous = None
+    if trim:
+        line = line.strip()
+    else:
+        line = line + '\n'
+    spin = 0
+
+    for i, char in enumerate(line):
+        if spin > 0:
+            spin -= 1
+            continue
+
+        if char == '*' and previous == '/':
+            # -- multi-line comment
+            tokens.append('/*')
+            continue
+
+        if char == '*' and (i + 1 < len(line)) and line[i+1] == '/':
+            tokens.append('*/')
+            spin = 1
+            continue
+
+        if char not in CppTokenizer.DELIMITS:
+            current += char
+        else:
+            if current:
+                tokens.append(current)
+            current = ''
+            if skip_whitespace:
+                if char not in ('\n', '\t'):
+                    tokens.append(char)
+            else:
+                tokens.append(char)
+        previous = char
+
+    if current:
+        tokens.append(current)
+
+    return tokens
+
+
+class LegacyTokenizer(CppTokenizer):
+    """
+    CppTokenizer with the original lexer and token loop (pop(0) and a
+    recursive call for every skipped token) for end-to-end comparison.
+    """
+    def _get_tokens(self, line):
+        return legacy_get_tokens(line, self._trim, self._skip_whitespace)
+
+    def _next(self, **kwargs):
+        while (self._current_tokens in (None, [])):
+            line = self._read_line()
+            if line is None:
+                self._current_tokens = None
+                return None
+
+            toks = self._get_tokens(line)
+            if toks:
+                self._current_tokens = toks
+                break
+
+        current_token = self._current_tokens.pop(0)
+
+        if kwargs.get('in_comment'):
+            return current_token
+
+        if current_token in ('', ' ') and self._skip_whitespace:
+            return self._next()
+
+        if current_token.startswith('//'):
+            self.skip_line()
+            return self._next()
+
+        if current_token.startswith('/*'):
+            while True:
+                tok = self._next(in_comment=True)
+                if tok is None:
+                    return None
+
+                if tok.endswith('*/'):
+                    return self._next()
+
+        return current_token
+
+
+def _lines(paths):
+    if not paths:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with open(os.path.join(root, 'examples', 'mymathlib.h')) as f:
+            text = f.read()
+        return (text * 300).splitlines()
+
+    lines = []
+    for path in paths:
+        with open(path) as f:
+            lines.extend(f.read().splitlines())
+    return lines
+
+
+def _time(func, lines, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _time_stream(cls, snapshot, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _token in cls(None, snapshot=snapshot):
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(paths):
+    lines = _lines(paths)
+    chars = sum(len(l) for l in lines)
+
+    # The legacy loop recurses once per skipped token
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    izer = CppTokenizer(None, use_line='')
+    print('{} lines, {} characters'.format(len(lines), chars))
+
+    for label, skip in (('skip whitespace', True), ('keep whitespace', False)):
+        izer._skip_whitespace = skip
+        old = _time(lambda l: legacy_get_tokens(l, skip_whitespace=skip), lines)
+        new = _time(izer._get_tokens, lines)
+        print('{:16} legacy {:8.2f} MB/s  compiled {:8.2f} MB/s  ({:.1f}x)'.format(
+            label, chars / old / 1e6, chars / new / 1e6, old / new
+        ))
+
+    snapshot = BufferSnapshot('\n'.join(lines))
+    old = _time_stream(LegacyTokenizer, snapshot)
+    new = _time_stream(CppTokenizer, snapshot)
+    print('{:16} legacy {:8.2f} MB/s  compiled {:8.2f} MB/s  ({:.1f}x)'.format(
+        'token stream', chars / old / 1e6, chars / new / 1e6, old / new
+    ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,405 @@
+"""
+Benchmark suite for the parser and the right click path built on it.
+
+    python bench/bench_parse.py [--sizes 1000,10000,100000] [--samples 200]
+                                [--save baseline.json] [--compare baseline.json]
+
+Every case runs over the files in examples/ and over generated headers (see
+corpus.py) of each size. Whole buffer cases (lexing, building the index)
+report throughput, per click cases (ownership_chain, location_outside,
+FunctionState, the header menu) are timed at sampled rows and report p50
+and p99 latency. extract_class is timed per class.
+
+--save writes the results to JSON. --compare checks the results against a
+saved run and exits with 1 if any p50 or p99 got slower than --tolerance
+allows, so right click regressions show up as numbers.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import headless
+from corpus import generate_header
+
+plugin = headless.load_plugin()
+utils = plugin.utils
+
+EXAMPLES = os.path.join(headless.ROOT, 'examples')
+
+
+class _View(utils.StringBuffer):
+    """
+    Scope selectors need the syntax engine, let every command try
+    """
+    def match_selector(self, point, selector):
+        return True
+
+
+class _Corpus(object):
+    """
+    A buffer to run the cases over along with the rows to click at
+    """
+    def __init__(self, name, text, path, samples):
+        self.name = name
+        self.text = text
+        self.path = path
+        self.rows = text.count('\n') + 1
+
+        rng = random.Random(0)
+        self.sample_rows = sorted(
+            rng.randrange(self.rows) for _ in range(min(samples, self.rows))
+        )
+
+
+    def view(self):
+        """
+        :return: A fresh _View of the text (nothing cached for it yet)
+        """
+        return _View(self.text, self.path)
+
+
+    @property
+    def is_header(self):
+        return os.path.splitext(self.path)[1] in ('.h', '.hpp')
+
+
+def _percentile(ordered, percent):
+    """
+    :param ordered: sorted list of samples
+    :return: The nearest rank percentile
+    """
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(max(rank - 1, 0), len(ordered) - 1)]
+
+
+def _stats(samples, size=None):
+    """
+    :param samples: list[float] of seconds
+    :param size: int characters processed by each sample (whole buffer
+    cases only)
+    :return: dict of the numbers we report
+    """
+    ordered = sorted(samples)
+    total = sum(ordered)
+    output = {
+        'samples' : len(ordered),
+        'mean_ms' : 1000.0 * total / len(ordered),
+        'p50_ms' : 1000.0 * _percentile(ordered, 50),
+        'p99_ms' : 1000.0 * _percentile(ordered, 99),
+        'ops_per_s' : len(ordered) / total if total else 0.0,
+    }
+    if size is not None:
+        output['mb_per_s'] = (size * len(ordered) / total / 1e6) if total else 0.0
+    return output
+
+
+def _timed(func, args_list):
+    """
+    :return: list[float] of seconds each call of func(*args) took
+    """
+    clock = time.perf_counter
+    output = []
+    for args in args_list:
+        start = clock()
+        func(*args)
+        output.append(clock() - start)
+    return output
+
+
+def _pos(view, row):
+    """
+    :return: tuple(x, y) layout position inside the row
+    """
+    return (4 * view.CHAR_WIDTH, (row + 0.5) * view.LINE_HEIGHT)
+
+
+# ----------------------------------------------------------------------------
+# -- Cases
+
+def case_lex(corpus, repeat):
+    """
+    Every token of the buffer through the CppTokenizer
+    """
+    def _lex():
+        izer = utils.CppTokenizer(
+            None, snapshot=utils.BufferSnapshot(corpus.text),
+            mask=utils.CommentMask.build(corpus.text)
+        )
+        while izer._next() is not None:
+            pass
+    return _stats(_timed(_lex, [()] * repeat), len(corpus.text))
+
+
+def case_index(corpus, repeat):
+    """
+    The first right click on a view, lexing and building the ScopeTree
+    """
+    def _index():
+        utils.IncrementalIndex(corpus.text).tree
+    return _stats(_timed(_index, [()] * repeat), len(corpus.text))
+
+
+def case_ownership_chain(corpus, repeat):
+    view = corpus.view()
+    snapshot = utils.BufferSnapshot(corpus.text)
+    utils.ScopeTree.for_view(view, snapshot) # Warm
+
+    return _stats(_timed(
+        lambda row: utils.CppTokenizer.ownership_chain(
+            view, _pos(view, row), snapshot=snapshot
+        ),
+        [(row,) for row in corpus.sample_rows]
+    ))
+
+
+def case_location_outside(corpus, repeat):
+    view = corpus.view()
+    snapshot = utils.BufferSnapshot(corpus.text)
+    tree = utils.ScopeTree.for_view(view, snapshot)
+
+    roots = []
+    for row in corpus.sample_rows:
+        chain = tree.chain_at(view.text_point(row, 0))
+        if chain:
+            roots.append((chain[0],))
+    if not roots:
+        return None
+
+    return _stats(_timed(
+        lambda root: utils.CppTokenizer.location_outside(
+            view, root, snapshot=snapshot
+        ),
+        roots
+    ))
+
+
+def case_from_text(corpus, repeat):
+    view = corpus.view()
+    snapshot = utils.BufferSnapshot(corpus.text)
+
+    found = []
+    for row in corpus.sample_rows:
+        text = utils.FunctionState.from_point(
+            view, view.text_point(row, 0), snapshot=snapshot
+        ).found()
+        if text:
+            found.append((text,))
+    if not found:
+        return None
+
+    return _stats(_timed(
+        lambda text: utils.FunctionState.from_text(view, text), found
+    ))
+
+
+def case_from_position(corpus, repeat):
+    view = corpus.view()
+    snapshot = utils.BufferSnapshot(corpus.text)
+    utils.ScopeTree.for_view(view, snapshot) # Warm
+
+    return _stats(_timed(
+        lambda row: utils.FunctionState.from_position(
+            view, _pos(view, row), snapshot=snapshot
+        ),
+        [(row,) for row in corpus.sample_rows]
+    ))
+
+
+def case_extract_class(corpus, repeat):
+    """
+    Every declaration of each class in one pass (see extract.py)
+    """
+    snapshot = utils.BufferSnapshot(corpus.text)
+    mask = utils.CommentMask.build(corpus.text)
+    tree = utils.ScopeTree.build(
+        snapshot, utils.CppTokenizer(None, snapshot=snapshot, mask=mask)
+    )
+
+    classes = [
+        (node,) for node in tree.root.walk() if node.kind in ('class', 'struct')
+    ]
+    if not classes:
+        return None
+
+    return _stats(_timed(
+        lambda node: list(utils.extract_class(node, snapshot, mask)), classes
+    ))
+
+
+def _menu(listener, view, corpus, row):
+    pos = _pos(view, row)
+    listener._build_header_menu(
+        view, 'context_menu', {'event' : {'x' : pos[0], 'y' : pos[1]}},
+        pos, corpus.path, os.path.splitext(corpus.path)[0] + '.cpp'
+    )
+
+
+def case_header_menu(corpus, repeat):
+    """
+    A right click with the view already indexed
+    """
+    if not corpus.is_header:
+        return None
+
+    view = corpus.view()
+    listener = plugin.CppRefactorListener()
+    _menu(listener, view, corpus, 0) # Warm
+
+    return _stats(_timed(
+        lambda row: _menu(listener, view, corpus, row),
+        [(row,) for row in corpus.sample_rows]
+    ))
+
+
+def case_header_menu_edit(corpus, repeat):
+    """
+    A right click just after typing a character somewhere else
+    """
+    if not corpus.is_header:
+        return None
+
+    view = corpus.view()
+    listener = plugin.CppRefactorListener()
+    _menu(listener, view, corpus, 0) # Warm
+
+    def _edit_and_menu(row):
+        view.insert(None, view.text_point(row, 0), ' ')
+        _menu(listener, view, corpus, row)
+
+    return _stats(_timed(
+        _edit_and_menu, [(row,) for row in corpus.sample_rows]
+    ))
+
+
+CASES = (
+    ('lex', case_lex),
+    ('index', case_index),
+    ('ownership_chain', case_ownership_chain),
+    ('location_outside', case_location_outside),
+    ('from_text', case_from_text),
+    ('from_position', case_from_position),
+    ('extract_class', case_extract_class),
+    ('header_menu', case_header_menu),
+    ('header_menu_edit', case_header_menu_edit),
+)
+
+
+# ----------------------------------------------------------------------------
+# -- Running
+
+def _corpora(sizes, samples):
+    output = []
+    for name in sorted(os.listdir(EXAMPLES)):
+        path = os.path.join(EXAMPLES, name)
+        with open(path) as f:
+            output.append(_Corpus(name, f.read(), path, samples))
+
+    for size in sizes:
+        name = 'generated_{}.h'.format(size)
+        output.append(_Corpus(
+            name, generate_header(size),
+            os.path.join(EXAMPLES, name), samples
+        ))
+    return output
+
+
+def _format(stats):
+    text = 'p50 {:9.3f} ms  p99 {:9.3f} ms'.format(
+        stats['p50_ms'], stats['p99_ms']
+    )
+    if 'mb_per_s' in stats:
+        text += '  {:8.2f} MB/s'.format(stats['mb_per_s'])
+    else:
+        text += '  {:8.0f} ops/s'.format(stats['ops_per_s'])
+    return text
+
+
+def _compare(results, baseline, tolerance):
+    """
+    :return: list[str] describing every regression past tolerance
+    """
+    regressions = []
+    for key, stats in sorted(results.items()):
+        before = baseline.get(key)
+        if before is None:
+            continue
+
+        for field in ('p50_ms', 'p99_ms'):
+            if before[field] <= 0:
+                continue
+            ratio = stats[field] / before[field]
+            if ratio > 1.0 + tolerance:
+                regressions.append('{} {} {:.3f} -> {:.3f} ms ({:.2f}x)'.format(
+                    key, field, before[field], stats[field], ratio
+                ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma separated line counts of generated headers')
+    parser.add_argument('--samples', type=int, default=200,
+                        help='Rows to click at per corpus')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs of each whole buffer case')
+    parser.add_argument('--cases', default=None,
+                        help='Comma separated cases to run (default all)')
+    parser.add_argument('--save', default=None, help='Write results to JSON')
+    parser.add_argument('--compare', default=None,
+                        help='JSON of an earlier run to check against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slow down before a regression')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    wanted = set(args.cases.split(',')) if args.cases else None
+
+    results = {}
+    for corpus in _corpora(sizes, args.samples):
+        print('{} ({} lines, {} characters)'.format(
+            corpus.name, corpus.rows, len(corpus.text)
+        ))
+        for name, case in CASES:
+            if wanted is not None and name not in wanted:
+                continue
+
+            stats = case(corpus, args.repeat)
+            if stats is None:
+                continue # Doesn't apply
+
+            results['{}/{}'.format(corpus.name, name)] = stats
+            print('    {:18} {}'.format(name, _format(stats)))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python' : platform.python_version(),
+                'platform' : platform.platform(),
+                'sizes' : sizes,
+                'samples' : args.samples,
+                'results' : results
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+        regressions = _compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            return 1
+        print('No regressions against {}'.format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
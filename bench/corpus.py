@@ -0,0 +1,207 @@
+"""
+Synthetic C++ headers for benchmarking the parser.
+
+    python bench/corpus.py 10000 > big.h
+
+Headers are built from a seeded random stream so the same size and seed
+always give the same text. They mix the things that make real headers
+slow to parse: nested namespaces, templates, block and line comments,
+access sections, forward declarations and long inline implementations.
+"""
+import random
+import sys
+
+_TYPES = (
+    'int', 'float', 'double', 'bool', 'std::string', 'std::size_t',
+    'std::vector<float>', 'std::map<std::string, int>',
+    'const std::string &', 'std::shared_ptr<Node>',
+    'std::function<void(const std::string &)>'
+)
+
+_WORDS = (
+    'value', 'count', 'index', 'name', 'buffer', 'parent', 'history',
+    'scale', 'offset', 'cache', 'total', 'limit', 'node', 'entry'
+)
+
+
+class _Writer(object):
+    """
+    Collects lines with the current indent
+    """
+    def __init__(self):
+        self.lines = []
+        self.depth = 0
+
+
+    def __call__(self, text=''):
+        self.lines.append(('    ' * self.depth + text) if text else '')
+
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def _name(rng, upper=False):
+    word = rng.choice(_WORDS) + str(rng.randint(0, 999))
+    return word[0].upper() + word[1:] if upper else word
+
+
+def _comment(rng, out):
+    choice = rng.random()
+    if choice < 0.4:
+        out('// {} the {}'.format(rng.choice(('Update', 'Fetch', 'Reset')), _name(rng)))
+    elif choice < 0.7:
+        out('/*')
+        for _ in range(rng.randint(1, 4)):
+            out('    Notes about {} and {}; {{ not code }}'.format(
+                _name(rng), _name(rng)
+            ))
+        out('*/')
+    else:
+        out('/** @brief {} */'.format(_name(rng)))
+
+
+def _inline_body(rng, out, length):
+    """
+    A function body with nested blocks, string literals and comments
+    """
+    out('{')
+    out.depth += 1
+    written = 0
+    while written < length:
+        choice = rng.random()
+        if choice < 0.2:
+            out('for (int i = 0; i < {}; ++i) {{'.format(rng.randint(2, 64)))
+            out('    total += values[i] * {}; // accumulate'.format(rng.randint(1, 9)))
+            out('}')
+            written += 3
+        elif choice < 0.35:
+            out('if (name == "{ };") {')
+            out('    return {};'.format(_name(rng)))
+            out('}')
+            written += 3
+        elif choice < 0.45:
+            out('/* inline {{ block }} comment */ auto {} = {};'.format(
+                _name(rng), rng.randint(0, 1000)
+            ))
+            written += 1
+        elif choice < 0.55:
+            out('std::function<void(int)> {} = [&](int x) {{ total += x; }};'.format(
+                _name(rng)
+            ))
+            written += 1
+        else:
+            out('{} = {}({}, {});'.format(
+                _name(rng), _name(rng), _name(rng), rng.randint(0, 99)
+            ))
+            written += 1
+    out.depth -= 1
+    out('}')
+
+
+def _method(rng, out, long_bodies):
+    ret = rng.choice(_TYPES)
+    name = _name(rng)
+    args = ', '.join(
+        '{} {}'.format(rng.choice(_TYPES), _name(rng))
+        for _ in range(rng.randint(0, 3))
+    )
+    prefix = rng.choice(('', '', 'virtual ', 'static ', 'inline '))
+    suffix = rng.choice(('', '', ' const', ' override', ' noexcept'))
+
+    if rng.random() < 0.15:
+        _comment(rng, out)
+
+    choice = rng.random()
+    if choice < 0.55:
+        out('{}{} {}({}){};'.format(prefix, ret, name, args, suffix))
+    elif choice < 0.75:
+        out('{}{} {}({}){} {{ return {}; }}'.format(
+            prefix, ret, name, args, suffix, _name(rng)
+        ))
+    else:
+        out('{}{} {}({}){}'.format(prefix, ret, name, args, suffix))
+        _inline_body(rng, out, rng.randint(5, 60 if long_bodies else 15))
+
+
+def _class(rng, out, budget, depth=0):
+    kind = rng.choice(('class', 'class', 'struct'))
+    name = _name(rng, upper=True)
+
+    if rng.random() < 0.3:
+        out('template <typename T, int N = {}>'.format(rng.randint(1, 16)))
+    if rng.random() < 0.3:
+        out('{} {} : public {}<T>'.format(kind, name, _name(rng, upper=True)))
+    else:
+        out('{} {}'.format(kind, name))
+    out('{')
+
+    start = len(out)
+    while len(out) - start < budget:
+        choice = rng.random()
+        if choice < 0.1:
+            out('{}:'.format(rng.choice(('public', 'protected', 'private', 'public slots'))))
+        elif choice < 0.15 and depth < 2:
+            out.depth += 1
+            _class(rng, out, budget // 4, depth + 1)
+            out.depth -= 1
+        elif choice < 0.35:
+            out.depth += 1
+            out('{} m_{};'.format(rng.choice(_TYPES), _name(rng)))
+            out.depth -= 1
+        else:
+            out.depth += 1
+            _method(rng, out, long_bodies=True)
+            out.depth -= 1
+
+    out('};')
+    out()
+
+
+def generate_header(lines, seed=0):
+    """
+    :param lines: int of roughly how many lines to generate
+    :param seed: int seed for the random stream
+    :return: str of the header
+    """
+    rng = random.Random(seed)
+    out = _Writer()
+
+    out('#pragma once')
+    out('#include <map>')
+    out('#include <string>')
+    out('#include <vector>')
+    out('#include <functional>')
+    out()
+    out('using namespace std::placeholders;')
+    out()
+
+    opened = 0
+    while len(out) < lines:
+        choice = rng.random()
+        if choice < 0.1 and opened < 3:
+            out('namespace {}'.format(_name(rng)))
+            out('{')
+            opened += 1
+        elif choice < 0.15 and opened:
+            opened -= 1
+            out('} // namespace')
+            out()
+        elif choice < 0.2:
+            out('class {};'.format(_name(rng, upper=True))) # Forward declaration
+        elif choice < 0.25:
+            _comment(rng, out)
+        else:
+            _class(rng, out, rng.randint(10, 120))
+
+    while opened:
+        out('} // namespace')
+        opened -= 1
+
+    return '\n'.join(out.lines) + '\n'
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    sys.stdout.write(generate_header(size, seed))
@@ -0,0 +1,70 @@
+"""
+Loading the plugin modules outside of Sublime Text for benchmarking.
+
+The parsing stack in lib/ runs on a StringBuffer without any help. The
+plugin modules themselves (cpp_refactor, cpp_refactor_commands) import
+sublime and sublime_plugin at the top, so when those aren't around we
+register the few names they need at import time. Nothing here is used by
+the plugin itself.
+"""
+import os
+import sys
+import types
+import tempfile
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _host_modules():
+    """
+    :return: tuple(module, module) standing in for sublime and
+    sublime_plugin
+    """
+    buffer = importlib.import_module(
+        '{}.lib.buffer'.format(os.path.basename(ROOT))
+    )
+    cache = tempfile.mkdtemp(prefix='cpp_toolkit_bench')
+
+    class _Settings(dict):
+        def get(self, key, default=None):
+            return dict.get(self, key, default)
+
+        def add_on_change(self, *args):
+            pass
+
+    sublime = types.ModuleType('sublime')
+    sublime.Region = buffer.Region
+    sublime.load_settings = lambda name: _Settings()
+    sublime.cache_path = lambda: cache
+    sublime.set_clipboard = lambda text: None
+    sublime.status_message = lambda text: None
+    sublime.set_timeout = lambda f, delay=0: f()
+    sublime.set_timeout_async = lambda f, delay=0: f()
+
+    sublime_plugin = types.ModuleType('sublime_plugin')
+    for name in ('EventListener', 'TextCommand', 'WindowCommand'):
+        setattr(sublime_plugin, name, type(name, (object,), {}))
+
+    return sublime, sublime_plugin
+
+
+def load_plugin():
+    """
+    Import the plugin as a package (its modules use relative imports)
+    :return: module of cpp_refactor
+    """
+    parent = os.path.dirname(ROOT)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+
+    try:
+        import sublime
+    except ImportError:
+        sublime, sublime_plugin = _host_modules()
+        sys.modules['sublime'] = sublime
+        sys.modules['sublime_plugin'] = sublime_plugin
+
+    return importlib.import_module(
+        '{}.cpp_refactor'.format(os.path.basename(ROOT))
+    )
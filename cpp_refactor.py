@@ -4,6 +4,7 @@ into the respective source and, eventually vis-versa
 """
 import re
 import os
+import sys
 import json
 import sublime
 import sublime_plugin
@@ -11,6 +12,7 @@ import sublime_plugin
 from .lib import utils
 from .cpp_refactor_commands import CppTokenizer, _BaseCppCommand
 from .cpp_refactor_commands import CppRefactorDetails, FunctionState
+from .cpp_refactor_commands import BufferSnapshot, CommentMask, LineTable
 
 __author__ = 'Michael McCartney'
 __version__ = '0.3.0'
@@ -18,14 +20,25 @@ __version__ = '0.3.0'
 
 def plugin_loaded():
     os.makedirs(utils._cache_path(), exist_ok=True)
+    utils.parse_cache.directory = os.path.join(
+        utils._cache_path(), utils.ParseCache.DIRECTORY
+    )
     utils._write_menu([])
 
+    # Start pairing up headers and sources in the open projects
+    settings = sublime.load_settings('CppToolkit.sublime-settings')
+    for window in sublime.windows():
+        utils.pairs.warm(window, settings)
+        utils.project_symbols.for_window(window, settings)
+
 
 def plugin_unloaded():
+    utils.executor.shutdown()
     try:
-        os.remove(os.path.join(utils._cache_path(), "Context.sublime-menu"))
+        os.remove(utils.menu_writer.path)
     except:
         pass
+    utils.menu_writer.forget()
 
 class CppRefactorListener(sublime_plugin.EventListener):
     """
@@ -35,84 +48,121 @@ class CppRefactorListener(sublime_plugin.EventListener):
     This is built to be modular and scale better than just be a one-trick pony
     """
 
-    def _args_to_vec(self, args):
-        return (args['event']['x'], args['event']['y'])
-
+    def __init__(self):
+        self._prefetch = utils.ContextPrefetch(
+            self._prefetch_row, size=self._row_context_size
+        )
 
-    def _context_line(self, view, pos):
-        return view.substr(view.line(view.layout_to_text(pos)))
 
-    def _previous_line(self, view, pos):
-        return (pos[0], pos[1] - view.line_height())
+    def _args_to_vec(self, args):
+        return (args['event']['x'], args['event']['y'])
 
-    def _next_line(self, view, pos):
-        return (pos[0], pos[1] + view.line_height())
 
-    def _current_line(self, view, pos):
+    def _current_line(self, view, row, snapshot):
         """
         Find the current line data. This is important because we have
         to handle search back until we find a proper delimiter
-        :return: str
+        :param row: int row of the buffer we're on
+        :param snapshot: BufferSnapshot to parse the function from
+        :return: tuple(str, int point the function starts on, list[begin,
+        end] of the implementation in the buffer or None)
         """
+        lines = LineTable.for_view(view, snapshot)
+        mask = CommentMask.for_view(view, snapshot)
 
-        og_pos = pos[:]
-        current_line = self._context_line(view, pos)
-
-        og_pos = self._previous_line(view, og_pos)
-        done = False
-        while og_pos[1] > 0 and not done:
+        row -= 1
+        while row >= 0:
             # Back up until we find the right item
-            prev_line = self._context_line(view, og_pos)
+            begin, end = lines.bounds(row)
+            prev_line = lines.line_text(row)
+
+            #
+            # Only code after the last comment on the line can be part of
+            # our function. Literals don't need the same care, their quotes
+            # are delimiters.
+            #
+            after_comment = False
+            for start, stop, kind in mask.ranges(begin, end):
+                if kind == CommentMask.COMMENT:
+                    prev_line = lines.text[stop:end]
+                    after_comment = True
+
+            if after_comment and not prev_line.strip():
+                # The line ends in a comment
+                row += 1 # Too far
+                break
 
-            # Check if the previous line is a comment
-            if prev_line.strip().startswith('//'):
-                done = True
+            if any(c in CppTokenizer.DELIMITS and c not in (' ', '\t') for c in prev_line):
+                # We've hit a delimit!
+                row += 1
                 break
 
-            # Strip away anything after a line comment
-            if '//' in prev_line:
-                prev_line = prev_line[:prev_line.index('//')]
+            if after_comment:
+                break # Nothing above the comment belongs to us
 
-            rev_line = prev_line[::-1]
+            row -= 1
 
-            # Check if the line ends in a multiline comment (it's backwards)
-            if rev_line.startswith('/*') or rev_line.startswith(':'):
-                og_pos = self._next_line(view, og_pos) # Too far
-                done = True
-                break
+        start = lines.begin_of(max(row, 0))
+        fs = FunctionState.from_point(view, start, snapshot=snapshot)
+        return (fs.found(), start, fs.impl_region)
 
-            create_line = ''
-            should_prepend = True
-            should_prev = True
-            in_quotes = False
 
-            for i, char in enumerate(rev_line):
+    def _row_context(self, view, row):
+        """
+        Everything the header menu needs for a row ahead of asking the
+        commands
+        :param row: int row of the buffer
+        :return: dict
+        """
+        #
+        # One copy of the buffer for every parse this menu needs
+        #
+        snapshot = BufferSnapshot.from_view(view)
 
-                if char == '"':
-                    in_quotes ^= 1 # Invert
+        # Pulls the index (and the ScopeTree) up to date as well
+        utils.ScopeTree.for_view(view, snapshot)
+        return {
+            'snapshot' : snapshot,
+            'line' : self._current_line(view, row, snapshot)
+        }
 
-                if (not in_quotes) and (char == '/') and (i + 1 < len(rev_line) and rev_line[i+1] == '/'):
-                    should_prepend = False # This is a line comment, no coming back from this.
-                    done = True
-                    break
 
-                if char in (' ', '\n', '\t') or (char not in CppTokenizer.DELIMITS):
-                    create_line = char + create_line
-                else:
-                    # We've hit a delimit!
-                    og_pos = self._next_line(view, og_pos)
-                    should_prev = False
-                    done = True
-                    break
+    def _prefetch_row(self, view, row):
+        """
+        Background version of _row_context() for the ContextPrefetch
+        :return: dict or None if the view isn't a header we can help with
+        """
+        found = self._counterpart(view)
+        if found is None or found[0] != 'header':
+            return None
+        return self._row_context(view, row)
 
-            if should_prepend:
-                current_line = create_line + current_line
 
-            if should_prev:
-                og_pos = self._previous_line(view, og_pos)
+    @staticmethod
+    def _row_context_size(ready):
+        """
+        :param ready: dict from _row_context()
+        :return: int estimate of its bytes. Most of it is the copy of the
+        buffer and the row starts (array('I')) we keep over it.
+        """
+        size = sys.getsizeof(ready) + sys.getsizeof(ready['line'])
+        snapshot = ready.get('snapshot')
+        if snapshot is not None:
+            text = snapshot.text
+            size += sys.getsizeof(text) + 4 * (text.count('\n') + 1)
+        return size
+
 
-        fs = FunctionState.from_position(view, og_pos)
-        return (fs.found(), og_pos)
+    def _schedule_prefetch(self, view):
+        """
+        Start on the context of the row the caret is on
+        :param view: sublime.View
+        :return: None
+        """
+        selection = view.sel()
+        if len(selection) != 1 or not view.file_name():
+            return
+        self._prefetch.schedule(view, view.rowcol(selection[0].b)[0])
 
 
     def _build_header_menu(self, view, command, args, pos, header, source):
@@ -131,7 +181,18 @@ class CppRefactorListener(sublime_plugin.EventListener):
         current_word = view.substr(view.word(view.layout_to_text(pos)))
         point = view.layout_to_text(pos)
 
-        current_line, mark_pos = self._current_line(view, pos)
+        #
+        # With any luck the caret's been sitting on this row and we've
+        # already done the work (for this version of the buffer)
+        #
+        row = view.rowcol(point)[0]
+        ready = self._prefetch.take(view, row)
+        if ready is None:
+            with utils.profiler.phase('current_line', view):
+                ready = self._row_context(view, row)
+
+        snapshot = ready['snapshot']
+        current_line, mark_pos, impl_region = ready['line']
         after_one = False
 
         detail = CppRefactorDetails(
@@ -144,9 +205,15 @@ class CppRefactorListener(sublime_plugin.EventListener):
             current_line=current_line,
             header=header,
             source=source,
-            marked_position=mark_pos
+            marked_position=mark_pos,
+            impl_region=impl_region,
+            snapshot=snapshot,
+            mask=CommentMask.for_view(view, snapshot)
         )
 
+        entries = []
+        variants = {}
+
         for possible_command in _BaseCppCommand._cppr_registry['header']:
 
             if possible_command.selectors:
@@ -158,7 +225,8 @@ class CppRefactorListener(sublime_plugin.EventListener):
             if not ok:
                 continue
 
-            menu_commands = possible_command.get_commands(detail)
+            with utils.profiler.phase('get_commands: ' + possible_command.__name__, view):
+                menu_commands = possible_command.get_commands(detail)
 
             if menu_commands:
 
@@ -178,22 +246,102 @@ class CppRefactorListener(sublime_plugin.EventListener):
 
                     menu_data.update({
                         "subcommand" : _BaseCppCommand.subl_command_name(possible_command),
-                        "default_open" : to_open,
-                        "header_file" : header,
-                        "source_file" : source,
-                        'detail' : detail.to_json() # Might as well have it all
+                        "default_open" : to_open
                     })
-                    output.append(
-                        { "command" : "cpp_refactor",
-                          "caption" : command_name,
-                          "args" : {
-                            "data" : menu_data
-                        } }
-                    )
+                    variants[hotkey_name] = menu_data
+
+                    entry = { "command" : "cpp_refactor",
+                              "caption" : command_name,
+                              "args" : {
+                                "data" : { "variant" : hotkey_name }
+                            } }
+                    entries.append(entry)
+                    output.append(entry)
+
+        if entries:
+            #
+            # The menu file only carries an id and the variant, the data
+            # stays here until the entry is picked
+            #
+            payload_id = utils.payloads.register({
+                "header_file" : header,
+                "source_file" : source,
+                'detail' : detail.to_json() # Might as well have it all
+            }, variants)
+
+            for entry in entries:
+                entry['args']['data']['payload'] = payload_id
 
         return output
 
 
+    def on_modified_async(self, view):
+        """
+        Keep the incremental index of any view we've parsed up to date so
+        the next right click doesn't pay for the whole buffer
+        :param view: sublime.View
+        :return: None
+        """
+        utils.executor.submit(
+            utils.IncrementalIndex.refresh, view,
+            priority=utils.Executor.LOW,
+            key=('index', view.id())
+        )
+
+
+    def on_selection_modified_async(self, view):
+        """
+        Get a head start on the context menu for wherever the caret is
+        :param view: sublime.View
+        :return: None
+        """
+        self._schedule_prefetch(view)
+
+
+    def on_activated_async(self, view):
+        """
+        :param view: sublime.View
+        :return: None
+        """
+        self._schedule_prefetch(view)
+
+
+    def on_post_save_async(self, view):
+        """
+        Keep the project's symbol index and the parse cache current with
+        what's on disk
+        :param view: sublime.View
+        :return: None
+        """
+        if view.file_name():
+            settings = sublime.load_settings('CppToolkit.sublime-settings')
+            utils.project_symbols.saved(view.window(), view.file_name(), settings)
+            utils.IncrementalIndex.saved(view)
+
+
+    def on_load(self, view):
+        """
+        Run whatever was waiting on the view to finish loading
+        :param view: sublime.View
+        :return: None
+        """
+        utils.dispatcher.loaded(view)
+
+
+    def on_close(self, view):
+        """
+        Forget anything we've cached about a view (everything per view is
+        registered with the view_caches budget)
+        :param view: sublime.View
+        :return: None
+        """
+        utils.view_caches.discard_view(view.id())
+        utils.executor.cancel(('index', view.id()))
+        utils.executor.cancel(('prefetch', view.id()))
+        if view.is_loading():
+            utils.dispatcher.discard(view)
+
+
     def on_post_text_command(self, view, command, args):
         """
         When finished with a text command, we want to erase the menu
@@ -207,6 +355,27 @@ class CppRefactorListener(sublime_plugin.EventListener):
             utils._write_menu([])
 
 
+    def _counterpart(self, view):
+        """
+        :param view: sublime.View
+        :return: tuple(str(header|source), str of the view's file, str of
+        the matching source/header file) or None if this isn't a C++ file
+        with a counterpart
+        """
+        current_file = view.file_name()
+        if not current_file:
+            return None # Nothing to be done
+
+        settings = sublime.load_settings('CppToolkit.sublime-settings')
+
+        found = utils.pairs.lookup(view.window(), current_file, settings)
+        if found is None:
+            return None # This isn't a C++ file (or it's on its own)
+
+        header_or_source, other_file = found
+        return (header_or_source, current_file, other_file)
+
+
     def on_text_command(self, view, command, args):
         """
         Text commands are handled when interacting with a view.
@@ -221,45 +390,41 @@ class CppRefactorListener(sublime_plugin.EventListener):
         """
         if command != "context_menu":
             return
-    
-        #
-        # Before we do anything, let's assert which file we're in and
-        # that we have the oposite file present and accounted for
-        #
-
-        current_file = view.file_name()
-        if not current_file:
-            return # Nothing to be done
-
-        header_or_source = None
-        other_file = None
 
         settings = sublime.load_settings('CppToolkit.sublime-settings')
+        profiler = utils.profiler
+        profiler.enabled = bool(settings.get('profile_context_menu', False))
+        if profiler.enabled:
+            # Count what we ask of the editor along the way
+            view = utils.CountingView(view)
 
-        base, filetype = os.path.splitext(current_file)
+        with utils.tracer.record('menu', view) as record:
+            with profiler.phase('total', view):
+                built = self._context_menu(view, command, args)
 
-        filetype = filetype.replace('.', '', 1)
+            if record is not None:
+                if built is None:
+                    record.outcome = 'skipped'
+                elif not built:
+                    record.outcome = 'empty'
 
-        header_types = settings.get("header_file_types", ["h", "hpp"])
-        source_types = settings.get("source_file_types", ["cpp"])
 
-        if filetype in header_types:
-            header_or_source = 'header'
-            for source_type in source_types:
-                if os.path.isfile(base + '.' + source_type):
-                    other_file = base + '.' + source_type
-                    break
-
-        elif filetype in source_types:
-            header_or_source = 'source'
+    def _context_menu(self, view, command, args):
+        """
+        Build and write the context menu for on_text_command()
+        :return: list of the menu entries or None if this isn't a C++ file
+        """
+        #
+        # Before we do anything, let's assert which file we're in and
+        # that we have the oposite file present and accounted for
+        #
 
-            for header_type in header_types:
-                if os.path.isfile(base + '.' + header_type):
-                    other_file = base + '.' + header_type
-                    break
+        with utils.profiler.phase('pairing', view):
+            found = self._counterpart(view)
+        if found is None:
+            return None # This isn't a C++ file
 
-        if header_or_source is None or other_file is None:
-            return # This isn't a C++ file
+        header_or_source, current_file, other_file = found
 
         #
         # The process of building our menu is most of the battle because
@@ -278,8 +443,11 @@ class CppRefactorListener(sublime_plugin.EventListener):
             ))
 
         if context_menu:
-            utils._write_menu([{
-                "caption" : "C++ Toolkit",
-                "children" : context_menu
-            }])
+            with utils.profiler.phase('write_menu', view):
+                utils._write_menu([{
+                    "caption" : "C++ Toolkit",
+                    "children" : context_menu
+                }])
+
+        return context_menu
 
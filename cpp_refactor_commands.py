@@ -4,15 +4,18 @@ The commands that actually write and move data provided by our "data"
 
 import re
 import os
-import time
 import json
 import sublime
-import threading
 import sublime_plugin
 
-from copy import deepcopy
 from .lib.utils import CppTokenizer, CppRefactorDetails
 from .lib.utils import _BaseCppRefactorMeta, FunctionState 
+from .lib.utils import BufferSnapshot, CommentMask, LineTable, ScopeTree
+from .lib.utils import MEMBER_WITH_DEFAULT, MEMBER_NO_DEFAULT
+from .lib.utils import profiler, traced, dispatcher, payloads
+from .lib.utils import menu_writer, view_caches
+from .lib.utils import extract_class, extract_definitions, FileBuffer
+from .lib.utils import argument_types, scoped_types
 
 class _BaseCppCommand(sublime_plugin.TextCommand, metaclass=_BaseCppRefactorMeta):
     """
@@ -56,23 +59,6 @@ class _BaseCppCommand(sublime_plugin.TextCommand, metaclass=_BaseCppRefactorMeta
 
     default_open = 'source_file'
 
-    FUNC_PRIV = re.compile(r'(\s+)?(?P<priv>.+)\:$')
-
-    @classmethod
-    def context_line(cls, view, pos):
-        return view.substr(view.line(view.layout_to_text(pos)))
-
-
-    @classmethod
-    def previous_line(cls, view, pos):
-        return (pos[0], pos[1] - view.line_height())
-
-
-    @classmethod
-    def next_line(cls, view, pos):
-        return (pos[0], pos[1] + view.line_height())
-
-
     @staticmethod
     def subl_command_name(cls):
         regex = re.compile(r'(.+?)([A-Z])')
@@ -93,10 +79,13 @@ class InteralInsertCommand(sublime_plugin.TextCommand):
 
     @classmethod
     def fire(cls, view, data):
-        while view.is_loading():
-            time.sleep(0.1)
+        """
+        Insert into the view now, or once it's loaded if it's still loading
+        """
         command_name = _BaseCppCommand.subl_command_name(InteralInsertCommand)
-        view.run_command(command_name, data)
+        dispatcher.when_loaded(
+            view, lambda loaded: loaded.run_command(command_name, data)
+        )
 
 
     def run(self, edit, **data):
@@ -148,37 +137,26 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
         """
         Check to see if this is a header function of some sort
         """
-        view = detail.view
+        analysis = detail.analysis
 
-        fs = FunctionState.from_text(view, detail.current_line)
+        fs = analysis.function_state
 
         if not fs.valid:
             return []
 
         original_position = detail.pos[:]
-        chain = CppTokenizer.ownership_chain(view, original_position)
-
-        func_priv = 'default' # public, private, protected, etc (future use)
-
-        this_position = cls.previous_line(view, original_position)
-        while this_position[1] > 0:
-            search_line = cls.context_line(view, this_position)
-            this_position = (this_position[0], this_position[1] - view.line_height())
-            priv_match = cls.FUNC_PRIV.match(search_line)
+        chain = analysis.ownership_chain
 
-            if priv_match and func_priv == 'default':
-                # This should the privilege of the function within it's class
-                func_priv = priv_match.groupdict()['priv']
-                break
-
-            search_line = cls.previous_line(view, this_position)
+        # public, private, protected, etc (future use)
+        func_priv = analysis.access
 
         match_data = fs.to_dict()
         match_data.update({
             "current_line" : detail.current_line,
             "ownership_chain" : chain,
             "function_priv" : func_priv,
-            'original_position' : original_position
+            'original_position' : original_position,
+            'impl_region' : detail.impl_region
         })
 
         commands = []
@@ -189,11 +167,8 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
             # Present the functions to move the implementation
             #
 
-            move_source = deepcopy(match_data)
-            move_source.update({ 'in_' : 'header', 'move_to' : 'source_file' })
-
-            move_header = deepcopy(match_data)
-            move_header.update({ 'in_' : 'header', 'move_to': 'header_file' })
+            move_source = dict(match_data, in_='header', move_to='source_file')
+            move_header = dict(match_data, in_='header', move_to='header_file')
 
             commands = [
                 ["move_impl_to_source",
@@ -212,11 +187,8 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
             # Functions to initially declare the impl
             #
 
-            source_declare = deepcopy(match_data)
-            source_declare.update({ 'in_' : 'source' })
-
-            header_declare = deepcopy(match_data)
-            header_declare.update({ 'in_' : 'header' })
+            source_declare = dict(match_data, in_='source')
+            header_declare = dict(match_data, in_='header')
             commands = [
                 ['delc_in_source',
                  "Declare In {}".format(os.path.basename(detail.source)),
@@ -229,8 +201,7 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
                  header_declare],
             ]
 
-        copy_declare = deepcopy(match_data)
-        copy_declare.update({ 'in_' : 'clipboard' })
+        copy_declare = dict(match_data, in_='clipboard')
         commands.append(
             ['copy_delc',
              'Copy Declaration to Clipboard',
@@ -276,6 +247,22 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
         return output
 
 
+    def _impl_region(self, data):
+        """
+        :param data: The data passed by get_commands()
+        :return: sublime.Region of the implementation as the parser found it
+        or None if we don't have it (or the buffer no longer agrees)
+        """
+        if not data.get('impl_region'):
+            return None
+
+        region = sublime.Region(*data['impl_region'])
+        found = self.view.substr(region).strip()
+        if not (found.startswith('{') and found.endswith('}')):
+            return None
+        return region
+
+
     def build_delc(self, data):
         """
         Given data, construct the signature based on ownership as well as
@@ -328,10 +315,18 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
             if 'const' in local_data['addendum']:
                 local_data['classifiers'] += ' const'
 
+        # Only extract_class() finds these, they're part of the signature
+        for key in ('ref_qualifier', 'noexcept'):
+            if local_data.get(key):
+                local_data['classifiers'] += ' ' + local_data[key]
+        if local_data.get('trailing_return'):
+            local_data['classifiers'] += ' -> ' + local_data['trailing_return']
+
         decl = CppDeclareInSourceCommand.DECLARE_FORMAT.format(**local_data)
         return (decl, local_data)
 
 
+    @traced('cpp_declare_in_source')
     def run(self, edit, **data):
         """
         Construct the complete function signature, handling the implementation
@@ -352,11 +347,12 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
             # __import__('pprint').pprint(local_data)
             if local_data.get('impl'):
                 # If we have the impl, we need to move it!
-                f = self._impl_to_regex(impl_string)
-                region = self.view.find(
-                    self._impl_to_regex(impl_string),
-                    self.view.layout_to_text(local_data['detail']['marked_position'])
-                )
+                region = self._impl_region(local_data)
+                if region is None:
+                    region = self.view.find(
+                        self._impl_to_regex(impl_string),
+                        local_data['detail']['marked_position']
+                    )
                 self.view.replace(edit, region, ';')
 
             if local_data['in_'] == 'source':
@@ -368,7 +364,11 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
                 # We attempt to declare just outside the highest ownership scope
                 point = None
                 if local_data['ownership_chain']:
-                    point = CppTokenizer.location_outside(self.view, local_data['ownership_chain'][0])
+                    point = CppTokenizer.location_outside(
+                        self.view,
+                        local_data['ownership_chain'][0],
+                        snapshot=BufferSnapshot.from_view(self.view)
+                    )
                 
                 if point is None:
                     point = self.view.size()
@@ -394,16 +394,10 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
                 edit_view = window.find_open_file(edit_file)
 
                 if edit_view is None:
-                    edit_vieww = window.open_file(edit_file)
+                    edit_view = window.open_file(edit_file)
 
-            #
-            # Fire off another thread to make sure we have a loaded buffer
-            #
-            b_thread = threading.Thread(
-                target=InteralInsertCommand.fire,
-                args=(edit_view, insert_data)
-            )
-            b_thread.start()
+            # Inserts right away or as soon as the buffer is loaded
+            InteralInsertCommand.fire(edit_view, insert_data)
 
         else:
             #
@@ -417,20 +411,213 @@ class CppDeclareInSourceCommand(_BaseCppCommand):
             sublime.set_clipboard(full_body)
 
 
+class CppImplementClassCommand(CppDeclareInSourceCommand):
+    """
+    Implement every method of a class in the source, from a right click on
+    the class name.
+
+    The class body is read in one pass (see extract_class()) and methods
+    the source already defines are left alone. Each stub is built with the
+    same rules as "Declare In" and they all go in with a single edit, so
+    one undo takes them back out.
+    """
+
+    selectors = ['entity.name.class', 'entity.name.struct']
+
+    #
+    # Specifiers that belong on the declaration in the class only
+    #
+    DECLARATION_ONLY = ('explicit',)
+
+    #
+    # Specifiers of methods that have to be defined in the header
+    #
+    HEADER_ONLY = ('inline', 'constexpr', 'consteval')
+
+    _TYPE_WORD = re.compile(r'(?<![\w:])[A-Za-z_]\w*')
+
+    @classmethod
+    def get_commands(cls, detail):
+        """
+        Only when we've clicked the name of a class or struct
+        """
+        if not detail.source:
+            return []
+
+        tree = ScopeTree.for_view(detail.view, detail.snapshot)
+        node = tree.head_at(detail.analysis.point)
+        if node is None or node.kind not in ('class', 'struct') \
+                or node.name != detail.current_word:
+            return []
+
+        return [
+            ['impl_class',
+             'Implement {} In {}'.format(node.name, os.path.basename(detail.source)),
+             'source_file',
+             { 'class_name' : node.name, 'class_head' : node.head }]
+        ]
+
+
+    def _header(self, path):
+        """
+        :param path: str of the header holding the class
+        :return: tuple(BufferSnapshot, ScopeTree, CommentMask) of the header,
+        from its view if it's open and from the disk otherwise
+        """
+        window = self.view.window()
+        view = window.find_open_file(path) if window is not None else None
+        if view is not None:
+            snapshot = BufferSnapshot.from_view(view)
+            return (
+                snapshot,
+                ScopeTree.for_view(view, snapshot),
+                CommentMask.for_view(view, snapshot)
+            )
+
+        snapshot = BufferSnapshot.from_view(FileBuffer(path))
+        mask = CommentMask.build(snapshot.text)
+        tree = ScopeTree.build(
+            snapshot, CppTokenizer(None, snapshot=snapshot, mask=mask)
+        )
+        return (snapshot, tree, mask)
+
+
+    @staticmethod
+    def _key(declaration):
+        """
+        :return: tuple of what tells overloads apart (name, argument types,
+        const) to match a declaration with its definition
+        """
+        const = 'const' in (declaration.function['addendum'] or '')
+        return (declaration.name, argument_types(declaration.function['args']), const)
+
+
+    @classmethod
+    def _needs_stub(cls, declaration):
+        """
+        :return: True for a method declared without a body that isn't
+        pure, defaulted, deleted, a template (those live in the header)
+        or a Qt signal (moc writes those)
+        """
+        return (
+            declaration.kind == 'method' and not declaration.has_impl
+            and declaration.default is None and declaration.template is None
+            and not declaration.signal
+            and not any(w in cls.HEADER_ONLY for w in declaration.function['type'].split())
+        )
+
+
+    @staticmethod
+    def _scoped_names(node, snapshot, mask):
+        """
+        A return type is read outside of the class, so the types declared
+        in it (and in the namespaces around it) need qualifying
+        :return: dict of each type's name to its qualified name
+        """
+        scopes = []
+        while node is not None and node.kind is not None:
+            scopes.insert(0, node)
+            node = node.parent
+
+        names = {}
+        prefix = ''
+        for scope in scopes:
+            prefix += (scope.name or '') + '::'
+            for name in scoped_types(scope, snapshot, mask):
+                names[name] = prefix + name
+        return names
+
+
+    def _defined(self, qualified):
+        """
+        :param qualified: str of the class's full name ('ns::Widget')
+        :return: set of the keys (see _key()) of the methods of the class
+        the source already defines. A definition's owner has to be the
+        whole name, or the end of it when the source leaves namespaces
+        out (using namespace ns;)
+        """
+        snapshot = BufferSnapshot.from_view(self.view)
+        mask = CommentMask.for_view(self.view, snapshot)
+        tree = ScopeTree.for_view(self.view, snapshot)
+        return set(
+            self._key(found)
+            for found in extract_definitions(tree, snapshot, mask)
+            if found.has_impl and found.kind == 'method'
+            and ('::' + qualified).endswith('::' + found.owner)
+        )
+
+
+    @traced('cpp_implement_class')
+    def run(self, edit, **data):
+        """
+        Build the stubs of everything the class is missing and add them to
+        the end of the source in one go
+        """
+        snapshot, tree, mask = self._header(data['header_file'])
+
+        node = tree.head_at(data['class_head'])
+        if node is None or node.name != data['class_name']:
+            # The header moved on since the click
+            node = tree.find('class', data['class_name']) \
+                or tree.find('struct', data['class_name'])
+        if node is None:
+            sublime.status_message(
+                'CppToolkit: Couldn\'t find {}'.format(data['class_name'])
+            )
+            return
+
+        chain = []
+        owner = node
+        while owner is not None and owner.kind is not None:
+            chain.insert(0, [owner.kind, owner.name])
+            owner = owner.parent
+
+        defined = self._defined('::'.join(name or '' for _, name in chain))
+        names = self._scoped_names(node, snapshot, mask)
+        qualify = lambda match: names.get(match.group(0), match.group(0))
+
+        stubs = []
+        for declaration in extract_class(node, snapshot, mask):
+            if not self._needs_stub(declaration) or self._key(declaration) in defined:
+                continue
+
+            local_data = dict(declaration.function, ownership_chain=chain)
+            local_data['type'] = self._TYPE_WORD.sub(qualify, ' '.join(
+                word for word in local_data['type'].split()
+                if word not in self.DECLARATION_ONLY
+            ))
+            decl, _ = self.build_delc(local_data)
+            stubs.append('\n\n' + decl + '\n{\n    \n}\n')
+
+        if not stubs:
+            sublime.status_message(
+                'CppToolkit: {} has nothing left to implement'.format(node.name)
+            )
+            return
+
+        point = self.view.size()
+        self.view.insert(edit, point, ''.join(stubs))
+
+        # Ready to fill in the first one
+        location = point + len(stubs[0]) - 3
+        self.view.sel().clear()
+        self.view.sel().add(sublime.Region(location))
+        self.view.show_at_center(location)
+
+        sublime.status_message('CppToolkit: Implemented {} method{} of {}'.format(
+            len(stubs), '' if len(stubs) == 1 else 's', node.name
+        ))
+
+
 class CppGetterSetterFunctionsCommand(_BaseCppCommand):
     """
     Quick way of building the setter and getter for a given member
     """
     flags = _BaseCppCommand.IN_HEADER # | _BaseCppCommand.IN_SOURCE
 
-    WITH_DEFAULT = re.compile(
-        r'(?:\s+)?(?P<type>.+)(?:\s)(?P<member>[^\s;]+)'\
-        r'(?:\s+)?(\=)(\s+)?(?P<default>.+)?\;'
-    )
+    WITH_DEFAULT = MEMBER_WITH_DEFAULT
 
-    NO_DEFAULT = re.compile(
-        r'(?:\s+)?(?P<type>.+)(?:\s)(?P<member>[^\s;]+)(?:\s+)?\;'
-    )
+    NO_DEFAULT = MEMBER_NO_DEFAULT
 
     GETTER_FORMAT = '\n{indent}{classifier}{type} {p_or_r}get{property_upper}() const{get_ending}'
     SETTER_FORMAT = '\n{indent}void set{property_upper}({set_classifier}{type} {p_or_r}{property_name}){set_ending}'
@@ -446,61 +633,26 @@ class CppGetterSetterFunctionsCommand(_BaseCppCommand):
         """
         Getting the commands...
         """
-        view = detail.view
-
-        func_priv = 'default'
-        func_priv_line = None
-        func_priv_loc = (0, 0)
-        this_position = cls.previous_line(view, detail.pos)
-
-        original_ownership = CppTokenizer.ownership_chain(view, detail.pos)
-
-        while this_position[1] > 0:
-            search_line = cls.context_line(view, this_position)
-            this_position = (this_position[0], this_position[1] - view.line_height())
-            priv_match = cls.FUNC_PRIV.match(search_line)
-
-            if priv_match and func_priv == 'default':
-
-                # Make sure we're within the right owner
-                this_ownership = CppTokenizer.ownership_chain(view, this_position)
-
-                if len(original_ownership) != len(this_ownership):
-                    continue
-
-                fail = False
-                for i in range(len(this_ownership)):
-                    if original_ownership[i] != this_ownership[i]:
-                        fail = True
-                        break
-
-                if fail:
-                    continue
-
-                # This should the privilege of the function within it's class
-                func_priv = priv_match.groupdict()['priv']
-                func_priv_loc = this_position
-                func_priv_line = search_line
-                break
-
-        match = cls.WITH_DEFAULT.match(detail.current_line)
-        if match is None:
-            match = cls.NO_DEFAULT.match(detail.current_line)
+        analysis = detail.analysis
 
+        match = analysis.member_match
         if match is None:
             return [] # Not a member we can devine
 
+        # The label the member falls under in its own class
+        func_priv = analysis.access
+        func_priv_loc = analysis.access_line[0]
+
         match_data = match.groupdict()
         match_data.update({
             'current_line' : detail.current_line,
             'original_position': detail.pos,
             'func_priv' : func_priv,
             'func_priv_loc' : func_priv_loc,
-            'func_priv_line': func_priv_line,
+            'func_priv_col' : analysis.access_column,
         })
 
-        with_imply = deepcopy(match_data)
-        with_imply.update({ 'impl' : True })
+        with_imply = dict(match_data, impl=True)
 
         return [
             ['gen_getset',
@@ -514,6 +666,7 @@ class CppGetterSetterFunctionsCommand(_BaseCppCommand):
         ]
 
 
+    @traced('cpp_getter_setter_functions')
     def run(self, edit, **data):
         """
         Create the functions and then build them into the header
@@ -547,8 +700,8 @@ class CppGetterSetterFunctionsCommand(_BaseCppCommand):
             local_data['classifier'] = 'const '
             local_data['set_classifier'] = 'const '
 
-        if data['func_priv'] != 'default':
-            local_data['indent'] = ' ' * (data['func_priv_line'].index(data['func_priv']) + 4)
+        if data.get('func_priv_col') is not None:
+            local_data['indent'] = ' ' * (data['func_priv_col'] + 4)
         else:
             local_data['indent'] = '    '
 
@@ -575,12 +728,12 @@ class CppGetterSetterFunctionsCommand(_BaseCppCommand):
         getter = self.GETTER_FORMAT.format(**local_data)
         setter = self.SETTER_FORMAT.format(**local_data)
 
-        loc = data['func_priv_loc']
-        if loc == [0, 0]:
-            loc = self.previous_line(self.view, data['original_position'])
-        else:
-            loc = self.next_line(self.view, loc)
-        point = self.view.layout_to_text(loc)
+        point = data['func_priv_loc']
+        if point is None:
+            # The end of the line above the member
+            lines = LineTable.for_view(self.view)
+            row = lines.row_of(self.view.layout_to_text(data['original_position']))
+            point = lines.end_of(max(row - 1, 0))
 
         self.view.insert(edit, point, getter + setter)
 
@@ -596,15 +749,20 @@ class CppRefactorCommand(sublime_plugin.WindowCommand):
     source
     """
 
-    def _fire_command(self, view, data):
-        while view.is_loading():
-            time.sleep(0.01)
-        view.run_command(data['subcommand'], data)
-
+    @traced('cpp_refactor')
     def run(self, data):
         """
         Based on the command passed, let's handle the 
         """
+        if 'payload' in data:
+            # From the context menu, the data was kept in memory
+            data = payloads.resolve(data['payload'], data['variant'])
+            if data is None:
+                sublime.status_message(
+                    'CppToolkit: That menu is out of date, right click again'
+                )
+                return
+
         show_file = data[data['default_open']]
 
         if self.window.active_view().file_name() != show_file:
@@ -616,11 +774,29 @@ class CppRefactorCommand(sublime_plugin.WindowCommand):
                 self.window.focus_view(show_view)
         else:
             show_view = self.window.active_view()
-        
-        # This is async in the event that we need to wait for
-        # the view to load (which happens on another thread)
-        a_thread = threading.Thread(
-            target=self._fire_command,
-            args=(show_view, data)
+
+        # The view might still be loading (which happens on another
+        # thread), the dispatcher holds on to the command until on_load
+        dispatcher.when_loaded(
+            show_view, lambda view: view.run_command(data['subcommand'], data)
         )
-        a_thread.start() # Cleanup? - hopefully gc'll handle it
+
+
+class CppToolkitProfileCommand(sublime_plugin.WindowCommand):
+    """
+    Show the rolling context menu timings in an output panel. Turn on the
+    "profile_context_menu" setting to start recording them.
+    """
+    PANEL = 'cpp_toolkit_profile'
+
+    def run(self, clear=False):
+        if clear:
+            profiler.clear()
+
+        report = profiler.report() + '\n' + menu_writer.report() + view_caches.report()
+        if not profiler.enabled:
+            report += '\nProfiling is off, set "profile_context_menu" to true to record.\n'
+
+        panel = self.window.create_output_panel(self.PANEL)
+        panel.run_command('append', { 'characters' : report })
+        self.window.run_command('show_panel', { 'panel' : 'output.' + self.PANEL })
@@ -0,0 +1,167 @@
+"""
+Analysis of a right click shared between every context aware command
+"""
+import re
+
+from .tokenize import CppTokenizer
+from .state import FunctionState
+from .scope import ScopeTree
+from .lines import LineTable
+from .profiler import profiler
+
+#
+# A class member declaration with and without a default value
+#
+MEMBER_WITH_DEFAULT = re.compile(
+    r'(?:\s+)?(?P<type>.+)(?:\s)(?P<member>[^\s;]+)'\
+    r'(?:\s+)?(\=)(\s+)?(?P<default>.+)?\;'
+)
+
+MEMBER_NO_DEFAULT = re.compile(
+    r'(?:\s+)?(?P<type>.+)(?:\s)(?P<member>[^\s;]+)(?:\s+)?\;'
+)
+
+
+class CppRefactorAnalysis(object):
+    """
+    Everything the commands want to know about where the user clicked. Each
+    piece is worked out the first time a command asks for it and kept for
+    the rest, so adding commands to the menu doesn't repeat the parsing.
+
+    ..code::python
+
+        @classmethod
+        def get_commands(cls, detail):
+            fs = detail.analysis.function_state
+            if not fs.valid:
+                return []
+    """
+    def __init__(self, detail):
+        """
+        :param detail: CppRefactorDetails of the click
+        """
+        self._detail = detail
+        self._memo = {}
+
+
+    def _get(self, name, build):
+        """
+        :param name: str key of the result
+        :param build: callable producing the result the first time
+        :return: The memoized result (which may well be None)
+        """
+        if name not in self._memo:
+            self._memo[name] = build()
+        return self._memo[name]
+
+
+    @property
+    def point(self):
+        """
+        :return: The buffer point of the click
+        """
+        detail = self._detail
+        return self._get('point', lambda: detail.view.layout_to_text(detail.pos))
+
+
+    @property
+    def lines(self):
+        """
+        :return: LineTable of the buffer
+        """
+        detail = self._detail
+        return self._get(
+            'lines', lambda: LineTable.for_view(detail.view, detail.snapshot)
+        )
+
+
+    @property
+    def ownership_chain(self):
+        """
+        :return: list[list[str(class|struct|namespace), str]] of the scopes
+        we clicked in
+        """
+        detail = self._detail
+        def _build():
+            with profiler.phase('ownership_chain', detail.view):
+                return CppTokenizer.ownership_chain(
+                    detail.view, detail.pos, snapshot=detail.snapshot
+                )
+        return self._get('ownership_chain', _build)
+
+
+    @property
+    def section(self):
+        """
+        :return: AccessSection the click falls under or None
+        """
+        detail = self._detail
+        return self._get('section', lambda: ScopeTree.for_view(
+            detail.view, detail.snapshot
+        ).access_at(self.point))
+
+
+    @property
+    def access(self):
+        """
+        :return: str of the access label we're under ('public', 'private
+        slots', ...) or 'default' when there isn't one
+        """
+        section = self.section
+        return 'default' if section is None else section.label
+
+
+    @property
+    def access_line(self):
+        """
+        :return: tuple(int point at the end of the label's line, str of the
+        line) or (None, None) when there's no label
+        """
+        def _build():
+            section = self.section
+            if section is None:
+                return (None, None)
+            row = self.lines.row_of(section.head)
+            return (self.lines.end_of(row), self.lines.line_text(row))
+        return self._get('access_line', _build)
+
+
+    @property
+    def access_column(self):
+        """
+        :return: int column the label starts at (tabs count as one) or None
+        when there's no label
+        """
+        def _build():
+            section = self.section
+            if section is None:
+                return None
+            row = self.lines.row_of(section.head)
+            return section.head - self.lines.begin_of(row)
+        return self._get('access_column', _build)
+
+
+    @property
+    def function_state(self):
+        """
+        :return: FunctionState parsed from the current line
+        """
+        detail = self._detail
+        return self._get('function_state', lambda: FunctionState.from_text(
+            detail.view, detail.current_line
+        ))
+
+
+    @property
+    def member_match(self):
+        """
+        :return: re.Match of the current line as a class member (with the
+        type, member and possibly default groups) or None
+        """
+        def _build():
+            line = self._detail.current_line
+            match = MEMBER_WITH_DEFAULT.match(line)
+            if match is None:
+                match = MEMBER_NO_DEFAULT.match(line)
+            return match
+        return self._get('member_match', _build)
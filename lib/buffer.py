@@ -0,0 +1,267 @@
+"""
+Buffers that stand in for a sublime.View outside of the editor
+"""
+import re
+import io
+from bisect import bisect_right
+from itertools import count
+
+_NEWLINE = re.compile('\n')
+
+
+class Region(object):
+    """
+    The parts of sublime.Region the parser uses, for when sublime isn't
+    around to provide the real one
+    """
+    __slots__ = ('a', 'b')
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+
+    def begin(self):
+        return min(self.a, self.b)
+
+
+    def end(self):
+        return max(self.a, self.b)
+
+
+    def size(self):
+        return self.end() - self.begin()
+
+
+    def empty(self):
+        return self.a == self.b
+
+
+    def __len__(self):
+        return self.size()
+
+
+    def __eq__(self, other):
+        return (self.a, self.b) == (other.a, other.b)
+
+
+    def __repr__(self):
+        return 'Region({}, {})'.format(self.a, self.b)
+
+
+def make_region(a, b=None):
+    """
+    :return: sublime.Region when we're running in the editor, otherwise our
+    own Region
+    """
+    try:
+        import sublime
+    except ImportError:
+        return Region(a, b)
+    return sublime.Region(a, b)
+
+
+class StringBuffer(object):
+    """
+    A str that answers to the subset of the sublime.View API the parsing
+    stack (CppTokenizer, FunctionState, ScopeTree, ...) relies on, so it
+    can run without the editor.
+
+    Layout coordinates are a fixed grid, each character is CHAR_WIDTH wide
+    and each row is LINE_HEIGHT tall (no word wrap).
+
+    ..code::python
+
+        view = StringBuffer(text)
+        chain = CppTokenizer.ownership_chain_at(view, view.text_point(12, 0))
+    """
+    LINE_HEIGHT = 1.0
+    CHAR_WIDTH = 1.0
+
+    _ids = count(1)
+
+    def __init__(self, text, file_name=None):
+        """
+        :param text: str of the whole buffer
+        :param file_name: Path the buffer claims to belong to (if any)
+        """
+        self._id = next(self._ids)
+        self._file_name = file_name
+        self._change_count = 0
+        self._set_text(text)
+
+
+    def _set_text(self, text):
+        self._text = text
+        self._starts = [0]
+        self._starts.extend(m.end() for m in _NEWLINE.finditer(text))
+
+
+    # -- Identity
+
+    def id(self):
+        return self._id
+
+
+    def file_name(self):
+        return self._file_name
+
+
+    def change_count(self):
+        return self._change_count
+
+
+    def is_loading(self):
+        return False
+
+
+    # -- Text
+
+    def size(self):
+        return len(self._text)
+
+
+    def substr(self, x):
+        """
+        :param x: Region (or anything with begin()/end()) or a point
+        :return: str of the region or the character at the point
+        """
+        if isinstance(x, int):
+            return self._text[x:x + 1]
+        return self._text[x.begin():x.end()]
+
+
+    def find(self, pattern, start_point, flags=0):
+        """
+        :return: Region of the first match of pattern at or after
+        start_point or Region(-1, -1)
+        """
+        match = re.compile(pattern, flags).search(self._text, start_point)
+        if match is None:
+            return make_region(-1, -1)
+        return make_region(match.start(), match.end())
+
+
+    # -- Rows and points
+
+    def _row_of(self, point):
+        return max(bisect_right(self._starts, point) - 1, 0)
+
+
+    def _row_end(self, row):
+        if row + 1 < len(self._starts):
+            return self._starts[row + 1] - 1
+        return len(self._text)
+
+
+    def rowcol(self, point):
+        """
+        :return: tuple(row, col) of point
+        """
+        row = self._row_of(point)
+        return (row, point - self._starts[row])
+
+
+    def text_point(self, row, col):
+        """
+        :return: The point at row, col (clamped to the buffer)
+        """
+        row = min(max(row, 0), len(self._starts) - 1)
+        return min(self._starts[row] + col, self._row_end(row))
+
+
+    def line(self, x):
+        """
+        :param x: Region or point
+        :return: Region of the line(s) holding x without the newline
+        """
+        if isinstance(x, int):
+            row = self._row_of(x)
+            return make_region(self._starts[row], self._row_end(row))
+
+        begin = self.line(x.begin())
+        end = self.line(x.end())
+        return make_region(begin.begin(), end.end())
+
+
+    def full_line(self, x):
+        """
+        :return: Region of line(x) with its newline
+        """
+        line = self.line(x)
+        return make_region(line.begin(), min(line.end() + 1, len(self._text)))
+
+
+    def word(self, x):
+        """
+        :return: Region of the word around the point (or region)
+        """
+        point = x if isinstance(x, int) else x.begin()
+        begin = end = point
+        while begin > 0 and (self._text[begin - 1].isalnum() or self._text[begin - 1] == '_'):
+            begin -= 1
+        while end < len(self._text) and (self._text[end].isalnum() or self._text[end] == '_'):
+            end += 1
+        return make_region(begin, end)
+
+
+    # -- Layout
+
+    def line_height(self):
+        return self.LINE_HEIGHT
+
+
+    def layout_extent(self):
+        return (0.0, len(self._starts) * self.LINE_HEIGHT)
+
+
+    def layout_to_text(self, vector):
+        """
+        :param vector: tuple(x, y) layout position
+        :return: The point at that position
+        """
+        row = int(vector[1] // self.LINE_HEIGHT)
+        col = max(int(vector[0] // self.CHAR_WIDTH), 0)
+        return self.text_point(row, col)
+
+
+    def text_to_layout(self, point):
+        row, col = self.rowcol(point)
+        return (col * self.CHAR_WIDTH, row * self.LINE_HEIGHT)
+
+
+    def window_to_layout(self, vector):
+        return vector
+
+
+    # -- Editing, the edit argument is there to match sublime.View
+
+    def insert(self, edit, point, text):
+        self._set_text(self._text[:point] + text + self._text[point:])
+        self._change_count += 1
+        return len(text)
+
+
+    def replace(self, edit, region, text):
+        self._set_text(
+            self._text[:region.begin()] + text + self._text[region.end():]
+        )
+        self._change_count += 1
+
+
+    def erase(self, edit, region):
+        self.replace(edit, region, '')
+
+
+class FileBuffer(StringBuffer):
+    """
+    StringBuffer read from a file on disk
+    """
+    def __init__(self, path, encoding='utf-8'):
+        """
+        :param path: Path to the file
+        :param encoding: Encoding of the file
+        """
+        with io.open(path, encoding=encoding, newline='') as f:
+            text = f.read()
+        StringBuffer.__init__(self, text.replace('\r\n', '\n'), path)
@@ -0,0 +1,284 @@
+"""
+Caching of per-view analysis
+"""
+import sys
+import threading
+
+from collections import OrderedDict
+
+
+class ViewCacheManager(object):
+    """
+    Keeps what the per-view caches hold under a memory budget. Every cache
+    (ViewCache, ContextPrefetch, ...) registers here and tells us when a
+    view is used and when what it holds for a view has grown. Once the
+    estimated total is past the budget the least recently used views are
+    dropped from every cache, they're simply rebuilt (or loaded from the
+    ParseCache) if they're needed again.
+
+    A cache needs two methods:
+    - size_of(view_id): int estimate of the bytes it holds for the view
+    - discard(view_id): forget the view
+
+    ..code::python
+
+        view_caches.register(cache)
+
+        view_caches.hit(view.id())   # Had it
+        view_caches.miss(view.id())  # Built it, measure and maybe evict
+
+        view_caches.discard_view(view.id()) # It closed
+    """
+
+    # Default budget (MB) when the "view_cache_mb" setting isn't there
+    BUDGET_MB = 256
+
+    def __init__(self, budget=None):
+        """
+        :param budget: int of bytes (defaults to the "view_cache_mb" setting)
+        """
+        self._budget = budget
+        self._lock = threading.RLock()
+        self._caches = []
+
+        # view id -> estimated bytes, least recently used first
+        self._views = OrderedDict()
+
+        # -- Counters for the curious
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.freed = 0
+
+
+    @property
+    def budget(self):
+        if self._budget is not None:
+            return self._budget
+        try:
+            import sublime
+        except ImportError:
+            return self.BUDGET_MB * 1024 * 1024
+
+        settings = sublime.load_settings('CppToolkit.sublime-settings')
+        megabytes = settings.get('view_cache_mb', self.BUDGET_MB)
+        return int(megabytes) * 1024 * 1024
+
+
+    @property
+    def total(self):
+        """
+        :return: int of the bytes we estimate every cache holds
+        """
+        with self._lock:
+            return sum(self._views.values())
+
+
+    def register(self, cache):
+        with self._lock:
+            self._caches.append(cache)
+
+
+    def hit(self, view_id):
+        """
+        A cache answered for a view with what it already had
+        """
+        with self._lock:
+            self.hits += 1
+            if view_id in self._views:
+                self._views.move_to_end(view_id)
+
+
+    def miss(self, view_id):
+        """
+        A cache had to build (or update) what it holds for a view
+        """
+        with self._lock:
+            self.misses += 1
+        self.grew(view_id)
+
+
+    def grew(self, view_id):
+        """
+        What the caches hold for a view changed, measure it again and
+        evict other views if that takes us over budget
+        :return: None
+        """
+        with self._lock:
+            self._views[view_id] = sum(c.size_of(view_id) for c in self._caches)
+            self._views.move_to_end(view_id)
+
+            budget = self.budget
+            total = sum(self._views.values())
+            while total > budget and len(self._views) > 1:
+                oldest = next(iter(self._views))
+                if oldest == view_id:
+                    break
+                total -= self._views.pop(oldest)
+                for cache in self._caches:
+                    cache.discard(oldest)
+                self.evicted += 1
+
+
+    def discard_view(self, view_id):
+        """
+        Drop a view from every cache (e.g. when it closes)
+        """
+        with self._lock:
+            if self._views.pop(view_id, None) is not None:
+                self.freed += 1
+            for cache in self._caches:
+                cache.discard(view_id)
+
+
+    def report(self):
+        """
+        :return: str of what we hold and how well it's been used
+        """
+        total = self.hits + self.misses
+        return (
+            'View caches: {} views, {:.1f} of {:.0f} MB, {} hits, {} misses '
+            '({:.0f}% hits), {} evicted, {} freed on close\n'
+        ).format(
+            len(self._views), self.total / (1024.0 * 1024.0),
+            self.budget / (1024.0 * 1024.0), self.hits, self.misses,
+            100.0 * self.hits / total if total else 0.0,
+            self.evicted, self.freed
+        )
+
+
+class ViewCache(object):
+    """
+    Storage for results that are only valid for one version of a view's
+    buffer. Entries are keyed by view id and rebuilt (or updated) as soon
+    as the view's change_count() moves on. What we hold counts against the
+    ViewCacheManager's budget.
+
+    Safe to use from the main thread and workers at once, building or
+    updating an entry happens under a lock for its view so an update isn't
+    applied twice (or wound back) by two threads. Other views aren't held
+    up meanwhile.
+
+    ..code::python
+
+        _trees = ViewCache(size=lambda tree: tree.nbytes())
+        tree = _trees.get(view, lambda: ScopeTree.build(snapshot),
+                          version=snapshot.change_count)
+    """
+    def __init__(self, size=None, manager=None):
+        """
+        :param size: callable(value) returning an int estimate of its
+        bytes (defaults to sys.getsizeof())
+        :param manager: ViewCacheManager we answer to (defaults to
+        view_caches)
+        """
+        self._entries = {}
+        # Guards _locks, each view's entry has its own lock in there
+        self._lock = threading.RLock()
+        self._locks = {}
+        self._size = size or sys.getsizeof
+        self._manager = manager or view_caches
+        self._manager.register(self)
+
+
+    def get(self, view, build, update=None, version=None):
+        """
+        :param view: sublime.View the result belongs to
+        :param build: callable producing the result when we don't have it
+        :param update: callable taking a stale result and returning one for
+        the current buffer. Without it stale results are simply rebuilt.
+        :param version: The change_count() of the buffer build and update
+        work from (e.g. BufferSnapshot.change_count). Defaults to the view's
+        change_count() now, which is only right if they read the view now.
+        :return: The cached (or freshly built) result
+        """
+        key = view.id()
+        if version is None:
+            version = view.change_count()
+
+        with self._view_lock(key):
+            entry = self._entries.get(key)
+            stale = entry is not None and entry[0] > version
+            hit = entry is not None and entry[0] == version
+            if hit:
+                value = entry[1]
+            elif not stale:
+                if entry is not None and update is not None:
+                    value = update(entry[1])
+                else:
+                    value = build()
+                self._entries[key] = (version, value)
+
+        if stale:
+            # A caller with an older copy of the buffer than ours, it gets
+            # its own result rather than winding ours back
+            return build()
+
+        # Only once we've let go of the lock, the manager takes its own and
+        # calls back into every cache
+        if hit:
+            self._manager.hit(key)
+        else:
+            self._manager.miss(key)
+        return value
+
+
+    def _view_lock(self, view_id):
+        """
+        :return: RLock building and updating a view's entry is done under
+        """
+        with self._lock:
+            lock = self._locks.get(view_id)
+            if lock is None:
+                lock = self._locks[view_id] = threading.RLock()
+            return lock
+
+
+    def peek(self, view):
+        """
+        :return: What we have for the view if it's current, otherwise None
+        (nothing is built or updated)
+        """
+        entry = self._entries.get(view.id())
+        if entry is not None and entry[0] == view.change_count():
+            return entry[1]
+        return None
+
+
+    def holds(self, view):
+        """
+        :return: True if we have anything (stale or not) for the view
+        """
+        return view.id() in self._entries
+
+
+    def size_of(self, view_id):
+        """
+        :return: int estimate of the bytes we hold for a view
+        """
+        # No lock, the manager calls this holding its own (see get())
+        entry = self._entries.get(view_id)
+        return self._size(entry[1]) if entry is not None else 0
+
+
+    def discard(self, view_id):
+        """
+        Drop whatever we have for a view
+        """
+        self._entries.pop(view_id, None)
+        with self._lock:
+            self._locks.pop(view_id, None)
+
+
+    @classmethod
+    def discard_view(cls, view_id):
+        """
+        Drop a view from every cache (e.g. when it closes)
+        """
+        view_caches.discard_view(view_id)
+
+
+#
+# The budget every per-view cache shares
+#
+view_caches = ViewCacheManager()
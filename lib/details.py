@@ -1,6 +1,7 @@
 """
 Utility for details when creating context aware commands
 """
+from .analysis import CppRefactorAnalysis
 
 class CppRefactorDetails(object):
     """
@@ -19,6 +20,10 @@ class CppRefactorDetails(object):
         self._source = kwargs.get('source')
         self._current_file_type = kwargs.get('current_file_type')
         self._marked_position = kwargs.get('marked_position')
+        self._impl_region = kwargs.get('impl_region')
+        self._snapshot = kwargs.get('snapshot')
+        self._mask = kwargs.get('mask')
+        self._analysis = None
 
     def to_json(self):
         """
@@ -47,11 +52,49 @@ class CppRefactorDetails(object):
     @property
     def marked_position(self):
         """
-        :return: The position that we think is most likely the start of a given item
+        :return: The point that we think is most likely the start of a given item
         """
         return self._marked_position
     
 
+    @property
+    def impl_region(self):
+        """
+        :return: list[begin, end] buffer points of the implementation of the
+        function we're on (if it has one)
+        """
+        return self._impl_region
+
+
+    @property
+    def snapshot(self):
+        """
+        :return: BufferSnapshot of the view taken when the command started.
+        Parsing should prefer this over going back to the view.
+        """
+        return self._snapshot
+
+
+    @property
+    def mask(self):
+        """
+        :return: CommentMask of the snapshot for telling code apart from
+        comments and literals
+        """
+        return self._mask
+
+
+    @property
+    def analysis(self):
+        """
+        :return: CppRefactorAnalysis shared by every command looking at
+        this click. Prefer it over parsing the line yourself.
+        """
+        if self._analysis is None:
+            self._analysis = CppRefactorAnalysis(self)
+        return self._analysis
+
+
     @property
     def view(self):
         """
@@ -0,0 +1,108 @@
+"""
+Running actions against views once they've finished loading
+"""
+import os
+import threading
+
+
+class LoadDispatcher(object):
+    """
+    Holds actions for views that are still loading, keyed by file path,
+    and runs them from the on_load event. Actions for a view that's
+    already loaded run straight away, so nothing ever polls is_loading().
+
+    ..code::python
+
+        view = window.open_file(path)
+        dispatcher.when_loaded(view, lambda v: v.run_command(...))
+
+        # In the EventListener
+        def on_load(self, view):
+            dispatcher.loaded(view)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+
+    def when_loaded(self, view, action):
+        """
+        :param view: sublime.View to act on
+        :param action: callable(view) to run once the view has loaded
+        :return: None
+        """
+        path = view.file_name()
+        if path is None or not view.is_loading():
+            action(view)
+            return
+
+        with self._lock:
+            self._pending.setdefault(self._key(path), []).append(action)
+
+        if not view.is_loading():
+            # Finished between the check and queueing up
+            self.loaded(view)
+
+
+    def open_then(self, window, path, action):
+        """
+        Find or open path in the window and run action on it once it's loaded
+        :param window: sublime.Window
+        :param path: str of the file
+        :param action: callable(view)
+        :return: sublime.View of the file
+        """
+        view = window.find_open_file(path)
+        if view is None:
+            view = window.open_file(path)
+        self.when_loaded(view, action)
+        return view
+
+
+    def loaded(self, view):
+        """
+        Run everything waiting on the view's file
+        :param view: sublime.View that finished loading
+        :return: None
+        """
+        path = view.file_name()
+        if path is None:
+            return
+
+        with self._lock:
+            actions = self._pending.pop(self._key(path), None)
+
+        for action in actions or []:
+            action(view)
+
+
+    def discard(self, view):
+        """
+        Drop what's waiting on a view that closed before it loaded
+        :return: None
+        """
+        path = view.file_name()
+        if path is None:
+            return
+
+        with self._lock:
+            self._pending.pop(self._key(path), None)
+
+
+    def pending(self):
+        """
+        :return: int of actions still waiting on a load
+        """
+        with self._lock:
+            return sum(len(a) for a in self._pending.values())
+
+
+#
+# The one the plugin queues into
+#
+dispatcher = LoadDispatcher()
@@ -0,0 +1,253 @@
+"""
+The plugin's one pool of background workers
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class Cancelled(Exception):
+    """
+    Raised inside a job once its CancelToken has been cancelled
+    """
+    pass
+
+
+class CancelToken(object):
+    """
+    Shared between a job and whoever submitted it. Long running scans call
+    check_cancelled() now and then, which raises Cancelled in the job's
+    thread once cancel() has been called.
+    """
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+
+    def cancel(self):
+        self.cancelled = True
+
+
+_local = threading.local()
+
+
+def check_cancelled():
+    """
+    Raise Cancelled if the job running on this thread has been cancelled.
+    Does nothing outside of a job (e.g. on the main thread).
+    """
+    token = getattr(_local, 'token', None)
+    if token is not None and token.cancelled:
+        raise Cancelled()
+
+
+def run_on_main(func, *args):
+    """
+    Call func(*args) on the main thread (or right here without sublime)
+    """
+    try:
+        import sublime
+    except ImportError:
+        func(*args)
+        return
+    sublime.set_timeout(lambda: func(*args), 0)
+
+
+class _Job(object):
+    __slots__ = ('priority', 'due', 'func', 'args', 'token', 'key', 'then')
+
+    def __init__(self, priority, due, func, args, token, key, then):
+        self.priority = priority
+        self.due = due
+        self.func = func
+        self.args = args
+        self.token = token
+        self.key = key
+        self.then = then
+
+
+class Executor(object):
+    """
+    A fixed number of worker threads taking jobs off a priority queue.
+
+    - Jobs with a key replace any job with the same key that's still
+      queued or running (that one is cancelled), so repeated work for the
+      same view never piles up.
+    - A job can wait for a delay before it's eligible, for debouncing.
+    - The queue is bounded, when it's full the least important job is
+      dropped (and cancelled).
+    - A job's result can be handed to a callback on the main thread.
+
+    ..code::python
+
+        token = executor.submit(
+            index_view, view, priority=Executor.LOW, key=('index', view.id())
+        )
+    """
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+    def __init__(self, workers=2, max_queue=64):
+        """
+        :param workers: int of threads to run jobs on
+        :param max_queue: int of jobs we hold before dropping some
+        """
+        self._workers = workers
+        self._max_queue = max_queue
+        self._condition = threading.Condition()
+        self._heap = []
+        self._counter = itertools.count()
+        self._keyed = {}
+        self._threads = []
+        # Bumped by shutdown(), workers of an older generation exit
+        self._generation = 0
+
+
+    def submit(self, func, *args, **kwargs):
+        """
+        :param func: callable(*args) to run on a worker
+        :param priority: HIGH, NORMAL or LOW (default NORMAL)
+        :param delay: float seconds to wait before running
+        :param key: hashable, replaces any other job with the same key
+        :param then: callable(result) run on the main thread afterwards
+        (not called if the job is cancelled or fails)
+        :return: CancelToken of the job
+        """
+        priority = kwargs.get('priority', self.NORMAL)
+        key = kwargs.get('key')
+        token = CancelToken()
+        job = _Job(
+            priority, time.time() + kwargs.get('delay', 0.0),
+            func, args, token, key, kwargs.get('then')
+        )
+
+        with self._condition:
+            if key is not None:
+                previous = self._keyed.get(key)
+                if previous is not None:
+                    previous.token.cancel()
+                self._keyed[key] = job
+
+            heapq.heappush(self._heap, (priority, job.due, next(self._counter), job))
+            self._trim()
+            self._start_workers()
+            self._condition.notify()
+        return token
+
+
+    def _trim(self):
+        """
+        Drop cancelled jobs and, past max_queue, the least important ones
+        """
+        self._heap = [entry for entry in self._heap if not entry[3].token.cancelled]
+        if len(self._heap) > self._max_queue:
+            self._heap.sort()
+            for entry in self._heap[self._max_queue:]:
+                entry[3].token.cancel()
+            del self._heap[self._max_queue:]
+        heapq.heapify(self._heap)
+
+
+    def _start_workers(self):
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(
+                target=self._work, args=(self._generation,),
+                name='CppToolkitWorker', daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+
+    def _next_job(self, generation):
+        """
+        :param generation: int of the shutdown() the worker started after
+        :return: The most important job that's due, or None once stopped
+        """
+        with self._condition:
+            while True:
+                if generation != self._generation:
+                    return None
+
+                now = time.time()
+                wait = None
+                for entry in sorted(self._heap):
+                    job = entry[3]
+                    if job.token.cancelled:
+                        continue
+                    if job.due <= now:
+                        self._heap.remove(entry)
+                        heapq.heapify(self._heap)
+                        return job
+                    wait = job.due - now if wait is None else min(wait, job.due - now)
+
+                self._condition.wait(wait)
+
+
+    def _work(self, generation):
+        while True:
+            job = self._next_job(generation)
+            if job is None:
+                return
+
+            _local.token = job.token
+            try:
+                result = job.func(*job.args)
+            except Cancelled:
+                continue
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                continue
+            finally:
+                _local.token = None
+                with self._condition:
+                    if job.key is not None and self._keyed.get(job.key) is job:
+                        del self._keyed[job.key]
+
+            if job.then is not None and not job.token.cancelled:
+                run_on_main(job.then, result)
+
+
+    def cancel(self, key):
+        """
+        Cancel the queued or running job submitted with key (if any)
+        :return: None
+        """
+        with self._condition:
+            job = self._keyed.pop(key, None)
+            if job is not None:
+                job.token.cancel()
+
+
+    def pending(self):
+        """
+        :return: int of queued jobs that haven't been cancelled
+        """
+        with self._condition:
+            return sum(1 for entry in self._heap if not entry[3].token.cancelled)
+
+
+    def shutdown(self):
+        """
+        Cancel everything and let the workers exit. The next submit()
+        starts new ones, so the executor outlives a plugin reload.
+        """
+        with self._condition:
+            self._generation += 1
+            for entry in self._heap:
+                entry[3].token.cancel()
+            for job in self._keyed.values():
+                job.token.cancel()
+            self._heap = []
+            self._keyed.clear()
+            self._threads = []
+            self._condition.notify_all()
+
+
+#
+# The one the plugin submits to
+#
+executor = Executor()
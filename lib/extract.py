@@ -0,0 +1,709 @@
+"""
+Every declaration in a class body from a single pass over its tokens
+"""
+import re
+
+from .tokenize import CppTokenizer, WHITE_SPACE
+from .state import FunctionState
+from .analysis import MEMBER_NO_DEFAULT
+from .executor import check_cancelled
+
+#
+# Statements in a class body that don't declare a method or member (the
+# nested ones are passed over whole, braces and all)
+#
+SKIP_STATEMENTS = (
+    'using', 'typedef', 'friend', 'static_assert', 'enum', 'class', 'struct',
+    'union', 'namespace', 'extern'
+)
+
+#
+# Skipped statements that end with their closing brace rather than a ';'
+#
+BRACE_STATEMENTS = ('namespace', 'extern')
+
+#
+# What can come between a method's closing parenthesis and its body
+#
+BEFORE_BODY = ('const', 'override', 'final', 'noexcept', 'volatile', 'mutable')
+
+#
+# Words that only ever make up a type, never an argument's name
+#
+TYPE_WORDS = (
+    'const', 'volatile', 'signed', 'unsigned', 'short', 'long', 'int', 'char',
+    'bool', 'float', 'double', 'void', 'auto', 'wchar_t', 'char16_t',
+    'char32_t'
+)
+
+_ARG_TOKEN = re.compile(r'[A-Za-z_]\w*|::|\.\.\.|\S')
+
+
+class Declaration(object):
+    """
+    One method or data member of a class body.
+
+    - kind: 'method', 'function' (outside of a class) or 'member'
+    - name: The method or member name
+    - owner: Any qualification in front of the name (A::B for a definition
+      of A::B::method() outside its class), otherwise ''
+    - access: public, protected or private (None outside of a class)
+    - region: tuple(begin, end) of the whole statement (body included)
+    - function: dict like FunctionState.to_dict() (None for members)
+    - impl_region: list[begin, end] of an inline body like
+      FunctionState.impl_region (None without one)
+    - type: The type of a member (the return type of a method)
+    - default: What follows a top level '=' (a member's default value or
+      a method's 0, default or delete), None without one
+    - template: The template<...> clause in front of it (or None)
+    - signal: True for a method under a Qt signals: label (moc writes its
+      body)
+    """
+    __slots__ = (
+        'kind', 'name', 'owner', 'access', 'region', 'function',
+        'impl_region', 'type', 'default', 'template', 'signal'
+    )
+
+    def __init__(self, kind, name, access, region, function=None,
+                 impl_region=None, type_=None, default=None, template=None,
+                 owner='', signal=False):
+        self.kind = kind
+        self.name = name
+        self.owner = owner
+        self.access = access
+        self.region = region
+        self.function = function
+        self.impl_region = impl_region
+        self.type = type_
+        self.default = default
+        self.template = template
+        self.signal = signal
+
+
+    @property
+    def has_impl(self):
+        return self.impl_region is not None
+
+
+    def __repr__(self):
+        return 'Declaration({}, {}, {})'.format(self.kind, self.name, self.access)
+
+
+class _Statement(object):
+    """
+    What we've gathered of the statement we're in the middle of
+    """
+    def __init__(self, start, access, signal=False):
+        self.start = start
+        self.access = access
+        self.signal = signal    # Under a signals: label
+        self.state = FunctionState()
+        self.feeding = True     # FunctionState still wants tokens
+        self.text = []          # The signature, whitespace collapsed
+        self.template = None
+        self.in_template = False
+        self.skip = None        # First token of a nested type, using, ...
+        self.parens = 0
+        self.braces = 0         # Brace initializers ({} of a member)
+        self.angles = 0         # Only counted for the template clause
+        self.called = False     # Seen a top level (...)
+        self.init_list = False  # In a constructor's initializer list
+        self.arrow = False      # Past the -> of a trailing return type
+        self.specifiers = False # Past noexcept or a & or && qualifier
+        self.args_end = None    # Where in text the arguments' ')' is
+        self.operator = None    # The name of an operator we're reading
+        self.body = False       # In a method's inline body
+        self.default = None     # Tokens after a top level '=' (or '{')
+        self.cut = None         # Where in text the default starts
+        self.last = None        # Last token that wasn't whitespace
+        self.last_mark = None
+        self.sig_end = None
+
+
+    def feed(self, token):
+        """
+        Hand a token to FunctionState (whitespace already collapsed for
+        the signature, as from_text() would see it)
+        """
+        if self.feeding:
+            self.feeding = self.state._resolve(token)
+
+
+def extract_class(node, snapshot, mask=None):
+    """
+    Walk the body of one class or struct in a single token stream and
+    yield each method declaration, inline implementation and data member
+    in it. Nested types, using/typedef/friend statements and the like are
+    passed over.
+
+    The tokens of each statement go straight through a FunctionState as
+    they're read, so this costs one pass over the class however many
+    declarations it has (rather than a tokenizer per method).
+
+    ..code::python
+
+        tree = ScopeTree.for_view(view, snapshot)
+        node = tree.chain_at(point)[-1]
+        for declaration in extract_class(node, snapshot, CommentMask.for_view(view, snapshot)):
+            if declaration.kind == 'method' and not declaration.has_impl:
+                ...
+
+    :param node: ScopeNode of a class or struct
+    :param snapshot: BufferSnapshot holding the class
+    :param mask: CommentMask of the snapshot (comments are read as code
+    without it)
+    :return: generator of Declaration in document order
+    """
+    labels = dict((section.head, section) for section in node.sections)
+    access = 'private' if node.kind == 'class' else 'public'
+    end = node.close if node.close is not None else snapshot.end
+    return _extract(node.open + 1, end, snapshot, mask, labels, access)
+
+
+def extract_definitions(tree, snapshot, mask=None):
+    """
+    Every function and method at namespace scope (a source file's
+    definitions, or declarations of free functions). Each namespace is
+    read around the classes and namespaces in it, so every part of the
+    buffer is read once. Classes and variables are passed over, see
+    extract_class() for the former.
+
+    :param tree: ScopeTree of the snapshot
+    :param snapshot: BufferSnapshot of the whole buffer
+    :param mask: CommentMask of the snapshot
+    :return: generator of Declaration (owner holds the namespaces they sit
+    in along with their own qualification)
+    """
+    for node in tree.root.walk():
+        if node.kind not in (None, 'namespace'):
+            continue
+
+        names = []
+        parent = node
+        while parent is not None and parent.kind is not None:
+            names.append(parent.name or '')
+            parent = parent.parent
+        namespace = '::'.join(reversed(names))
+
+        for begin, end in _gaps(node, snapshot):
+            for found in _extract(begin, end, snapshot, mask, {}, None):
+                if found.kind != 'method':
+                    continue # A variable
+
+                if not found.owner:
+                    found.kind = 'function'
+                found.owner = '::'.join(o for o in (namespace, found.owner) if o)
+                yield found
+
+
+def scoped_types(node, snapshot, mask=None):
+    """
+    The names of the types declared right in a class or namespace (not in
+    the ones nested in it): classes, structs, enums and using/typedef
+    aliases
+
+    :param node: ScopeNode of the class or namespace
+    :param snapshot: BufferSnapshot holding it
+    :param mask: CommentMask of the snapshot
+    :return: set of str
+    """
+    names = set(
+        child.name for child in node.children
+        if child.kind != 'namespace' and child.name
+    )
+    for begin, end in _gaps(node, snapshot):
+        izer = CppTokenizer(None, start=begin, end=end, snapshot=snapshot, mask=mask)
+        words = []
+        for token in izer:
+            if token not in (';', '{', '}'):
+                words.append(token)
+                continue
+
+            name = _type_name(words)
+            if name is not None:
+                names.add(name)
+            words = []
+    return names
+
+
+def _type_name(words):
+    """
+    :param words: list of the tokens of a statement (up to its ';' or '{')
+    :return: str of the type it declares (enum, using or typedef) or None
+    """
+    for index, word in enumerate(words):
+        if word in ('enum', 'using', 'typedef'):
+            words = words[index:]
+            break
+        if word != ':' and not word.isidentifier():
+            return None # Labels and macros (Q_OBJECT) can come first
+    else:
+        return None
+
+    if words[0] == 'enum':
+        names = [w for w in words[1:] if w not in ('class', 'struct')]
+        return names[0] if names and names[0].isidentifier() else None
+
+    if words[0] == 'using' and len(words) > 2 and words[2] == '=':
+        return words[1] if words[1].isidentifier() else None
+
+    if words[0] == 'typedef':
+        if '(' in words:
+            # A function pointer, typedef void (*Name)(int)
+            found = [w for w in words[words.index('('):] if w.isidentifier()]
+            return found[0] if found else None
+        found = [w for w in words[1:] if w.isidentifier()]
+        return found[-1] if found else None
+    return None
+
+
+def argument_types(args):
+    """
+    The types of a method's arguments without their names or default
+    values, spaced the same however they were written. Enough to tell
+    overloads apart and match a declaration with its definition.
+
+    ..code::python
+
+        argument_types('const A &a, int b = 5') == ('const A&', 'int')
+
+    :param args: str of the arguments (FunctionState.to_dict()['args'])
+    :return: tuple of str
+    """
+    types = []
+    tokens = []
+    depth = 0
+    for token in _ARG_TOKEN.findall(args or '') + [',']:
+        if token in ('<', '(', '[', '{'):
+            depth += 1
+        elif token in ('>', ')', ']', '}'):
+            depth -= 1
+        elif token == ',' and depth == 0:
+            types.append(_argument_type(tokens))
+            tokens = []
+            continue
+        tokens.append(token)
+
+    if types == [''] or types == ['void']:
+        return ()
+    return tuple(types)
+
+
+def _argument_type(tokens):
+    """
+    :param tokens: list of the tokens of one argument
+    :return: str of its type alone
+    """
+    if '=' in tokens:
+        tokens = tokens[:tokens.index('=')]
+
+    suffix = []
+    while tokens and tokens[-1] == ']' and '[' in tokens:
+        # An array, the size stays with the type
+        at = len(tokens) - 1 - tokens[::-1].index('[')
+        suffix = tokens[at:] + suffix
+        tokens = tokens[:at]
+
+    if len(tokens) > 1 and tokens[-1].isidentifier() \
+            and tokens[-1] not in TYPE_WORDS and tokens[-2] != '::' \
+            and any(t not in ('const', 'volatile') for t in tokens[:-1]):
+        tokens = tokens[:-1] # The name
+
+    text = ''
+    for token in tokens + suffix:
+        if text and token[0].isidentifier() and text[-1].isidentifier():
+            text += ' '
+        text += token
+    return text
+
+
+def _gaps(node, snapshot):
+    """
+    :return: list of tuple(begin, end) of node's body around its children
+    """
+    begin = node.open + 1
+    gaps = []
+    for child in node.children:
+        gaps.append((begin, child.head))
+        begin = child.end if child.end is not None else child.open
+    gaps.append((begin, node.close if node.close is not None else snapshot.end))
+    return gaps
+
+
+def _extract(begin, end, snapshot, mask, labels, access):
+    """
+    The single pass behind extract_class() and extract_definitions()
+    :param begin: First point of the code to read
+    :param end: Point to stop at
+    :param labels: dict of the access labels in the body by their head
+    :param access: The access before the first label (None outside of a
+    class)
+    """
+    izer = CppTokenizer(None, start=begin, end=end, snapshot=snapshot, mask=mask)
+    statement = None
+    skip_to = None
+    signal = False
+
+    with izer.include_white_space():
+        izer.temp_no_trim()
+
+        while True:
+            token = izer._next()
+            if token is None:
+                break
+
+            if skip_to is not None:
+                # Passing over an access label
+                if izer.current_point() >= skip_to:
+                    skip_to = None
+                continue
+
+            space = token in WHITE_SPACE
+            if statement is None:
+                if space:
+                    continue
+
+                start = izer.span(izer.mark())[0]
+                if start in labels:
+                    access = labels[start].access
+                    signal = labels[start].signals
+                    skip_to = labels[start].point
+                    if izer.current_point() >= skip_to:
+                        skip_to = None
+                    continue
+
+                if token.startswith('#'):
+                    izer.skip_line()
+                    continue
+
+                check_cancelled()
+                statement = _Statement(start, access, signal)
+
+            if statement.body:
+                # Inline implementation, FunctionState keeps it verbatim
+                statement.feed(token)
+                if token == '{':
+                    statement.braces += 1
+                elif token == '}':
+                    statement.braces -= 1
+                    if statement.braces == 0:
+                        found = _finish(statement, izer.current_point())
+                        if found is not None:
+                            yield found
+                        statement = None
+                continue
+
+            if space:
+                if statement.operator is not None:
+                    continue # _operator() spaces the name itself
+
+                if token == '\n' and _is_macro(statement):
+                    # Q_OBJECT and friends, no ';' to wait for
+                    statement = None
+                    continue
+
+                if statement.in_template:
+                    if statement.template[-1] != ' ':
+                        statement.template.append(' ')
+                elif statement.text and statement.text[-1] != ' ':
+                    statement.text.append(' ')
+                    if not _held(statement):
+                        statement.feed(' ')
+                continue
+
+            if _template(statement, token):
+                continue
+
+            if not statement.text and token in SKIP_STATEMENTS:
+                statement.skip = token
+
+            if _step(statement, token, izer):
+                if not statement.skip and statement.text:
+                    found = _finish(statement, izer.current_point())
+                    if found is not None:
+                        yield found
+                statement = None
+
+
+def _is_macro(statement):
+    """
+    :return: True if all the statement has is an upper case word alone on
+    its line (a macro like Q_OBJECT)
+    """
+    if statement.skip or len(statement.text) > 2:
+        return False # Whitespace is collapsed, a lone word is [word, ' '] at most
+
+    words = [t for t in statement.text if t != ' ']
+    return (
+        len(words) == 1 and statement.template is None
+        and words[0].isupper() and words[0].replace('_', 'A').isalnum()
+    )
+
+
+def _template(statement, token):
+    """
+    Gather a leading template<...> clause
+    :return: True if token was part of it
+    """
+    if statement.text:
+        return False
+
+    if token == 'template' and statement.template is None:
+        statement.template = [token]
+        statement.in_template = True
+        return True
+
+    if not statement.in_template:
+        return False
+
+    statement.template.append(token)
+    if token == '<':
+        statement.angles += 1
+    elif token == '>':
+        statement.angles -= 1
+        if statement.angles == 0:
+            statement.in_template = False
+            statement.template = ''.join(statement.template)
+    return True
+
+
+def _step(statement, token, izer):
+    """
+    Take one (non whitespace) token of a statement outside of any inline
+    body
+    :return: True if it ended the statement
+    """
+    if statement.skip:
+        statement.text.append(token)
+        if token == '{':
+            statement.braces += 1
+        elif token == '}':
+            statement.braces -= 1
+            if statement.braces == 0 and statement.skip in BRACE_STATEMENTS:
+                return True
+        elif token == ';' and statement.braces == 0:
+            return True
+        return False
+
+    if statement.operator is not None:
+        if not _operator(statement, token):
+            return False
+
+        # The whole name goes to FunctionState as one token, then the '('
+        name = statement.operator
+        statement.operator = None
+        statement.text.append(name)
+        statement.feed(name)
+        statement.last = name
+
+    elif statement.parens == 0 and statement.default is None and _is_operator(token):
+        statement.operator = token
+        return False
+
+    if token == '{' and statement.parens == 0 and statement.braces == 0 \
+            and statement.called and _opens_body(statement):
+        statement.body = True
+        statement.init_list = False
+        statement.braces = 1
+        statement.sig_end = izer.span(statement.last_mark)[1]
+        statement.feed(token)
+        return False
+
+    if token == '(':
+        statement.parens += 1
+    elif token == ')':
+        statement.parens -= 1
+        if statement.parens == 0 and statement.braces == 0 and statement.default is None:
+            statement.called = True
+            if not (statement.specifiers or statement.arrow):
+                statement.args_end = len(statement.text)
+    elif token == '{':
+        statement.braces += 1
+    elif token == '}':
+        statement.braces -= 1
+    elif token == '-' and statement.parens == 0 and statement.called:
+        # A trailing return type, FunctionState reads the method as auto
+        statement.arrow = True
+    elif token in ('noexcept', '&', '&&') and statement.parens == 0 \
+            and statement.called and statement.default is None:
+        # FunctionState would take noexcept(...) for the name and arguments
+        statement.specifiers = True
+    elif token == ':' and statement.last == ')' and statement.parens == 0:
+        # A constructor's initializer list, FunctionState would take it
+        # for the name and arguments
+        statement.init_list = True
+
+    if token == ';' and statement.parens == 0 and statement.braces == 0:
+        statement.feed(token)
+        return True
+
+    if statement.default is None and statement.parens == 0 \
+            and statement.braces == (1 if token == '{' else 0) \
+            and (token == '=' or (token == '{' and not statement.called)):
+        # A default value (= 5 or {5}), or a method's = 0|default|delete
+        statement.cut = len(statement.text)
+        statement.default = [] if token == '=' else [token]
+    elif statement.default is not None:
+        statement.default.append(token)
+
+    statement.text.append(token)
+    if not _held(statement):
+        statement.feed(token)
+    statement.last = token
+    statement.last_mark = izer.mark()
+    return False
+
+
+def _held(statement):
+    """
+    :return: True while the tokens are kept away from FunctionState (it
+    reads them as the name and arguments)
+    """
+    return statement.init_list or statement.arrow or statement.specifiers
+
+
+def _is_operator(token):
+    """
+    :return: True if token starts the name of an operator (operator,
+    &operator, operator- ...) rather than being a word like operators
+    """
+    rest = token.lstrip('*&')
+    if not rest.startswith('operator'):
+        return False
+    rest = rest[len('operator'):]
+    return not rest or not (rest[0].isalnum() or rest[0] == '_')
+
+
+def _operator(statement, token):
+    """
+    Add token to the name of the operator we're reading (operator==,
+    operator(), operator new[], operator const char* ...)
+    :return: True if token is the '(' of the arguments instead
+    """
+    name = statement.operator
+    symbol = name.split('operator', 1)[1]
+    if token == '(' and symbol and symbol != '(':
+        return True
+
+    last = name[-1]
+    if (token[0].isalnum() or token[0] == '_') and (last.isalnum() or last == '_'):
+        name += ' '
+    statement.operator = name + token
+    return False
+
+
+def _opens_body(statement):
+    """
+    :return: True if a '{' after the statement so far starts a method body
+    rather than initializing something (a member, or a base in a
+    constructor's initializer list)
+    """
+    last = statement.last
+    if last is None:
+        return False
+    if statement.arrow or last in BEFORE_BODY:
+        return True
+    return not last.replace('_', 'a').isalnum()
+
+
+def _after_arguments(statement):
+    """
+    What follows a method's arguments that FunctionState doesn't keep
+    :return: dict of 'ref_qualifier' (& or &&), 'noexcept' (along with
+    any condition) and 'trailing_return' (the type after the ->), each
+    None without one
+    """
+    found = { 'ref_qualifier' : None, 'noexcept' : None, 'trailing_return' : None }
+    if statement.args_end is None:
+        return found
+
+    end = statement.cut if statement.cut is not None else len(statement.text)
+    words = [t for t in statement.text[statement.args_end + 1:end] if t != ' ']
+    index = 0
+    while index < len(words):
+        token = words[index]
+        if token in ('&', '&&'):
+            found['ref_qualifier'] = token
+
+        elif token == 'noexcept':
+            stop = index + 1
+            if stop < len(words) and words[stop] == '(':
+                depth = 0
+                for stop in range(stop, len(words)):
+                    depth += { '(' : 1, ')' : -1 }.get(words[stop], 0)
+                    if depth == 0:
+                        break
+                stop += 1
+            found['noexcept'] = ''.join(words[index:stop])
+            index = stop
+            continue
+
+        elif token == '-' and words[index + 1:index + 2] == ['>']:
+            # The type keeps its own spacing
+            at = statement.text.index('>', statement.args_end + 1) + 1
+            trailing = ''.join(statement.text[at:end]).split()
+            while trailing and trailing[-1] in ('override', 'final'):
+                trailing.pop()
+            found['trailing_return'] = ' '.join(trailing) or None
+            break
+
+        index += 1
+    return found
+
+
+def _finish(statement, stop):
+    """
+    :return: Declaration for a complete statement or None if it doesn't
+    declare a method or member we understand
+    """
+    text = ''.join(statement.text).strip()
+    default = None
+    if statement.default is not None:
+        default = ''.join(statement.default).strip()
+
+    state = statement.state
+    if statement.called and state.valid:
+        found = state.to_dict()
+        found.update(_after_arguments(statement))
+        name = found['method'].lstrip('*&')
+        owner = ''
+        if '::' in name and not name.startswith('operator'):
+            owner, name = name.rsplit('::', 1)
+        elif found['type'].endswith('::'):
+            # The qualification ends up on the type (float A::B::get())
+            owner = found['type'].split()[-1][:-2].lstrip('*&')
+
+        if name and (name.startswith('operator') or
+                     name.replace('~', '').replace('_', 'a').isalnum()):
+            impl_region = None
+            if statement.body:
+                impl_region = [statement.sig_end, stop]
+            return Declaration(
+                'method', name, statement.access, (statement.start, stop),
+                function=found, impl_region=impl_region, type_=found['type'],
+                default=default, template=statement.template, owner=owner,
+                signal=statement.signal
+            )
+        return None
+
+    if statement.called:
+        return None
+
+    if statement.cut is not None:
+        text = ''.join(statement.text[:statement.cut]).strip()
+    match = MEMBER_NO_DEFAULT.match(' ' + text + ';')
+    if match is None:
+        return None
+
+    name = match.group('member')
+    kind = match.group('type').strip()
+    while name[:1] in ('*', '&'):
+        kind += name[0]
+        name = name[1:]
+    if not name.isidentifier():
+        return None
+
+    return Declaration(
+        'member', name, statement.access, (statement.start, stop),
+        type_=kind, default=default, template=statement.template
+    )
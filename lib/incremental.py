@@ -0,0 +1,538 @@
+"""
+Incremental lexing of a buffer as it's edited
+"""
+import re
+import sys
+import threading
+
+from bisect import bisect_right
+
+from .tokenize import CppTokenizer, _LEXER
+from .snapshot import BufferSnapshot
+from .mask import CommentMask
+from .lines import LineTable
+from .scope import ScopeTree
+from .cache import ViewCache
+from .scope import PROC_TOKENS, ACCESS_TOKENS, SIGNAL_TOKENS
+from .executor import check_cancelled, executor, Executor
+from .parsecache import parse_cache
+
+#
+# Tokens that decide the shape of the ScopeTree. When an edit leaves these
+# exactly where they were (and doesn't touch a class head or terminator)
+# the tree only needs its offsets shifted.
+#
+STRUCTURAL = frozenset(
+    ('{', '}', ';', ':') + PROC_TOKENS + ACCESS_TOKENS + SIGNAL_TOKENS
+)
+
+_NEWLINE = re.compile('\n')
+
+
+def _line_starts(text, offset=0):
+    """
+    :return: list[int] of the points every line after the first begins at
+    """
+    return [offset + m.end() for m in _NEWLINE.finditer(text)]
+
+
+def _structure(text, starts, lines, spans, end, previous, move=None):
+    """
+    :param starts: list[int] of the point each row starts at
+    :param lines: list[tuple(str)] of the tokens of each row
+    :param spans: list of each row's token spans (None when not masked)
+    :param end: The point the last row ends at
+    :param previous: str of the token before the rows (or None)
+    :param move: callable mapping a point to where it lands after an edit
+    :return: list of the STRUCTURAL tokens of the rows with their points. A
+    proc keyword also notes if it followed a 'using', as does the list
+    itself for whatever proc comes after the rows.
+    """
+    output = []
+    for row, tokens in enumerate(lines):
+        offsets = spans[row]
+        if offsets is None and not STRUCTURAL.isdisjoint(tokens):
+            # Same as CppTokenizer.span() works it out
+            stop = starts[row + 1] - 1 if row + 1 < len(starts) else end
+            line = text[starts[row]:stop]
+            lead = len(line) - len(line.lstrip())
+            offsets = [
+                (lead + m.start(), lead + m.end())
+                for m in _LEXER.finditer(line.strip())
+            ]
+
+        for index, token in enumerate(tokens):
+            if token in STRUCTURAL:
+                point = starts[row] + offsets[index][0]
+                if move is not None:
+                    point = move(point)
+                output.append((
+                    token, point,
+                    token in PROC_TOKENS and previous == 'using'
+                ))
+            previous = token
+
+    output.append(previous == 'using')
+    return output
+
+
+def _common_prefix(a, b):
+    """
+    :return: int length of the prefix a and b share
+    """
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a, b, limit):
+    """
+    :return: int length of the suffix a and b share (at most limit)
+    """
+    lo, hi = 0, limit
+    la, lb = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la - mid:la - lo] == b[lb - mid:lb - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class _IndexTokenizer(CppTokenizer):
+    """
+    CppTokenizer that reads the already lexed lines of an IncrementalIndex
+    rather than lexing them again
+    """
+    def __init__(self, index):
+        CppTokenizer.__init__(
+            self, None, snapshot=BufferSnapshot(index.text), mask=index.mask
+        )
+        self._index = index
+        self._row = 0
+
+
+    def _read_line(self):
+        if self._row >= len(self._index._lines):
+            return None
+
+        self._line_begin = self._index._starts[self._row]
+        line = self._index.line_text(self._row)
+        self._row += 1
+        return line
+
+
+    def _get_tokens(self, line):
+        if self._trim and self._skip_whitespace:
+            self._line_spans = self._index._spans[self._row - 1]
+            return list(self._index._lines[self._row - 1])
+        return CppTokenizer._get_tokens(self, line)
+
+
+class IncrementalIndex(object):
+    """
+    The lexed lines, CommentMask and ScopeTree of a buffer, kept current by
+    re-lexing only the lines an edit touched.
+
+    update() finds the changed span by comparing the new text against the
+    last text we saw, re-lexes those lines (and any whose comments or
+    literals moved) and splices them in. The ScopeTree then either has its
+    offsets shifted (when nothing structural changed) or is rebuilt from the
+    cached tokens without lexing anything.
+    """
+    _cache = ViewCache(size=lambda index: index.nbytes())
+
+    # Rough cost of each lexed row and each token in it (as measured with
+    # tracemalloc on bench/corpus.py headers)
+    ROW_BYTES = 64
+    TOKEN_BYTES = 48
+
+    def __init__(self, text, cached=None):
+        """
+        :param text: str of the whole buffer
+        :param cached: dict from ParseCache.load_lex() for text when we
+        have one, otherwise text is lexed
+        """
+        self._lock = threading.Lock()
+        self._text = text
+        self._table = LineTable(text)
+        self._starts = self._table.starts
+        if cached is not None:
+            self._mask = cached['mask']
+            self._lines = cached['lines']
+            self._spans = cached['spans']
+            self._tree = cached['tree']
+        else:
+            self._mask = CommentMask.build(text)
+            self._lines, self._spans = self._lex_rows(
+                text, self._starts, len(text), self._mask
+            )
+            self._tree = None
+
+        self._tokens = sum(len(row) for row in self._lines)
+
+        # -- Counters for the curious
+        self.relexed = 0 if cached is not None else len(self._lines)
+        self.shifted = 0
+        self.rebuilt = 0
+
+
+    @classmethod
+    def for_view(cls, view, snapshot=None):
+        """
+        :param view: sublime.View to index
+        :param snapshot: BufferSnapshot of the whole view when the caller
+        already has one
+        :return: IncrementalIndex current with the view
+        """
+        def _text():
+            if snapshot is not None:
+                return snapshot.text
+            return BufferSnapshot.from_view(view).text
+
+        def _build():
+            text = _text()
+            path = view.file_name()
+            if path is None or not parse_cache.enabled:
+                return cls(text)
+
+            cached = parse_cache.load_lex(path, text)
+            index = cls(text, cached)
+            if cached is None:
+                cls._persist(view, index)
+            return index
+
+        return cls._cache.get(
+            view, _build, lambda index: index.update(_text()),
+            version=snapshot.change_count if snapshot is not None else None
+        )
+
+
+    @classmethod
+    def _persist(cls, view, index):
+        executor.submit(
+            index.persist, view.file_name(),
+            priority=Executor.LOW, key=('persist', view.id())
+        )
+
+
+    @classmethod
+    def saved(cls, view):
+        """
+        Save what we have for a view to the ParseCache once it's been
+        saved, so reopening it doesn't lex it again
+        """
+        index = cls._cache.peek(view)
+        if index is not None and view.file_name() and parse_cache.enabled:
+            cls._persist(view, index)
+
+
+    def persist(self, path):
+        """
+        Write the index (and its tree) to the ParseCache. Meant for a
+        background thread.
+        :param path: str of the file the buffer belongs to
+        :return: None
+        """
+        with self._lock:
+            text = self._text
+            lines = list(self._lines)
+            spans = list(self._spans)
+            mask = self._mask
+            tree = self._tree
+
+        # Only the text is checked when loading (the buffer may not be saved)
+        parse_cache.store_lex(path, None, text, lines, spans, mask, tree)
+
+
+    def nbytes(self):
+        """
+        :return: int estimate of the memory the index holds on to
+        """
+        return (
+            sys.getsizeof(self._text) + sys.getsizeof(self._starts)
+            + self._mask.nbytes()
+            + self.ROW_BYTES * len(self._lines)
+            + self.TOKEN_BYTES * self._tokens
+        )
+
+
+    @classmethod
+    def refresh(cls, view):
+        """
+        Bring a view's index up to date if we've indexed it before. Meant for
+        buffer modification events.
+        """
+        if cls._cache.holds(view):
+            cls.for_view(view)
+
+
+    @property
+    def text(self):
+        """
+        :return: str of the buffer as of the last update
+        """
+        return self._text
+
+
+    @property
+    def mask(self):
+        """
+        :return: CommentMask of the buffer as of the last update
+        """
+        return self._mask
+
+
+    @property
+    def tree(self):
+        """
+        :return: ScopeTree of the buffer as of the last update
+        """
+        with self._lock:
+            if self._tree is None:
+                self._tree = ScopeTree.build(
+                    BufferSnapshot(self._text), izer=_IndexTokenizer(self)
+                )
+            return self._tree
+
+
+    @property
+    def lines(self):
+        """
+        :return: LineTable of the buffer as of the last update
+        """
+        return self._table
+
+
+    def line_text(self, row):
+        """
+        :return: str of a line without its newline
+        """
+        return self._table.line_text(row)
+
+
+    def tokens(self, row):
+        """
+        :return: tuple(str) of the lexed line (whitespace skipped)
+        """
+        return self._lines[row]
+
+
+    def _row_of(self, starts, point):
+        return bisect_right(starts, point) - 1
+
+
+    def _lex_rows(self, text, starts, end, mask):
+        """
+        Lex a run of rows of text around the mask
+        :param starts: list[int] of the point each row starts at
+        :param end: The point the last row ends at (not counting its newline)
+        :param mask: CommentMask of text
+        :return: tuple(list[tuple(str)], list[list[tuple]]) of the tokens of
+        each row along with the spans of rows the mask touched (None for
+        the rest)
+        """
+        #
+        # Bucket the mask by row once rather than asking it about every line
+        #
+        masked = {}
+        for entry in mask.ranges(starts[0], end):
+            row = max(self._row_of(starts, entry[0]), 0)
+            last = self._row_of(starts, max(entry[1] - 1, entry[0]))
+            for r in range(row, last + 1):
+                masked.setdefault(r, []).append(entry)
+
+        lines = []
+        spans = []
+        for row in range(len(starts)):
+            if not row & 0x3ff:
+                # Background jobs stop here once they're cancelled
+                check_cancelled()
+
+            line_begin = starts[row]
+            if row + 1 < len(starts):
+                line = text[line_begin:starts[row + 1] - 1]
+            else:
+                line = text[line_begin:end]
+
+            ranges = masked.get(row)
+            if ranges is None:
+                lines.append(tuple(CppTokenizer.lex(line)))
+                spans.append(None)
+            else:
+                tokens, offsets = CppTokenizer.lex_masked(line, line_begin, ranges)
+                lines.append(tuple(tokens))
+                spans.append(offsets)
+        return lines, spans
+
+
+    def update(self, text):
+        """
+        Bring the index in line with text
+        :param text: str of the whole buffer
+        :return: self
+        """
+        with self._lock:
+            self._update(text)
+        return self
+
+
+    def _update(self, text):
+        old = self._text
+        if text == old:
+            return
+
+        prefix = _common_prefix(old, text)
+        suffix = _common_suffix(
+            old, text, min(len(old), len(text)) - prefix
+        )
+        delta = len(text) - len(old)
+
+        #
+        # Comments and literals can change well past the edit itself (think
+        # of opening a block comment) so the lines they cover are dirty too
+        #
+        edit_begin = prefix
+        edit_end = len(old) - suffix
+        mask, changed = self._mask.update(text, edit_begin, edit_end, delta)
+
+        dirty_end = edit_end
+        if changed is not None:
+            lo, hi = changed
+            prefix = min(prefix, lo)
+            if hi > len(text) - suffix:
+                dirty_end = max(dirty_end, hi - delta)
+
+        #
+        # The rows in the old text the change touched, and the rows that
+        # replace them in the new text
+        #
+        first = self._row_of(self._starts, prefix)
+        last_old = self._row_of(self._starts, dirty_end)
+
+        dirty_begin = self._starts[first]
+        if last_old + 1 < len(self._starts):
+            old_stop = self._starts[last_old + 1]
+            # The line after the dirty ones starts right after a newline
+            old_end = old_stop - 1
+            body_end = old_end + delta
+        else:
+            old_stop = old_end = len(old)
+            body_end = len(text)
+
+        new_body = text[dirty_begin:body_end]
+        new_starts = [dirty_begin] + _line_starts(new_body, dirty_begin)
+        new_lines, new_spans = self._lex_rows(text, new_starts, body_end, mask)
+
+        shift = False
+        if self._tree is not None:
+            previous = None
+            for row in range(first - 1, -1, -1):
+                if self._lines[row]:
+                    previous = self._lines[row][-1]
+                    break
+
+            def _move(point):
+                if point < edit_begin:
+                    return point
+                if point >= edit_end:
+                    return point + delta
+                return None # Part of what changed
+
+            before = _structure(
+                old, self._starts[first:last_old + 1],
+                self._lines[first:last_old + 1],
+                self._spans[first:last_old + 1],
+                old_end, previous, _move
+            )
+            after = _structure(
+                text, new_starts, new_lines, new_spans, body_end, previous
+            )
+            shift = before == after and self._can_shift(dirty_begin, old_stop)
+
+        #
+        # Nothing has changed up to here so a cancelled update leaves us
+        # as we were
+        #
+        self._mask = mask
+        self._tokens += sum(len(row) for row in new_lines) \
+            - sum(len(row) for row in self._lines[first:last_old + 1])
+        self._lines[first:last_old + 1] = new_lines
+        self._spans[first:last_old + 1] = new_spans
+        #
+        # A fresh array rather than splicing in place, whoever holds the
+        # last LineTable keeps a consistent view of the old text
+        #
+        starts = self._starts[:first]
+        starts.extend(new_starts)
+        starts.extend(s + delta for s in self._starts[last_old + 1:])
+        self._starts = starts
+        self._text = text
+        self._table = LineTable(text, starts)
+        self.relexed += len(new_lines)
+
+        if self._tree is not None:
+            if shift:
+                #
+                # A new tree rather than moving the old one's offsets, the
+                # UI thread or a worker may be in the middle of reading it
+                #
+                self._tree = self._tree.shifted(
+                    edit_end, delta, BufferSnapshot(text)
+                )
+                self.shifted += 1
+            else:
+                self._tree = None
+                self.rebuilt += 1
+
+
+    def _can_shift(self, begin, stop):
+        """
+        :param begin: The point the dirty rows start at
+        :param stop: The point the dirty rows end at (before the edit)
+        :return: True if no node's name, terminator or access labels could
+        have changed
+        """
+        #
+        # Names and terminators are read from the tokens around the braces
+        # so edits there can change the tree even without structural tokens
+        #
+        for node in self._tree.root.walk():
+            if node.kind is None:
+                continue
+
+            if node.head < stop and node.open >= begin:
+                return False
+
+            if node.close is not None:
+                end = node.end if node.end is not None else node.close
+                if node.close < stop and end >= begin:
+                    return False
+
+            for section in node.sections:
+                if section.head < stop and section.point >= begin:
+                    return False
+        return True
+
+
+    def verify(self):
+        """
+        Compare ourselves against an index built from scratch
+        :return: True if the incremental result matches a full rebuild
+        """
+        fresh = IncrementalIndex(self._text)
+        if fresh._starts != self._starts or fresh._lines != self._lines:
+            return False
+        if fresh._spans != self._spans:
+            return False
+
+        everything = len(self._text) + 1
+        if fresh.mask.ranges(0, everything) != self._mask.ranges(0, everything):
+            return False
+        return fresh.tree.signature() == self.tree.signature()
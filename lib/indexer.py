@@ -0,0 +1,642 @@
+"""
+Project wide index of the classes, methods and members in C++ files
+"""
+import os
+import sys
+import time
+import threading
+
+from contextlib import contextmanager
+
+from .tokenize import CppTokenizer
+from .snapshot import BufferSnapshot
+from .mask import CommentMask
+from .scope import ScopeTree
+from .extract import extract_class, extract_definitions
+from .buffer import FileBuffer
+from .executor import check_cancelled
+from .parsecache import text_hash, parse_cache
+
+
+class Symbol(object):
+    """
+    One thing declared (or defined) in a file.
+
+    - kind: namespace, class, struct, method, function or member
+    - name: Its own name ('getX')
+    - owner: Qualified name of what it belongs to ('ns::MyClass', '' at
+      the top level)
+    - access: public, protected or private within a class (None elsewhere)
+    - path: The file it's in
+    - point: Where it starts in the file
+    """
+    __slots__ = ('kind', 'name', 'owner', 'access', 'path', 'point')
+
+    def __init__(self, kind, name, owner, access, path, point):
+        self.kind = kind
+        self.name = name
+        self.owner = owner
+        self.access = access
+        self.path = path
+        self.point = point
+
+
+    @property
+    def qualified(self):
+        """
+        :return: str of the fully qualified name ('ns::MyClass::getX')
+        """
+        return self.owner + '::' + self.name if self.owner else self.name
+
+
+    def __repr__(self):
+        return 'Symbol({}, {}, {})'.format(self.kind, self.qualified, self.path)
+
+
+def _qualified(node):
+    """
+    :return: str of the names from the root down to node
+    """
+    names = []
+    while node is not None and node.kind is not None:
+        names.append(node.name or '')
+        node = node.parent
+    return '::'.join(reversed(names))
+
+
+def parse_symbols(text, path=None):
+    """
+    Index the text of a single file.
+
+    :param text: str of the whole file
+    :param path: str of the file the text came from (for the symbols)
+    :return: list[Symbol] in document order
+    """
+    snapshot = BufferSnapshot(text)
+    mask = CommentMask.build(text)
+    izer = CppTokenizer(None, snapshot=snapshot, mask=mask)
+    tree = ScopeTree.build(snapshot, izer)
+
+    symbols = []
+    for node in tree.root.walk():
+        check_cancelled()
+        if node.kind is None:
+            continue
+
+        if node.name and node.name.isidentifier():
+            symbols.append(Symbol(
+                node.kind, node.name, _qualified(node.parent), None, path, node.head
+            ))
+
+        if node.kind in ('class', 'struct'):
+            owner = _qualified(node)
+            for found in extract_class(node, snapshot, mask):
+                full_owner = '::'.join(o for o in (owner, found.owner) if o)
+                symbols.append(Symbol(
+                    found.kind, found.name, full_owner, found.access, path,
+                    found.region[0]
+                ))
+
+    # Free functions and the definitions of methods
+    for found in extract_definitions(tree, snapshot, mask):
+        symbols.append(Symbol(
+            found.kind, found.name, found.owner, None, path, found.region[0]
+        ))
+
+    symbols.sort(key=lambda s: s.point)
+    return symbols
+
+
+def index_file(path):
+    """
+    Index a file straight from the disk. This is what runs in the worker
+    processes so it only takes and returns plain (picklable) values.
+
+    :param path: str of the file
+    :return: tuple(path, float of its mtime, list[Symbol], bytes of the
+    text's hash, int of the text's length). The mtime is None if the file
+    couldn't be read.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        text = BufferSnapshot.from_view(FileBuffer(path)).text
+    except (OSError, IOError, UnicodeDecodeError):
+        return (path, None, [], None, 0)
+
+    try:
+        symbols = parse_symbols(text, path)
+    except RecursionError:
+        # Something pathological, one file shouldn't sink the whole index
+        symbols = []
+    return (path, mtime, symbols, text_hash(text), len(text))
+
+
+def index_files(paths):
+    """
+    index_file() for a chunk of files, so a worker process gets handed
+    several at a time
+
+    :param paths: list of str files
+    :return: list of index_file() results
+    """
+    return [index_file(path) for path in paths]
+
+
+class SymbolTable(object):
+    """
+    The symbols of many files, looked up by name, owner or file
+    """
+    def __init__(self):
+        self._files = {}
+        self._by_name = {}
+        self._by_owner = {}
+        self.mtimes = {}
+
+
+    def __len__(self):
+        return sum(len(s) for s in self._files.values())
+
+
+    def files(self):
+        """
+        :return: list of the files in the table
+        """
+        return list(self._files)
+
+
+    def mtime_of(self, path):
+        """
+        :return: float mtime the file had when it was indexed (or None)
+        """
+        return self.mtimes.get(path)
+
+
+    def add_file(self, path, mtime, symbols):
+        """
+        Replace everything we know about a file
+        """
+        self.remove_file(path)
+        self._files[path] = symbols
+        self.mtimes[path] = mtime
+        for symbol in symbols:
+            self._by_name.setdefault(symbol.name, []).append(symbol)
+            self._by_owner.setdefault(symbol.owner, []).append(symbol)
+
+
+    def remove_file(self, path):
+        symbols = self._files.pop(path, None)
+        self.mtimes.pop(path, None)
+        for symbol in symbols or []:
+            for table, key in ((self._by_name, symbol.name),
+                               (self._by_owner, symbol.owner)):
+                found = table.get(key, [])
+                if symbol in found:
+                    found.remove(symbol)
+                if not found:
+                    table.pop(key, None)
+
+
+    def named(self, name):
+        """
+        :return: list[Symbol] with the (unqualified) name
+        """
+        return list(self._by_name.get(name, []))
+
+
+    def members_of(self, owner):
+        """
+        :param owner: str of a qualified name ('ns::MyClass')
+        :return: list[Symbol] that belong directly to it
+        """
+        return list(self._by_owner.get(owner, []))
+
+
+    def find(self, qualified):
+        """
+        :param qualified: str like 'ns::MyClass::getX'
+        :return: list[Symbol] with that exact qualified name
+        """
+        owner, _, name = qualified.rpartition('::')
+        return [s for s in self._by_name.get(name, []) if s.owner == owner]
+
+
+    def in_file(self, path):
+        """
+        :return: list[Symbol] of the file in document order
+        """
+        return list(self._files.get(path, []))
+
+
+class ProjectIndexer(object):
+    """
+    Indexes every header and source under a set of folders, spreading the
+    parsing over a pool of processes so it isn't fighting the plugin host
+    (and everything else in it) for the GIL.
+
+    Sublime's plugin host isn't a Python executable that multiprocessing
+    can spawn, so the pool needs the "indexer_python" setting pointing at a
+    Python matching the host's version. Without one (or if the pool can't
+    start) the files are parsed one after another on the calling thread.
+
+    ..code::python
+
+        indexer = ProjectIndexer(window.folders(), ['h'], ['cpp'])
+        executor.submit(indexer.build, priority=Executor.LOW)
+
+        with indexer.reading() as table:
+            for symbol in table.members_of('ns::MyClass'):
+                ...
+
+    A table read from disk is swapped for a new one when the index is
+    saved. The old one is unmapped once nothing is reading() it, so hold
+    on to a table through reading() rather than the table attribute.
+    """
+
+    # Files handed to a worker process at a time
+    CHUNK_SIZE = 16
+
+    def __init__(self, folders, header_types, source_types, processes=None,
+                 python=None, cache=None, index_path=None):
+        """
+        :param folders: list of directories to index
+        :param header_types: list of header extensions (without the '.')
+        :param source_types: list of source extensions (without the '.')
+        :param processes: int of worker processes (defaults to the cores)
+        :param python: str path of the interpreter to run workers with
+        (defaults to ours if it's a real Python)
+        :param cache: ParseCache to keep symbols in between sessions
+        :param index_path: str of where to keep the table mapped from disk
+        (without an extension, a generation and '.idx' are added)
+        """
+        self.folders = [os.path.abspath(f) for f in folders]
+        self._types = set(header_types) | set(source_types)
+        self._processes = processes
+        self._python = python
+        self._cache = cache
+        self._index_path = index_path
+        self._lock = threading.Lock()
+        self.table = self._load_index()
+
+        # Swapped out tables waiting on their readers before they're closed
+        self._readers = {}
+        self._retired = []
+
+        # -- Counters for the curious
+        self.parsed = 0
+        self.loaded = 0
+        self.seconds = 0.0
+
+
+    @contextmanager
+    def reading(self):
+        """
+        The current table, kept open until the block is done with it
+        even if a new generation is saved meanwhile
+        """
+        with self._lock:
+            table = self.table
+            self._readers[id(table)] = self._readers.get(id(table), 0) + 1
+        try:
+            yield table
+        finally:
+            with self._lock:
+                self._readers[id(table)] -= 1
+                if not self._readers[id(table)]:
+                    del self._readers[id(table)]
+            self._close_retired()
+
+
+    def _close_retired(self):
+        """
+        Unmap the old tables nobody is reading anymore
+        """
+        with self._lock:
+            done = [t for t in self._retired if id(t) not in self._readers]
+            self._retired = [t for t in self._retired if id(t) in self._readers]
+        for table in done:
+            table.close()
+
+
+    def files(self):
+        """
+        :return: list of every header and source file under our folders
+        """
+        from .pairs import PairIndex
+
+        found = []
+        for folder in self.folders:
+            for top, subdirs, names in os.walk(folder):
+                subdirs[:] = [
+                    d for d in subdirs
+                    if d not in PairIndex.SKIP_DIRS and not d.startswith('.')
+                ]
+                for name in names:
+                    if os.path.splitext(name)[1][1:] in self._types:
+                        found.append(os.path.join(top, name))
+        return found
+
+
+    def _interpreter(self):
+        """
+        :return: str of the Python to spawn workers with or None
+        """
+        if self._python:
+            return self._python
+        if os.path.basename(sys.executable).lower().startswith('python'):
+            return sys.executable
+        return None
+
+
+    def _pool(self):
+        """
+        :return: concurrent.futures.ProcessPoolExecutor or None if we
+        can't run one here
+        """
+        python = self._interpreter()
+        if python is None:
+            return None
+
+        try:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            context = multiprocessing.get_context('spawn')
+            context.set_executable(python)
+            return ProcessPoolExecutor(
+                max_workers=self._processes, mp_context=context
+            )
+        except (ImportError, OSError, ValueError, NotImplementedError):
+            return None
+
+
+    def _generations(self):
+        """
+        :return: list of the index files we've written, newest first
+        """
+        directory, base = os.path.split(self._index_path)
+        try:
+            found = [
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if name.startswith(base + '.') and name.endswith('.idx')
+            ]
+        except OSError:
+            return []
+
+        def _mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+        return sorted(found, key=_mtime, reverse=True)
+
+
+    def _load_index(self):
+        """
+        :return: MappedSymbolTable of our last index on disk or an empty
+        SymbolTable
+        """
+        if self._index_path is None:
+            return SymbolTable()
+
+        from .symbolindex import MappedSymbolTable
+        for path in self._generations():
+            try:
+                return MappedSymbolTable(path)
+            except (OSError, ValueError):
+                continue
+        return SymbolTable()
+
+
+    def _save_index(self, paths, fresh):
+        """
+        Write a new generation of the index with the fresh symbols and
+        whatever we already had for the files that didn't change, then map
+        it in place of the old one
+
+        :param paths: list of every file the index should hold
+        :param fresh: SymbolTable of the files we just (re)indexed
+        :return: None
+        """
+        from .symbolindex import MappedSymbolTable, write_symbol_index
+
+        old = self.table
+        def _files():
+            for path in paths:
+                table = fresh if fresh.mtime_of(path) is not None else old
+                mtime = table.mtime_of(path)
+                if mtime is not None:
+                    yield (path, mtime, table.in_file(path))
+
+        directory = os.path.dirname(self._index_path)
+        os.makedirs(directory, exist_ok=True)
+        target = '{}.{}.idx'.format(self._index_path, int(time.time() * 1000))
+        write_symbol_index(target, _files())
+        table = MappedSymbolTable(target)
+
+        with self._lock:
+            self.table = table
+            if isinstance(old, MappedSymbolTable):
+                self._retired.append(old)
+        self._close_retired()
+
+        #
+        # A generation still being read keeps its mapping until it's let go.
+        # Unlinking a mapped file is fine on posix, elsewhere it waits for
+        # the next save.
+        #
+        for path in self._generations():
+            if path != target:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+    def _stale(self, paths):
+        """
+        :return: list of tuple(path, mtime) of the paths that are new or
+        changed since we indexed them
+        """
+        stale = []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if self.table.mtime_of(path) != mtime:
+                stale.append((path, mtime))
+        return stale
+
+
+    def _add(self, table, path, mtime, symbols, digest=None, size=0):
+        check_cancelled()
+        if mtime is None:
+            return # Couldn't read it
+        table.add_file(path, mtime, symbols)
+
+        if digest is not None:
+            self.parsed += 1
+            if self._cache is not None:
+                self._cache.store_symbols(path, mtime, digest, size, symbols)
+
+
+    def build(self):
+        """
+        Bring the index up to date with what's on disk, only parsing the
+        files that changed since the last build. Can be cancelled (see
+        Executor) between files, the current table is left as it was.
+
+        The changed files go in a fresh table which then replaces the
+        current one, readers never see a table that's being filled in.
+
+        :return: SymbolTable or MappedSymbolTable
+        """
+        start = time.perf_counter()
+        paths = self.files()
+        mapped = self._index_path is not None
+        fresh = SymbolTable()
+
+        wanted = set(paths)
+        gone = [path for path in self.table.files() if path not in wanted]
+
+        stale = []
+        changed = self._stale(paths)
+        for path, mtime in changed:
+            cached = None
+            if self._cache is not None:
+                cached = self._cache.load_symbols(path, mtime)
+
+            if cached is not None:
+                self._add(fresh, path, mtime, cached)
+                self.loaded += 1
+            else:
+                stale.append(path)
+
+        done = set()
+        pool = self._pool() if len(stale) > self.CHUNK_SIZE else None
+        if pool is not None:
+            from concurrent.futures.process import BrokenProcessPool
+            futures = [
+                pool.submit(index_files, stale[i:i + self.CHUNK_SIZE])
+                for i in range(0, len(stale), self.CHUNK_SIZE)
+            ]
+            try:
+                for future in futures:
+                    for result in future.result():
+                        self._add(fresh, *result)
+                        done.add(result[0])
+            except BrokenProcessPool:
+                pass # The workers couldn't start (or died), finish up here
+            finally:
+                # Cancelled or not, the chunks nobody has started on are
+                # dropped rather than left to run after we're gone
+                for future in futures:
+                    future.cancel()
+                pool.shutdown(wait=False)
+
+        for path in stale:
+            if path not in done:
+                self._add(fresh, *index_file(path))
+
+        if mapped and (changed or gone):
+            self._save_index(paths, fresh)
+        elif changed or gone:
+            old = self.table
+            for path in paths:
+                mtime = old.mtime_of(path)
+                if fresh.mtime_of(path) is None and mtime is not None:
+                    fresh.add_file(path, mtime, old.in_file(path))
+            with self._lock:
+                self.table = fresh
+
+        self.seconds = time.perf_counter() - start
+        return self.table
+
+
+class ProjectSymbols(object):
+    """
+    A ProjectIndexer for each window's folders, kept up to date on the
+    shared executor when files are saved. Off unless the
+    "index_project_symbols" setting is on.
+
+    ..code::python
+
+        indexer = project_symbols.for_window(window, settings)
+        if indexer is not None:
+            with indexer.reading() as table:
+                table.find('ns::MyClass')
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexers = {}
+
+
+    def for_window(self, window, settings):
+        """
+        :param window: sublime.Window
+        :param settings: sublime.Settings of the plugin
+        :return: ProjectIndexer of the window's folders (possibly still
+        building) or None if there's nothing to index
+        """
+        if window is None or not settings.get('index_project_symbols', False):
+            return None
+
+        folders = window.folders()
+        if not folders:
+            return None
+
+        key = tuple(folders)
+        with self._lock:
+            indexer = self._indexers.get(key)
+            if indexer is None:
+                indexer = ProjectIndexer(
+                    folders,
+                    settings.get('header_file_types', ['h', 'hpp']),
+                    settings.get('source_file_types', ['cpp']),
+                    processes=settings.get('indexer_processes') or None,
+                    python=settings.get('indexer_python') or None,
+                    cache=parse_cache if parse_cache.enabled else None,
+                    index_path=self._index_path(key) if parse_cache.enabled else None
+                )
+                self._indexers[key] = indexer
+                self.rebuild(indexer)
+        return indexer
+
+
+    @staticmethod
+    def _index_path(folders):
+        """
+        :return: str of where the index of a set of folders lives on disk
+        """
+        import hashlib
+        from .utils import _cache_path
+
+        name = hashlib.sha1('\n'.join(folders).encode('utf-8', 'surrogatepass'))
+        return os.path.join(_cache_path(), 'projects', name.hexdigest())
+
+
+    def rebuild(self, indexer):
+        """
+        Bring an indexer up to date in the background
+        :return: None
+        """
+        from .executor import executor, Executor
+        executor.submit(
+            indexer.build, priority=Executor.LOW, key=('symbols', id(indexer))
+        )
+
+
+    def saved(self, window, path, settings):
+        """
+        Re-index after a file in the window's project was saved
+        :return: None
+        """
+        indexer = self.for_window(window, settings)
+        if indexer is not None and os.path.splitext(path)[1][1:] in indexer._types:
+            self.rebuild(indexer)
+
+
+#
+# The one the plugin keeps the project symbols in
+#
+project_symbols = ProjectSymbols()
@@ -0,0 +1,107 @@
+"""
+Row lookups for a buffer without going through layout coordinates
+"""
+import re
+from array import array
+from bisect import bisect_right
+
+_NEWLINE = re.compile('\n')
+
+
+class LineTable(object):
+    """
+    The point every row of a buffer starts at, kept in an array('I').
+    Going between points, rows and the text of a row is a bisect or an
+    index rather than a trip through the view's layout (which moves with
+    word wrap and font size).
+
+    ..code::python
+
+        lines = LineTable.for_view(view, snapshot)
+        row = lines.row_of(point)
+        for r in range(row - 1, -1, -1):
+            text = lines.line_text(r)
+    """
+    def __init__(self, text, starts=None):
+        """
+        :param text: str of the whole buffer
+        :param starts: array('I') of row starts when the caller already
+        has them. It's ours from here on and must not change.
+        """
+        self._text = text
+        if starts is None:
+            starts = array('I', [0])
+            starts.extend(m.end() for m in _NEWLINE.finditer(text))
+        self._starts = starts
+
+
+    @classmethod
+    def for_view(cls, view, snapshot=None):
+        """
+        :param view: sublime.View (or None to use the snapshot alone)
+        :param snapshot: BufferSnapshot of the whole view if we have one
+        :return: LineTable of the current version of the view
+        """
+        if view is None:
+            return cls(snapshot.text)
+
+        from .incremental import IncrementalIndex
+        return IncrementalIndex.for_view(view, snapshot).lines
+
+
+    def __len__(self):
+        return len(self._starts)
+
+
+    @property
+    def text(self):
+        """
+        :return: str of the buffer the table was built from
+        """
+        return self._text
+
+
+    @property
+    def starts(self):
+        """
+        :return: array('I') of the point each row starts at
+        """
+        return self._starts
+
+
+    def row_of(self, point):
+        """
+        :param point: buffer point
+        :return: int row holding point
+        """
+        return max(bisect_right(self._starts, point) - 1, 0)
+
+
+    def begin_of(self, row):
+        """
+        :return: The point row starts at
+        """
+        return self._starts[row]
+
+
+    def end_of(self, row):
+        """
+        :return: The point row ends at (before its newline)
+        """
+        if row + 1 < len(self._starts):
+            return self._starts[row + 1] - 1
+        return len(self._text)
+
+
+    def bounds(self, row):
+        """
+        :return: tuple(begin, end) points of row without the newline
+        """
+        return (self.begin_of(row), self.end_of(row))
+
+
+    def line_text(self, row):
+        """
+        :return: str of row without its newline
+        """
+        return self._text[self.begin_of(row):self.end_of(row)]
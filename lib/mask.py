@@ -0,0 +1,270 @@
+"""
+Interval index of the comments and literals in a buffer
+"""
+import re
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+#
+# Everything starts with one of a handful of characters so the engine can
+# hop between candidates. Numbers are matched (but not recorded) so digit
+# separators (1'000) don't read as character literals. Literals that never
+# close stop at the end of their line and always match, so whether one is
+# found never depends on text past its end.
+#
+_SCANNER = re.compile(r'''
+    [/"'\d]
+    (?:
+        (?<=/)(?P<comment>/[^\n]*|\*.*?(?:\*/|\Z))
+      | (?<=")(?P<string>(?:\\.|[^"\\\n])*(?:"|\\?$))
+      | (?<=')(?P<character>(?:\\.|[^'\\\n])*(?:'|\\?$))
+      | (?<=\d)[\w.']*
+    )
+''', re.S | re.M | re.X)
+
+#
+# Raw strings run to the end of the buffer when they're never closed, the
+# same as block comments, so each one only depends on its own text
+#
+_RAW_STRING = re.compile(r'"([^()\\\s"]{0,16})\(.*?(?:\)\1"|\Z)', re.S)
+
+_RAW_PREFIX = re.compile(r'(?:^|[^\w])(?:u8|[uUL])?R$')
+
+
+class CommentMask(object):
+    """
+    Every comment, string and character literal in a buffer as sorted,
+    non-overlapping (start, end) intervals, found in one regex pass.
+
+    Scanners ask us about a point or a range with a bisect instead of
+    rediscovering comments on their own.
+    """
+    COMMENT   = 0
+    STRING    = 1
+    CHARACTER = 2
+
+    _KINDS = {
+        'comment' : COMMENT,
+        'string' : STRING,
+        'character' : CHARACTER
+    }
+
+    def __init__(self, starts=None, ends=None, kinds=None):
+        self._starts = starts if starts is not None else array('I')
+        self._ends = ends if ends is not None else array('I')
+        self._kinds = kinds if kinds is not None else bytearray()
+
+
+    def __len__(self):
+        return len(self._starts)
+
+
+    @classmethod
+    def _scan(cls, text, pos, begin, stop=None):
+        """
+        :param text: str to scan
+        :param pos: index into text to start scanning from
+        :param begin: buffer point of text[0]
+        :param stop: callable(start, end, kind) returning True once we can
+        stop scanning
+        :return: generator of (start, end, kind) in buffer points
+        """
+        search = _SCANNER.search
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return
+
+            kind = match.lastgroup
+            start, end = match.span()
+            pos = end
+
+            if kind is None:
+                continue # A number
+
+            if kind == 'string' and _RAW_PREFIX.search(text, max(0, start - 3), start):
+                raw = _RAW_STRING.match(text, start)
+                if raw is not None:
+                    end = pos = raw.end()
+
+            entry = (start + begin, end + begin, cls._KINDS[kind])
+            if stop is not None and stop(*entry):
+                return
+            yield entry
+
+
+    @classmethod
+    def build(cls, text, begin=0):
+        """
+        :param text: str of the buffer (or the part of it we have)
+        :param begin: buffer point text starts at
+        :return: CommentMask
+        """
+        mask = cls()
+        for start, end, kind in cls._scan(text, 0, begin):
+            mask._starts.append(start)
+            mask._ends.append(end)
+            mask._kinds.append(kind)
+        return mask
+
+
+    def nbytes(self):
+        """
+        :return: int of the bytes the mask's arrays take up
+        """
+        return sys.getsizeof(self._starts) + sys.getsizeof(self._ends) \
+            + sys.getsizeof(self._kinds)
+
+
+    @classmethod
+    def for_view(cls, view, snapshot=None):
+        """
+        :param view: sublime.View (or None to use the snapshot alone)
+        :param snapshot: BufferSnapshot of the whole view if we have one
+        :return: CommentMask of the current version of the view
+        """
+        if view is None:
+            return cls.build(snapshot.text, snapshot.begin)
+
+        from .incremental import IncrementalIndex
+        return IncrementalIndex.for_view(view, snapshot).mask
+
+
+    def update(self, text, begin, stop, delta):
+        """
+        Build the mask for an edited buffer. We only scan from the edit until
+        we fall back in step with the intervals we had before, everything
+        after that is shifted over.
+
+        :param text: str of the whole buffer after the edit
+        :param begin: The point the edit starts at
+        :param stop: The point the edit ended at (before the edit)
+        :param delta: int change in length of the buffer
+        :return: tuple(CommentMask, tuple(lo, hi) of the new buffer the
+        changed intervals cover or None if nothing changed)
+        """
+        starts, ends, kinds = self._starts, self._ends, self._kinds
+        count = len(starts)
+
+        #
+        # Intervals ending before the edit can't change and the scanner is
+        # in a known state right after each of them
+        #
+        keep = bisect_left(ends, begin)
+        scan_from = ends[keep - 1] if keep else 0
+
+        new_stop = stop + delta
+        # Where we are in the old intervals and if we're back in step
+        cursor = [keep, False]
+
+        def _in_step(start, end, kind):
+            if start < new_stop + 4:
+                # Still within reach of the edit (raw string prefixes look
+                # back a few characters)
+                return False
+
+            index = cursor[0]
+            while index < count and starts[index] + delta < start:
+                index += 1
+            cursor[0] = index
+
+            cursor[1] = (
+                index < count and starts[index] >= stop
+                and starts[index] + delta == start
+                and ends[index] + delta == end
+                and kinds[index] == kind
+            )
+            return cursor[1]
+
+        scanned = list(self._scan(text, scan_from, 0, _in_step))
+        synced = cursor[0] if cursor[1] else count
+
+        mask = CommentMask(
+            starts[:keep], ends[:keep], bytearray(kinds[:keep])
+        )
+        for start, end, kind in scanned:
+            mask._starts.append(start)
+            mask._ends.append(end)
+            mask._kinds.append(kind)
+
+        mask._starts.extend(s + delta for s in starts[synced:])
+        mask._ends.extend(e + delta for e in ends[synced:])
+        mask._kinds.extend(kinds[synced:])
+
+        #
+        # Work out what actually changed so callers only redo that. Old
+        # intervals are moved to where they'd be after the edit, any that
+        # started or ended in the edited text can't have survived it.
+        #
+        def _start(point):
+            if point < begin:
+                return point
+            return point + delta if point >= stop else None
+
+        def _end(point):
+            if point <= begin:
+                return point
+            return point + delta if point >= stop else None
+
+        difference = set(scanned)
+        lo = hi = None
+        for i in range(keep, synced):
+            entry = (_start(starts[i]), _end(ends[i]), kinds[i])
+            if entry in difference:
+                difference.discard(entry)
+                continue
+
+            # Whatever it covered needs another look
+            start = entry[0] if entry[0] is not None else begin
+            end = entry[1] if entry[1] is not None else new_stop
+            lo = start if lo is None else min(lo, start)
+            hi = end if hi is None else max(hi, end)
+
+        for start, end, kind in difference:
+            lo = start if lo is None else min(lo, start)
+            hi = end if hi is None else max(hi, end)
+
+        if lo is None:
+            return mask, None
+        return mask, (lo, hi)
+
+
+    def span_at(self, point):
+        """
+        :return: tuple(start, end, kind) of the interval holding point or None
+        """
+        index = bisect_right(self._starts, point) - 1
+        if index >= 0 and point < self._ends[index]:
+            return (self._starts[index], self._ends[index], self._kinds[index])
+        return None
+
+
+    def kind_at(self, point):
+        """
+        :return: The kind (COMMENT, STRING, CHARACTER) at point or None
+        """
+        found = self.span_at(point)
+        return None if found is None else found[2]
+
+
+    def in_comment(self, point):
+        """
+        :return: True if point sits inside a comment
+        """
+        return self.kind_at(point) == self.COMMENT
+
+
+    def ranges(self, begin, end):
+        """
+        :return: list[tuple(start, end, kind)] of the intervals overlapping
+        the range begin to end
+        """
+        index = max(bisect_right(self._starts, begin) - 1, 0)
+        output = []
+        starts, ends, kinds = self._starts, self._ends, self._kinds
+        while index < len(starts) and starts[index] < end:
+            if ends[index] > begin:
+                output.append((starts[index], ends[index], kinds[index]))
+            index += 1
+        return output
@@ -0,0 +1,108 @@
+"""
+Writing the dynamic context menu to disk
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+
+class MenuWriter(object):
+    """
+    Sublime reloads its menu resources whenever Context.sublime-menu
+    changes, so we only touch the file when the menu is actually different
+    from what we last wrote (e.g. clearing an already empty menu after
+    every right click doesn't count). Writes go to a temporary file that's
+    renamed over the menu, so Sublime never reads half of one.
+
+    ..code::python
+
+        menu_writer.write([{ "caption" : "C++ Toolkit", "children" : [...] }])
+        menu_writer.write([]) # Written
+        menu_writer.write([]) # Skipped
+    """
+    FILE_NAME = 'Context.sublime-menu'
+
+    def __init__(self, directory=None):
+        """
+        :param directory: Where the menu lives (defaults to the plugin's
+        cache path)
+        """
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._last = None
+
+        # -- Counters for the curious
+        self.written = 0
+        self.skipped = 0
+
+
+    @property
+    def path(self):
+        """
+        :return: Path to the menu file
+        """
+        directory = self._directory
+        if directory is None:
+            from .utils import _cache_path
+            directory = _cache_path()
+        return os.path.join(directory, self.FILE_NAME)
+
+
+    def write(self, menu):
+        """
+        :param menu: list of menu entries that can go to JSON
+        :return: True if the file was written, False if it already held
+        this menu
+        """
+        content = json.dumps(menu)
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+        with self._lock:
+            path = self.path
+            if digest == self._last and os.path.isfile(path):
+                self.skipped += 1
+                return False
+
+            handle, temp = tempfile.mkstemp(
+                prefix='.Context-', suffix='.tmp', dir=os.path.dirname(path)
+            )
+            try:
+                with os.fdopen(handle, 'w') as f:
+                    f.write(content)
+                os.replace(temp, path)
+            except:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+
+            self._last = digest
+            self.written += 1
+            return True
+
+
+    def forget(self):
+        """
+        Make the next write go to disk no matter what (e.g. after something
+        else removed the file)
+        """
+        with self._lock:
+            self._last = None
+
+
+    def report(self):
+        """
+        :return: str of how many writes we've made and avoided
+        """
+        total = self.written + self.skipped
+        return 'Menu writes: {} written, {} skipped ({:.0f}% avoided)\n'.format(
+            self.written, self.skipped,
+            100.0 * self.skipped / total if total else 0.0
+        )
+
+
+#
+# The one the plugin writes with
+#
+menu_writer = MenuWriter()
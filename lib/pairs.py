@@ -0,0 +1,373 @@
+"""
+Finding the header for a source file (and vice versa)
+"""
+import os
+import json
+import time
+import threading
+
+from collections import OrderedDict
+
+from .executor import executor, Executor
+
+
+def _key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _inside(path, folder):
+    """
+    :return: True if path is somewhere under folder (no filesystem access)
+    """
+    folder = _key(folder)
+    return path == folder or path.startswith(folder.rstrip(os.sep) + os.sep)
+
+
+class PairIndex(object):
+    """
+    Every header and source file under a set of folders mapped to its
+    counterpart, so pairing a file is a dict lookup rather than a stat()
+    per extension on each right click.
+
+    A file pairs with one of the same name next to it first. Failing that
+    the "pair_roots" mappings are tried, each one tying a header root to a
+    source root (relative to the folders or absolute). A header at
+    include/<path>/x.h pairs with src/<path>/x.cpp, or the only x.cpp
+    anywhere under src/ if that doesn't exist.
+
+    The index stays current by polling the modification time of the
+    directories it walked (adding or removing a file changes them), at most
+    once every POLL seconds and never on the thread asking for a pair.
+    """
+
+    # Seconds between checks for added/removed files
+    POLL = 5.0
+
+    # Directories we never walk into
+    SKIP_DIRS = ('.git', '.hg', '.svn', 'node_modules', '__pycache__')
+
+    def __init__(self, folders, header_types, source_types, roots=(), recursive=True):
+        """
+        :param folders: list of directories to index
+        :param header_types: list of header extensions (without the '.'),
+        earlier ones win when there's more than one candidate
+        :param source_types: list of source extensions (without the '.')
+        :param roots: list of dict({ 'header' : str, 'source' : str })
+        :param recursive: bool, False to only index the folders themselves
+        """
+        self.folders = [os.path.abspath(f) for f in folders]
+        self._header_types = list(header_types)
+        self._source_types = list(source_types)
+        self._roots = list(roots)
+        self._recursive = recursive
+        self._pairs = {}
+        self._dirs = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.ready = False
+
+
+    def pair_of(self, path):
+        """
+        :param path: str of a header or source file
+        :return: tuple(str(header|source), str path of its counterpart) or
+        None if it doesn't have one (as of the last scan)
+        """
+        return self._pairs.get(_key(path))
+
+
+    def covers(self, path):
+        """
+        :return: True if path sits in the folders this index walks
+        """
+        path = _key(path)
+        if self._recursive:
+            return any(_inside(path, folder) for folder in self.folders)
+        return os.path.dirname(path) in [_key(f) for f in self.folders]
+
+
+    def due(self):
+        """
+        :return: True if it's time to check for added/removed files
+        """
+        return time.time() - self._checked > self.POLL
+
+
+    def _walk(self):
+        """
+        :return: tuple(dict of path to mtime for each directory, list of
+        the files in them)
+        """
+        dirs = {}
+        files = []
+        for folder in self.folders:
+            for top, subdirs, names in os.walk(folder):
+                try:
+                    dirs[top] = os.stat(top).st_mtime
+                except OSError:
+                    continue
+
+                if not self._recursive:
+                    subdirs[:] = []
+                else:
+                    subdirs[:] = [
+                        d for d in subdirs
+                        if d not in self.SKIP_DIRS and not d.startswith('.')
+                    ]
+                files.extend(os.path.join(top, name) for name in names)
+        return dirs, files
+
+
+    def _rank(self, path, types):
+        """
+        :return: int index of the path's extension in types (or None)
+        """
+        ext = os.path.splitext(path)[1][1:]
+        if ext in types:
+            return types.index(ext)
+        return None
+
+
+    def build(self):
+        """
+        Walk the folders and pair everything up
+        :return: None
+        """
+        dirs, files = self._walk()
+
+        # (directory, stem) -> the headers and sources found there, best
+        # (by the order of the file types) first
+        beside = {}
+        for path in files:
+            base, _ = os.path.splitext(path)
+            for kind, types in (('header', self._header_types),
+                                ('source', self._source_types)):
+                rank = self._rank(path, types)
+                if rank is None:
+                    continue
+                slot = beside.setdefault(_key(base), {})
+                slot.setdefault(kind, []).append((rank, path))
+
+        for slot in beside.values():
+            for found in slot.values():
+                found.sort()
+
+        pairs = {}
+        for slot in beside.values():
+            if 'header' in slot and 'source' in slot:
+                self._pair_all(slot['header'], 'header', slot['source'][0][1], pairs)
+                self._pair_all(slot['source'], 'source', slot['header'][0][1], pairs)
+
+        for root in self._roots:
+            self._pair_roots(root, beside, pairs)
+
+        with self._lock:
+            self._dirs = dirs
+            self._pairs = pairs
+            self._checked = time.time()
+            self.ready = True
+
+
+    @staticmethod
+    def _pair_all(found, kind, other, pairs):
+        for _, path in found:
+            pairs.setdefault(_key(path), (kind, other))
+
+
+    def _pair_roots(self, root, beside, pairs):
+        """
+        Pair up whatever's left unpaired under a header/source root mapping
+        """
+        for folder in self.folders:
+            roots = {
+                'header' : _key(os.path.join(folder, root.get('header', ''))),
+                'source' : _key(os.path.join(folder, root.get('source', '')))
+            }
+
+            # stem -> list of candidates per kind under its root
+            by_stem = { 'header' : {}, 'source' : {} }
+            for base, slot in beside.items():
+                for kind in ('header', 'source'):
+                    if kind in slot and _inside(base, roots[kind]):
+                        stem = os.path.basename(base)
+                        by_stem[kind].setdefault(stem, []).append(
+                            (os.path.relpath(base, roots[kind]), slot[kind])
+                        )
+
+            for kind, other in (('header', 'source'), ('source', 'header')):
+                for stem, found in by_stem[kind].items():
+                    candidates = by_stem[other].get(stem, [])
+                    if not candidates:
+                        continue
+
+                    for relative, paths in found:
+                        exact = [c for r, c in candidates if r == relative]
+                        if exact:
+                            self._pair_all(paths, kind, exact[0][0][1], pairs)
+                        elif len(candidates) == 1:
+                            self._pair_all(paths, kind, candidates[0][1][0][1], pairs)
+
+
+    def probe(self, path):
+        """
+        Pair one file by looking for a counterpart of the same name right
+        next to it. A stat() per extension, for when the index hasn't been
+        built yet.
+        :return: tuple(str(header|source), str) like pair_of() or None
+        """
+        base = os.path.splitext(path)[0]
+        for kind, types, others in (
+                ('header', self._header_types, self._source_types),
+                ('source', self._source_types, self._header_types)):
+            if self._rank(path, types) is None:
+                continue
+            for other in others:
+                if os.path.isfile(base + '.' + other):
+                    return (kind, base + '.' + other)
+        return None
+
+
+    def refresh(self):
+        """
+        Rebuild if any directory we walked has changed since (meant for a
+        background thread)
+        :return: bool, True if we rebuilt
+        """
+        self._checked = time.time()
+        for directory, mtime in list(self._dirs.items()):
+            try:
+                changed = os.stat(directory).st_mtime != mtime
+            except OSError:
+                changed = True
+            if changed:
+                self.build()
+                return True
+        return False
+
+
+class ProjectPairs(object):
+    """
+    The PairIndex for each window's project folders, plus small ones for
+    the directories of files that aren't in a project (or whose project
+    hasn't finished indexing yet).
+
+    ..code::python
+
+        found = pairs.lookup(view.window(), view.file_name(), settings)
+        if found is not None:
+            header_or_source, other_file = found
+    """
+
+    # How many single-directory indexes we hold on to
+    MAX_DIRECTORIES = 32
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._projects = {}
+        self._directories = OrderedDict()
+
+
+    @staticmethod
+    def _options(settings):
+        header_types = tuple(settings.get('header_file_types', ['h', 'hpp']))
+        source_types = tuple(settings.get('source_file_types', ['cpp']))
+        roots = settings.get('pair_roots', []) or []
+        return header_types, source_types, roots
+
+
+    def _project(self, folders, settings):
+        """
+        :return: PairIndex for the folders, building it in the background
+        the first time we're asked
+        """
+        header_types, source_types, roots = self._options(settings)
+        key = (tuple(folders), header_types, source_types, json.dumps(roots, sort_keys=True))
+
+        with self._lock:
+            index = self._projects.get(key)
+            if index is None:
+                index = PairIndex(folders, header_types, source_types, roots)
+                self._projects[key] = index
+                executor.submit(
+                    index.build, priority=Executor.NORMAL, key=('pairs', key)
+                )
+        return index
+
+
+    def _directory(self, directory, settings):
+        """
+        :return: PairIndex of a single directory, building it in the
+        background the first time we're asked (it isn't ready until then)
+        """
+        header_types, source_types, _ = self._options(settings)
+        key = (_key(directory), header_types, source_types)
+
+        with self._lock:
+            index = self._directories.get(key)
+            if index is not None:
+                self._directories.move_to_end(key)
+                return index
+
+            index = PairIndex([directory], header_types, source_types, recursive=False)
+            self._directories[key] = index
+            while len(self._directories) > self.MAX_DIRECTORIES:
+                self._directories.popitem(last=False)
+
+        #
+        # Listing a big directory has no place on the thread that asked
+        # (that's the right click), it's built on the executor
+        #
+        executor.submit(
+            index.build, priority=Executor.NORMAL, key=('pairs-dir', key)
+        )
+        return index
+
+
+    def _poll(self, index):
+        if index.ready and index.due():
+            index._checked = time.time()
+            executor.submit(
+                index.refresh, priority=Executor.LOW, key=('pairs-poll', id(index))
+            )
+
+
+    def lookup(self, window, path, settings):
+        """
+        :param window: sublime.Window the file is open in (or None)
+        :param path: str of the file
+        :param settings: sublime.Settings of the plugin
+        :return: tuple(str(header|source), str of the counterpart) or None
+        """
+        folders = window.folders() if window is not None else []
+
+        if folders:
+            project = self._project(folders, settings)
+            if project.ready and project.covers(path):
+                self._poll(project)
+                found = project.pair_of(path)
+                if found is not None:
+                    return found
+
+        index = self._directory(os.path.dirname(path), settings)
+        if not index.ready:
+            # Until the directory's been listed, just look beside the file
+            return index.probe(path)
+
+        self._poll(index)
+        return index.pair_of(path)
+
+
+    def warm(self, window, settings):
+        """
+        Start indexing a window's folders ahead of the first lookup
+        :return: None
+        """
+        if window is not None and window.folders():
+            self._project(window.folders(), settings)
+
+
+
+#
+# The one the context menu pairs files with
+#
+pairs = ProjectPairs()
@@ -0,0 +1,562 @@
+"""
+Parsed files kept on disk between sessions
+"""
+import os
+import sys
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+
+from array import array
+
+#
+# The fixed header of every entry: magic, format version, byte order,
+# mtime and size of the file, sha1 of its text, number of sections
+#
+_HEADER = struct.Struct('<4sHHdQ20sI')
+
+#
+# A section: tag, array typecode, offset from the start of the entry and
+# the number of items
+#
+_SECTION = struct.Struct('<4s4sQQ')
+
+_LITTLE = 1
+_BIG = 2
+
+
+def text_hash(text):
+    """
+    :return: bytes of the sha1 of text
+    """
+    return hashlib.sha1(text.encode('utf-8', 'surrogatepass')).digest()
+
+
+class _Strings(object):
+    """
+    Interns strings while writing an entry, each string is stored once and
+    referred to by its index
+    """
+    def __init__(self):
+        self._ids = {}
+        self._items = []
+
+
+    def id(self, value):
+        if value is None:
+            return -1
+        found = self._ids.get(value)
+        if found is None:
+            found = self._ids[value] = len(self._items)
+            self._items.append(value)
+        return found
+
+
+    def sections(self):
+        """
+        :return: list of (tag, array) for the entry. Offsets are into the
+        decoded text so they hold up for any characters.
+        """
+        offsets = array('I', [0])
+        for item in self._items:
+            offsets.append(offsets[-1] + len(item))
+        blob = array('B', ''.join(self._items).encode('utf-8', 'surrogatepass'))
+        return [(b'STRO', offsets), (b'STRB', blob)]
+
+
+class _Entry(object):
+    """
+    The header and sections of an entry read through a memory map
+    """
+    def __init__(self, handle, header, sections):
+        self._map = handle
+        self.header = header
+        self._sections = sections
+        self._strings = None
+
+
+    @classmethod
+    def open(cls, path, version):
+        """
+        :return: _Entry or None if there's no (usable) entry at path
+        """
+        try:
+            with open(path, 'rb') as f:
+                handle = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, IOError, ValueError):
+            return None
+
+        try:
+            magic, found, order, mtime, size, digest, count = \
+                _HEADER.unpack_from(handle, 0)
+        except struct.error:
+            handle.close()
+            return None
+
+        native = _LITTLE if sys.byteorder == 'little' else _BIG
+        if magic != ParseCache.MAGIC or found != version or order != native:
+            handle.close()
+            return None
+
+        sections = {}
+        offset = _HEADER.size
+        for _ in range(count):
+            tag, typecode, start, items = _SECTION.unpack_from(handle, offset)
+            sections[tag] = (typecode.rstrip(b'\0').decode('ascii'), start, items)
+            offset += _SECTION.size
+
+        return cls(handle, (mtime, size, digest), sections)
+
+
+    def close(self):
+        self._map.close()
+
+
+    def array(self, tag):
+        """
+        :return: array of the section (empty if it's missing)
+        """
+        if tag not in self._sections:
+            return array('I')
+
+        typecode, start, items = self._sections[tag]
+        output = array(typecode)
+        output.frombytes(self._map[start:start + items * output.itemsize])
+        return output
+
+
+    def strings(self):
+        """
+        :return: list[str] of the interned strings
+        """
+        if self._strings is None:
+            offsets = self.array(b'STRO')
+            text = self.array(b'STRB').tobytes().decode('utf-8', 'surrogatepass')
+            self._strings = [
+                text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)
+            ]
+        return self._strings
+
+
+class ParseCache(object):
+    """
+    What parsing a file produced (its lexed rows, CommentMask, ScopeTree and
+    symbols) saved under the plugin's cache directory, so reopening a file
+    or restarting Sublime doesn't lex it all over again.
+
+    Each file gets an entry per kind ('lex' for the IncrementalIndex,
+    'sym' for the symbol index). An entry is a small header (format
+    version, the file's mtime, size and a sha1 of its text) followed by
+    flat arrays and an interned string table, read back through a memory
+    map. An entry counts when the mtime matches or, failing that, the text
+    hashes the same.
+
+    Entries past max_bytes are evicted least recently used first.
+
+    ..code::python
+
+        found = parse_cache.load_symbols(path, mtime)
+        if found is None:
+            symbols = parse_symbols(text, path)
+            parse_cache.store_symbols(path, mtime, text_hash(text), len(text), symbols)
+    """
+    MAGIC = b'CTPC'
+
+    # Bump whenever what we store (or how we lex) changes
+    VERSION = 3
+
+    DIRECTORY = 'parse'
+
+    # Entries being written, they aren't counted or evicted until they've
+    # been moved into place
+    TEMP_PREFIX = '.entry-'
+
+    # Default cap on the size of the cache
+    MAX_BYTES = 128 * 1024 * 1024
+
+    KINDS = ('namespace', 'class', 'struct', 'method', 'function', 'member')
+    ACCESS = (None, 'public', 'protected', 'private')
+
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        :param directory: Where entries live. Without one the cache does
+        nothing, the plugin points it under its cache path once it's loaded.
+        :param max_bytes: int cap on the total size of the entries
+        """
+        self.directory = directory
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._usage = None
+
+        # -- Counters for the curious
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        try:
+            import sublime
+        except ImportError:
+            return self.MAX_BYTES
+
+        settings = sublime.load_settings('CppToolkit.sublime-settings')
+        megabytes = settings.get('parse_cache_mb', self.MAX_BYTES // (1024 * 1024))
+        return int(megabytes) * 1024 * 1024
+
+
+    @property
+    def enabled(self):
+        """
+        :return: False when the cache has been turned off (a size of 0) or
+        there's nowhere to keep it (e.g. outside of Sublime)
+        """
+        return self.directory is not None and self.max_bytes > 0
+
+
+    def entry_path(self, path, kind):
+        """
+        :return: str of where the entry of kind for path lives
+        """
+        name = hashlib.sha1(
+            os.path.normcase(os.path.abspath(path)).encode('utf-8', 'surrogatepass')
+        ).hexdigest()
+        return os.path.join(self.directory, '{}.{}'.format(name, kind))
+
+
+    def _open(self, path, kind, mtime=None, text=None):
+        """
+        :return: _Entry for path if it's current with mtime or text,
+        otherwise None
+        """
+        if self.directory is None:
+            return None
+
+        location = self.entry_path(path, kind)
+        entry = _Entry.open(location, self.VERSION)
+        if entry is not None:
+            stored_mtime, size, digest = entry.header
+            current = (mtime is not None and mtime == stored_mtime) or \
+                (text is not None and text_hash(text) == digest)
+            if not current:
+                entry.close()
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        try:
+            os.utime(location, None) # Most recently used
+        except OSError:
+            pass
+        return entry
+
+
+    def _write(self, path, kind, mtime, digest, size, sections):
+        """
+        Write an entry, replacing any that's there
+        :param digest: bytes of text_hash() of the file's text
+        :param size: int length of the file's text
+        :param sections: list of (tag, array)
+        :return: None
+        """
+        directory = self.directory
+        if directory is None:
+            return
+        os.makedirs(directory, exist_ok=True)
+
+        native = _LITTLE if sys.byteorder == 'little' else _BIG
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        table = []
+        for tag, values in sections:
+            offset += -offset % 8 # Keep every array aligned
+            table.append(_SECTION.pack(
+                tag, values.typecode.encode('ascii'), offset, len(values)
+            ))
+            offset += len(values) * values.itemsize
+
+        handle, temp = tempfile.mkstemp(prefix=self.TEMP_PREFIX, dir=directory)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(_HEADER.pack(
+                    self.MAGIC, self.VERSION, native, mtime or 0.0,
+                    size, digest, len(sections)
+                ))
+                for packed in table:
+                    f.write(packed)
+                for tag, values in sections:
+                    f.write(b'\0' * (-f.tell() % 8))
+                    values.tofile(f)
+                size = f.tell()
+            os.replace(temp, self.entry_path(path, kind))
+        except FileNotFoundError:
+            # Cleared from under us (e.g. clear() from another window), it's
+            # only a cache so the entry simply isn't there
+            if os.path.exists(temp):
+                os.remove(temp)
+            return
+        except:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+        self._account(os.path.basename(self.entry_path(path, kind)), size)
+
+
+    def _account(self, name, size):
+        """
+        Note an entry's new size and evict the least recently used entries
+        if we've gone past max_bytes
+        """
+        with self._lock:
+            directory = self.directory
+            if self._usage is None:
+                self._usage = {}
+                for found in os.listdir(directory):
+                    if found.startswith(self.TEMP_PREFIX):
+                        continue
+                    try:
+                        self._usage[found] = os.path.getsize(os.path.join(directory, found))
+                    except OSError:
+                        pass
+            self._usage[name] = size
+
+            limit = self.max_bytes
+            if sum(self._usage.values()) <= limit:
+                return
+
+            def _used(found):
+                try:
+                    return os.path.getmtime(os.path.join(directory, found))
+                except OSError:
+                    return 0.0
+
+            total = sum(self._usage.values())
+            for found in sorted(self._usage, key=_used):
+                if total <= limit * 0.9 or found == name:
+                    continue
+                try:
+                    os.remove(os.path.join(directory, found))
+                except OSError:
+                    pass
+                total -= self._usage.pop(found)
+                self.evicted += 1
+
+
+    # -- Lexed rows, mask and scope tree
+
+    def store_lex(self, path, mtime, text, lines, spans, mask, tree=None):
+        """
+        :param mtime: float of the file's mtime (None if the buffer has
+        changes that aren't saved)
+        :param lines: list[tuple(str)] of the tokens of each row
+        :param spans: list of each row's token spans (None unless masked)
+        :param mask: CommentMask of text
+        :param tree: ScopeTree of text (if it's been built)
+        :return: None
+        """
+        strings = _Strings()
+
+        counts = array('I', (len(tokens) for tokens in lines))
+        tokens = array('I')
+        for row in lines:
+            tokens.extend(strings.id(token) for token in row)
+
+        masked_rows = array('I')
+        masked_counts = array('I')
+        masked_spans = array('I')
+        for row, offsets in enumerate(spans):
+            if offsets is None:
+                continue
+            masked_rows.append(row)
+            masked_counts.append(len(offsets))
+            for start, end in offsets:
+                masked_spans.append(start)
+                masked_spans.append(end)
+
+        sections = [
+            (b'ROWC', counts), (b'ROWT', tokens),
+            (b'SPNR', masked_rows), (b'SPNC', masked_counts), (b'SPNV', masked_spans),
+            (b'MSKS', mask._starts), (b'MSKE', mask._ends),
+            (b'MSKK', array('B', mask._kinds)),
+        ]
+
+        if tree is not None:
+            nodes = array('i')
+            labels = array('i')
+            index = {}
+            for node in tree.root.walk():
+                index[node] = len(index)
+                nodes.extend((
+                    self.KINDS.index(node.kind) if node.kind else -1,
+                    strings.id(node.name),
+                    node.head, node.open,
+                    -1 if node.close is None else node.close,
+                    -1 if node.end is None else node.end,
+                    index[node.parent] if node.parent is not None else -1
+                ))
+                for section in node.sections:
+                    labels.extend((
+                        index[node], strings.id(section.label),
+                        section.head, section.point
+                    ))
+            sections.extend(((b'TREE', nodes), (b'SECT', labels)))
+
+        self._write(
+            path, 'lex', mtime, text_hash(text), len(text),
+            strings.sections() + sections
+        )
+
+
+    def load_lex(self, path, text, mtime=None):
+        """
+        :param text: str the entry has to have been made from
+        :return: dict of 'lines', 'spans', 'mask' and 'tree' (None if it
+        wasn't stored) or None if we don't have it
+        """
+        from .mask import CommentMask
+
+        entry = self._open(path, 'lex', mtime, text)
+        if entry is None:
+            return None
+
+        try:
+            strings = entry.strings()
+            words = [strings[i] for i in entry.array(b'ROWT')]
+            lines = []
+            position = 0
+            for count in entry.array(b'ROWC'):
+                lines.append(tuple(words[position:position + count]))
+                position += count
+
+            spans = [None] * len(lines)
+            values = entry.array(b'SPNV')
+            position = 0
+            for row, count in zip(entry.array(b'SPNR'), entry.array(b'SPNC')):
+                spans[row] = [
+                    (values[i], values[i + 1])
+                    for i in range(position, position + 2 * count, 2)
+                ]
+                position += 2 * count
+
+            mask = CommentMask(
+                entry.array(b'MSKS'), entry.array(b'MSKE'),
+                bytearray(entry.array(b'MSKK').tobytes())
+            )
+            tree = self._tree(entry, strings, text)
+        finally:
+            entry.close()
+
+        return { 'lines' : lines, 'spans' : spans, 'mask' : mask, 'tree' : tree }
+
+
+    def _tree(self, entry, strings, text):
+        """
+        :return: ScopeTree rebuilt from the entry or None
+        """
+        from .scope import ScopeTree, ScopeNode, AccessSection
+        from .snapshot import BufferSnapshot
+
+        nodes = entry.array(b'TREE')
+        if not nodes:
+            return None
+
+        built = []
+        for i in range(0, len(nodes), 7):
+            kind, name, head, open_, close, end, parent = nodes[i:i + 7]
+            node = ScopeNode(
+                self.KINDS[kind] if kind >= 0 else None,
+                strings[name] if name >= 0 else None,
+                head, open_, built[parent] if parent >= 0 else None
+            )
+            node.close = close if close >= 0 else None
+            node.end = end if end >= 0 else None
+            if node.parent is not None:
+                node.parent.children.append(node)
+            built.append(node)
+
+        labels = entry.array(b'SECT')
+        for i in range(0, len(labels), 4):
+            owner, label, head, point = labels[i:i + 4]
+            built[owner].sections.append(AccessSection(strings[label], head, point))
+
+        return ScopeTree(built[0], BufferSnapshot(text))
+
+
+    # -- Symbols
+
+    def store_symbols(self, path, mtime, digest, size, symbols):
+        """
+        :param digest: bytes of text_hash() of the file's text
+        :param size: int length of the file's text
+        :param symbols: list[Symbol] of the file
+        :return: None
+        """
+        strings = _Strings()
+        records = array('i')
+        for symbol in symbols:
+            records.extend((
+                self.KINDS.index(symbol.kind), strings.id(symbol.name),
+                strings.id(symbol.owner), self.ACCESS.index(symbol.access),
+                symbol.point
+            ))
+        self._write(
+            path, 'sym', mtime, digest, size,
+            strings.sections() + [(b'SYMS', records)]
+        )
+
+
+    def load_symbols(self, path, mtime=None, text=None):
+        """
+        :return: list[Symbol] of path if the entry is current with mtime
+        (or text), otherwise None
+        """
+        from .indexer import Symbol
+
+        entry = self._open(path, 'sym', mtime, text)
+        if entry is None:
+            return None
+
+        try:
+            strings = entry.strings()
+            records = entry.array(b'SYMS')
+        finally:
+            entry.close()
+
+        return [
+            Symbol(
+                self.KINDS[records[i]], strings[records[i + 1]],
+                strings[records[i + 2]], self.ACCESS[records[i + 3]],
+                path, records[i + 4]
+            ) for i in range(0, len(records), 5)
+        ]
+
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        with self._lock:
+            directory = self.directory
+            if directory is not None and os.path.isdir(directory):
+                for found in os.listdir(directory):
+                    if found.startswith(self.TEMP_PREFIX):
+                        continue
+                    try:
+                        os.remove(os.path.join(directory, found))
+                    except OSError:
+                        pass
+            self._usage = None
+
+
+#
+# The one the plugin reads and writes
+#
+parse_cache = ParseCache()
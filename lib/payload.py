@@ -0,0 +1,95 @@
+"""
+Keeping context menu data in memory rather than in the menu file
+"""
+import time
+import itertools
+import threading
+
+from collections import OrderedDict
+
+
+class PayloadRegistry(object):
+    """
+    The data each context menu entry runs with (function state, the current
+    line, the click's details, ...) lives here and the written menu only
+    carries a short id and the entry's variant. Sublime doesn't have to
+    parse the whole lot back out of Context.sublime-menu on every right
+    click and none of it is copied per entry.
+
+    Only the last MAX_MENUS menus are kept, and nothing outlives LIFETIME.
+
+    ..code::python
+
+        payload_id = payloads.register(shared, {
+            'delc_in_source' : { 'in_' : 'source' },
+            'copy_delc' : { 'in_' : 'clipboard' }
+        })
+        # Menu entry args: { "data" : { "payload" : payload_id, "variant" : "copy_delc" } }
+
+        data = payloads.resolve(payload_id, 'copy_delc')
+    """
+
+    # How many menus we remember (the one on screen is the last)
+    MAX_MENUS = 8
+
+    # Seconds before a menu's data is dropped
+    LIFETIME = 600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._menus = OrderedDict()
+        self._counter = itertools.count(1)
+
+
+    def register(self, shared, variants):
+        """
+        :param shared: dict of data every entry in the menu has in common
+        :param variants: dict mapping each entry's variant name to the dict
+        of data only it has
+        :return: str id to hand to resolve()
+        """
+        payload_id = 'p{}'.format(next(self._counter))
+        with self._lock:
+            self._expire(time.time())
+            self._menus[payload_id] = (time.time(), shared, variants)
+            while len(self._menus) > self.MAX_MENUS:
+                self._menus.popitem(last=False)
+        return payload_id
+
+
+    def _expire(self, now):
+        while self._menus:
+            payload_id, (stamp, _, _) = next(iter(self._menus.items()))
+            if now - stamp < self.LIFETIME:
+                break
+            del self._menus[payload_id]
+
+
+    def resolve(self, payload_id, variant):
+        """
+        :param payload_id: str from register()
+        :param variant: str name of the entry that was picked
+        :return: dict of the entry's data (shared updated with the variant)
+        or None if the menu's been forgotten
+        """
+        with self._lock:
+            self._expire(time.time())
+            found = self._menus.get(payload_id)
+
+        if found is None or variant not in found[2]:
+            return None
+
+        data = dict(found[1])
+        data.update(found[2][variant])
+        return data
+
+
+    def clear(self):
+        with self._lock:
+            self._menus.clear()
+
+
+#
+# The one the context menu registers with
+#
+payloads = PayloadRegistry()
@@ -0,0 +1,128 @@
+"""
+Working out context menu data ahead of the right click
+"""
+import sys
+import threading
+
+from .executor import executor, Executor
+from .cache import view_caches
+
+
+class ContextPrefetch(object):
+    """
+    Runs a computation for a view in the background a short while after
+    the caret settles, so the work is already done when the user right
+    clicks. Each result is tagged with the view's change_count() at the
+    time it was computed and is never handed out once the buffer moves on.
+
+    ..code::python
+
+        prefetch = ContextPrefetch(compute)
+
+        # In on_selection_modified_async(...)
+        prefetch.schedule(view, row)
+
+        # In on_text_command(...)
+        ready = prefetch.take(view, row)
+        if ready is None:
+            ready = compute(view, row) # The slow way
+    """
+
+    # How long (ms) the caret has to sit still before we start
+    DELAY = 150
+
+    def __init__(self, compute, size=None):
+        """
+        :param compute: callable(view, key) returning the result for key
+        (or None if there's nothing worth keeping)
+        :param size: callable(result) returning an int estimate of its
+        bytes (defaults to sys.getsizeof(), which only sees the container)
+        """
+        self._compute = compute
+        self._size = size or sys.getsizeof
+        self._lock = threading.Lock()
+        self._ready = {}
+        view_caches.register(self)
+
+
+    def schedule(self, view, key):
+        """
+        Compute the result for key once the view has been quiet for DELAY.
+        Anything scheduled (or running) for the view before this is
+        cancelled.
+        :param view: sublime.View
+        :param key: hashable describing what to compute (e.g. a row)
+        :return: None
+        """
+        version = view.change_count()
+        with self._lock:
+            ready = self._ready.get(view.id())
+        if ready is not None and ready[:2] == (version, key):
+            return # Already have it
+
+        executor.submit(
+            self._run, view, key, version,
+            priority=Executor.NORMAL,
+            delay=self.DELAY / 1000.0,
+            key=('prefetch', view.id()),
+            then=lambda value: self._store(view, key, version, value)
+        )
+
+
+    def _run(self, view, key, version):
+        if view.change_count() != version:
+            return None # Already out of date
+        return self._compute(view, key)
+
+
+    def _store(self, view, key, version, value):
+        """
+        Keep a finished result (on the main thread) if the buffer hasn't
+        moved on while we were working
+        """
+        if value is None or view.change_count() != version:
+            return
+
+        with self._lock:
+            self._ready[view.id()] = (version, key, value)
+        view_caches.grew(view.id())
+
+
+    def take(self, view, key):
+        """
+        :param view: sublime.View
+        :param key: The key the caller needs a result for
+        :return: The precomputed result if it was made for key from the
+        current version of the buffer, otherwise None
+        """
+        with self._lock:
+            ready = self._ready.get(view.id())
+
+        if ready is None:
+            view_caches.miss(view.id())
+            return None
+
+        version, ready_key, value = ready
+        if version != view.change_count() or ready_key != key:
+            view_caches.miss(view.id())
+            return None
+
+        view_caches.hit(view.id())
+        return value
+
+
+    def size_of(self, view_id):
+        """
+        :return: int estimate of the bytes we hold for a view
+        """
+        with self._lock:
+            ready = self._ready.get(view_id)
+        return self._size(ready[2]) if ready is not None else 0
+
+
+    def discard(self, view_id):
+        """
+        Drop anything pending or ready for a view
+        """
+        with self._lock:
+            self._ready.pop(view_id, None)
@@ -0,0 +1,188 @@
+"""
+Opt-in timing of the phases of building a context menu
+"""
+import time
+import threading
+
+from collections import deque
+
+from .tokenize import CppTokenizer
+from .trace import tracer
+
+
+class _Phase(object):
+    """
+    Context manager recording one run of a phase
+    """
+    __slots__ = ('_profiler', '_name', '_view', '_start', '_tokens', '_calls')
+
+    def __init__(self, profiler, name, view):
+        self._profiler = profiler
+        self._name = name
+        self._view = view
+
+
+    def __enter__(self):
+        self._tokens = CppTokenizer.tokens_read
+        self._calls = self._view.api_calls if self._view is not None else 0
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        calls = self._view.api_calls - self._calls if self._view is not None else 0
+        if self._profiler.enabled:
+            self._profiler._record(
+                self._name, elapsed, CppTokenizer.tokens_read - self._tokens, calls
+            )
+
+        record = tracer.active()
+        if record is not None:
+            record.add_phase(self._name, elapsed)
+        return False
+
+
+class _Nothing(object):
+    """
+    What phase() hands out when we aren't profiling
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOTHING = _Nothing()
+
+
+class CountingView(object):
+    """
+    Wraps a sublime.View and counts the calls made through it. Everything
+    else is passed straight along.
+    """
+    def __init__(self, view):
+        self._view = view
+        self.api_calls = 0
+
+
+    def __getattr__(self, name):
+        attr = getattr(self._view, name)
+        if not callable(attr):
+            return attr
+
+        def _counted(*args, **kwargs):
+            self.api_calls += 1
+            return attr(*args, **kwargs)
+        return _counted
+
+
+class PhaseProfiler(object):
+    """
+    Rolling wall time, token and API call numbers for each phase of the
+    right click. Nothing is recorded until it's enabled (see the
+    "profile_context_menu" setting). Phases run while a TraceRecord is
+    active are added to it either way.
+
+    ..code::python
+
+        with profiler.phase('current_line', view):
+            ...
+
+        print(profiler.report())
+    """
+    def __init__(self, keep=200):
+        """
+        :param keep: int of how many runs of each phase to hold on to
+        """
+        self._enabled = False
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._phases = {}
+
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+
+    @enabled.setter
+    def enabled(self, value):
+        # The tokenizers only count what they read while someone's looking
+        self._enabled = bool(value)
+        CppTokenizer.count_tokens = self._enabled
+
+
+    def phase(self, name, view=None):
+        """
+        :param name: str of the phase
+        :param view: CountingView to count API calls through (if any)
+        :return: context manager timing the phase
+        """
+        if not self.enabled and tracer.active() is None:
+            return _NOTHING
+        if not isinstance(view, CountingView):
+            view = None
+        return _Phase(self, name, view)
+
+
+    def _record(self, name, elapsed, tokens, calls):
+        with self._lock:
+            runs = self._phases.get(name)
+            if runs is None:
+                runs = self._phases[name] = deque(maxlen=self._keep)
+            runs.append((elapsed, tokens, calls))
+
+
+    def clear(self):
+        with self._lock:
+            self._phases.clear()
+
+
+    def summary(self):
+        """
+        :return: dict mapping each phase to its count, p50, p95 and max (in
+        ms) along with the mean tokens and API calls per run
+        """
+        with self._lock:
+            phases = dict((k, list(v)) for k, v in self._phases.items())
+
+        output = {}
+        for name, runs in phases.items():
+            times = sorted(r[0] for r in runs)
+            count = len(times)
+            output[name] = {
+                'count' : count,
+                'p50_ms' : 1000.0 * times[(count - 1) // 2],
+                'p95_ms' : 1000.0 * times[min(count - 1, int(count * 0.95))],
+                'max_ms' : 1000.0 * times[-1],
+                'tokens' : sum(r[1] for r in runs) / float(count),
+                'api_calls' : sum(r[2] for r in runs) / float(count),
+            }
+        return output
+
+
+    def report(self):
+        """
+        :return: str table of summary() with the slowest (p95) phase first
+        """
+        summary = self.summary()
+        if not summary:
+            return 'No context menu phases recorded yet.\n'
+
+        lines = ['{:48} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'phase', 'runs', 'p50 ms', 'p95 ms', 'max ms', 'tokens', 'api calls'
+        )]
+        ordered = sorted(summary.items(), key=lambda i: -i[1]['p95_ms'])
+        for name, stats in ordered:
+            lines.append('{:48} {:>6} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.0f} {:>10.1f}'.format(
+                name, stats['count'], stats['p50_ms'], stats['p95_ms'],
+                stats['max_ms'], stats['tokens'], stats['api_calls']
+            ))
+        return '\n'.join(lines) + '\n'
+
+
+#
+# The one the plugin records into
+#
+profiler = PhaseProfiler()
@@ -0,0 +1,469 @@
+"""
+Scope tree of the namespaces, classes and structs in a buffer
+"""
+from bisect import bisect_left, bisect_right
+
+from .tokenize import CppTokenizer
+from .snapshot import BufferSnapshot
+from .mask import CommentMask
+
+PROC_TOKENS = ( 'class', 'struct', 'namespace' )
+
+ACCESS_TOKENS = ( 'public', 'protected', 'private' )
+
+#
+# Qt's labels for signals. moc writes their bodies and they're public.
+#
+SIGNAL_TOKENS = ( 'signals', 'Q_SIGNALS' )
+
+
+class AccessSection(object):
+    """
+    An access specifier label within a class or struct body. The section
+    runs from the label up to the next one (or the end of the class).
+
+    - label: The text of the label without the colon ('public',
+      'private slots', 'signals', ...)
+    - head: The start of the label
+    - point: The point just after the colon
+    """
+    __slots__ = ('label', 'head', 'point')
+
+    def __init__(self, label, head, point):
+        self.label = label
+        self.head = head
+        self.point = point
+
+
+    @property
+    def access(self):
+        """
+        :return: str(public|protected|private)
+        """
+        word = self.label.split()[0]
+        return 'public' if word in SIGNAL_TOKENS else word
+
+
+    @property
+    def signals(self):
+        """
+        :return: True if the section declares Qt signals
+        """
+        return self.label.split()[0] in SIGNAL_TOKENS
+
+
+    def __repr__(self):
+        return 'AccessSection({}, {}-{})'.format(
+            self.label, self.head, self.point
+        )
+
+
+class ScopeNode(object):
+    """
+    A single namespace, class or struct along with where it lives in the
+    buffer.
+
+    - head: The start of the class|struct|namespace keyword
+    - open: The start of the opening brace
+    - close: The start of the closing brace (None if never closed)
+    - end: The point just past the terminator (the ';' of a class or
+      struct, the brace of a namespace)
+    - sections: list[AccessSection] of a class or struct body in order
+    """
+    __slots__ = (
+        'kind', 'name', 'head', 'open', 'close', 'end',
+        'parent', 'children', 'sections', '_opens', '_points'
+    )
+
+    def __init__(self, kind, name, head, open_, parent=None):
+        self.kind = kind
+        self.name = name
+        self.head = head
+        self.open = open_
+        self.close = None
+        self.end = None
+        self.parent = parent
+        self.children = []
+        self.sections = []
+        self._opens = None
+        self._points = None
+
+
+    def contains(self, point):
+        """
+        :return: True if point sits between our braces
+        """
+        return self.open < point and (self.close is None or self.close >= point)
+
+
+    def child_at(self, point):
+        """
+        :return: ScopeNode of our direct child containing point or None
+        """
+        if self._opens is None:
+            self._opens = [c.open for c in self.children]
+
+        index = bisect_left(self._opens, point) - 1
+        if index < 0:
+            return None
+
+        child = self.children[index]
+        return child if child.contains(point) else None
+
+
+    def child_headed_at(self, point):
+        """
+        :return: ScopeNode of our direct child whose head (from its keyword
+        up to the opening brace) holds point or None
+        """
+        if self._opens is None:
+            self._opens = [c.open for c in self.children]
+
+        index = bisect_left(self._opens, point)
+        if index < len(self.children) and self.children[index].head <= point:
+            return self.children[index]
+        return None
+
+
+    def section_at(self, point):
+        """
+        :return: AccessSection of our body that point falls under or None
+        if it comes before any label
+        """
+        if self._points is None:
+            self._points = [s.point for s in self.sections]
+
+        index = bisect_right(self._points, point) - 1
+        if index < 0:
+            return None
+        return self.sections[index]
+
+
+    def walk(self):
+        """
+        :return: generator of this node and all below it in document order
+        """
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+
+    def __repr__(self):
+        return 'ScopeNode({}, {}, {}-{})'.format(
+            self.kind, self.name, self.open, self.close
+        )
+
+
+class ScopeTree(object):
+    """
+    Every namespace/class/struct scope in a buffer, built with one pass of
+    the CppTokenizer. Lookups are a bisect per level of nesting rather than
+    a rescan of the file.
+    """
+    def __init__(self, root, snapshot):
+        self._root = root
+        self._snapshot = snapshot
+
+
+    @property
+    def root(self):
+        """
+        :return: ScopeNode spanning the whole buffer (kind and name are None)
+        """
+        return self._root
+
+
+    @property
+    def snapshot(self):
+        """
+        :return: BufferSnapshot the tree was built from
+        """
+        return self._snapshot
+
+
+    @classmethod
+    def for_view(cls, view, snapshot=None):
+        """
+        :param view: sublime.View to get the tree of
+        :param snapshot: BufferSnapshot of the whole view to build from if we
+        don't already have a tree for this version of the buffer
+        :return: ScopeTree
+        """
+        if view is None:
+            return cls.build(snapshot)
+
+        from .incremental import IncrementalIndex
+        return IncrementalIndex.for_view(view, snapshot).tree
+
+
+    @classmethod
+    def build(cls, snapshot, izer=None):
+        """
+        Walk the snapshot once, noting where every proc opens and closes.
+
+        This follows the same rules ownership_chain has always used for
+        picking out names (including the 'final' and inheritance cases)
+        but unnamed scopes are kept so their braces stay balanced.
+
+        :param snapshot: BufferSnapshot of the whole buffer
+        :param izer: CppTokenizer over the snapshot if not the default one
+        :return: ScopeTree
+        """
+        if izer is None:
+            izer = CppTokenizer(
+                None, snapshot=snapshot,
+                mask=CommentMask.build(snapshot.text, snapshot.begin)
+            )
+        root = ScopeNode(None, None, snapshot.begin, snapshot.begin - 1)
+        stack = [root]
+        terminating = None
+
+        # The words (and start) of a possible access label
+        label = None
+        label_head = None
+
+        token = None
+        while True:
+            previous = token
+            token = izer._next()
+            if token is None:
+                # Nothing left
+                break
+
+            if terminating is not None:
+                if token == ';':
+                    terminating.end = izer.current_point()
+                    terminating = None
+                    continue
+
+                if token in ('{', '}') or token in PROC_TOKENS:
+                    # No terminator, the scope stops at the brace
+                    terminating.end = terminating.close + 1
+                    terminating = None
+
+            if (token in ACCESS_TOKENS or token in SIGNAL_TOKENS) \
+                    and stack[-1].kind in ('class', 'struct'):
+                label = [token]
+                label_head = izer.span(izer.mark())[0]
+                continue
+
+            if label is not None:
+                if token == ':':
+                    stack[-1].sections.append(AccessSection(
+                        ' '.join(label), label_head, izer.current_point()
+                    ))
+                    label = None
+                    continue
+
+                if len(label) == 1 and token.isidentifier():
+                    # e.g. 'public slots:'
+                    label.append(token)
+                    continue
+                label = None
+
+            if token in PROC_TOKENS and previous != 'using':
+                head = izer.span(izer.mark())[0]
+                name = None
+                opened = False
+
+                inner_tok = None
+                while True:
+                    #
+                    # Find the proc name
+                    #
+                    prev_tok = inner_tok
+                    inner_tok = izer._next()
+                    if inner_tok is None or inner_tok == ';':
+                        #
+                        # We've hit the EOF or a forward declaration,
+                        # let's skip this all together
+                        #
+                        break
+
+                    if inner_tok == '{':
+                        opened = True
+                        break
+
+                    if inner_tok == ':':
+                        #
+                        # Spin until we get to a scope opener or a
+                        # terminator
+                        #
+                        while True:
+                            lower_tok = izer._next()
+                            if lower_tok is None or lower_tok == ';':
+                                break
+
+                            if lower_tok == '{':
+                                opened = True
+                                break
+                        break
+
+                    #
+                    # Edge case for 'final' decl
+                    #
+                    if inner_tok == 'final':
+                        inner_tok = prev_tok
+
+                    name = inner_tok
+
+                if opened:
+                    parent = stack[-1]
+                    node = ScopeNode(
+                        token, name, head, izer.span(izer.mark())[0], parent
+                    )
+                    parent.children.append(node)
+                    stack.append(node)
+
+            elif token == '}':
+                #
+                # We're at the end of a proc scope
+                #
+                if len(stack) > 1:
+                    node = stack.pop()
+                    node.close = izer.span(izer.mark())[0]
+                    if node.kind == 'namespace':
+                        node.end = node.close + 1
+                    else:
+                        terminating = node
+
+            elif token == '{':
+                #
+                # The start of a scope that isn't tied to a proc
+                #
+                izer.spin_scope()
+
+        if terminating is not None:
+            terminating.end = terminating.close + 1
+
+        return cls(root, snapshot)
+
+
+    def shifted(self, stop, delta, snapshot):
+        """
+        A copy of the tree with every offset at or past stop moved by delta
+        (an edit that didn't change the shape of the tree). We're left as
+        we were for anyone still reading us.
+
+        :param stop: The point the edit ended at (before the edit)
+        :param delta: int change in length of the buffer
+        :param snapshot: BufferSnapshot of the edited buffer
+        :return: ScopeTree
+        """
+        def _move(point):
+            if point is not None and point >= stop:
+                return point + delta
+            return point
+
+        def _copy(node, parent):
+            if node.kind is None:
+                copy = ScopeNode(None, None, node.head, node.open)
+                copy.close = node.close
+                copy.end = node.end
+            else:
+                copy = ScopeNode(
+                    node.kind, node.name, _move(node.head), _move(node.open), parent
+                )
+                copy.close = _move(node.close)
+                copy.end = _move(node.end)
+                copy.sections = [
+                    AccessSection(s.label, s.head, s.point) if s.head < stop
+                    else AccessSection(s.label, s.head + delta, s.point + delta)
+                    for s in node.sections
+                ]
+            copy.children = [_copy(child, copy) for child in node.children]
+            return copy
+
+        return ScopeTree(_copy(self._root, None), snapshot)
+
+
+    def nodes_at(self, point):
+        """
+        :param point: buffer point
+        :return: list[ScopeNode] from the outermost to innermost scope
+        containing point
+        """
+        nodes = []
+        node = self._root.child_at(point)
+        while node is not None:
+            nodes.append(node)
+            node = node.child_at(point)
+        return nodes
+
+
+    def head_at(self, point):
+        """
+        :param point: buffer point
+        :return: ScopeNode whose head (e.g. the "class Name : public Base"
+        before its brace) holds point or None
+        """
+        nodes = self.nodes_at(point)
+        parent = nodes[-1] if nodes else self._root
+        return parent.child_headed_at(point)
+
+
+    def chain_at(self, point):
+        """
+        :param point: buffer point
+        :return: list[list[str(class|struct|namespace), str]] of the named
+        scopes containing point
+        """
+        return [
+            [node.kind, node.name] for node in self.nodes_at(point)
+            if node.name is not None
+        ]
+
+
+    def find(self, kind, name):
+        """
+        :return: The first ScopeNode in the buffer with the kind and name
+        """
+        for node in self._root.walk():
+            if node.kind == kind and node.name == name:
+                return node
+        return None
+
+
+    def access_at(self, point):
+        """
+        :param point: buffer point
+        :return: AccessSection of the innermost class or struct holding
+        point or None if there isn't one (or no label comes before point)
+        """
+        for node in reversed(self.nodes_at(point)):
+            if node.kind in ('class', 'struct'):
+                return node.section_at(point)
+        return None
+
+
+    def signature(self):
+        """
+        :return: list of every node's (kind, name, head, open, close, end,
+        depth, sections) in document order. Handy for comparing two trees.
+        """
+        output = []
+        def _visit(node, depth):
+            output.append((
+                node.kind, node.name, node.head, node.open,
+                node.close, node.end, depth,
+                [(s.label, s.head, s.point) for s in node.sections]
+            ))
+            for child in node.children:
+                _visit(child, depth + 1)
+        _visit(self._root, 0)
+        return output
+
+
+    def line_begin(self, point):
+        """
+        :return: point at the start of the line holding point
+        """
+        return self._snapshot.line_bounds(point)[0]
+
+
+    def line_end(self, point):
+        """
+        :return: point at the end of the line holding point
+        """
+        return self._snapshot.line_bounds(point)[1]
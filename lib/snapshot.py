@@ -0,0 +1,93 @@
+"""
+Plain text copies of a view for parsing without the plugin host
+"""
+
+class BufferSnapshot(object):
+    """
+    A copy of a view's text (or a region of it) taken with a single substr
+    call. The CppTokenizer can walk this in-process rather than asking the
+    plugin host for every line of the file.
+
+    All points given to and returned by the snapshot are buffer points, not
+    indices into the copied text.
+    """
+    def __init__(self, text, begin=0, change_count=None):
+        """
+        :param text: str of the copied text
+        :param begin: The buffer point text starts at
+        :param change_count: The view's change_count() when the text was
+        copied (None when it isn't known)
+        """
+        self._text = text
+        self._begin = begin
+        self._change_count = change_count
+
+
+    @classmethod
+    def from_view(cls, view, begin=0, end=None):
+        """
+        :param view: sublime.View (or StringBuffer) to copy from
+        :param begin: First point to copy
+        :param end: Last point to copy (defaults to the end of the view)
+        :return: BufferSnapshot
+        """
+        from .buffer import make_region
+
+        # Read before the copy, so at worst the text is newer than we say
+        change_count = view.change_count()
+        if end is None:
+            end = view.size()
+        return cls(view.substr(make_region(begin, end)), begin, change_count)
+
+
+    @property
+    def text(self):
+        """
+        :return: str of the copied text
+        """
+        return self._text
+
+
+    @property
+    def change_count(self):
+        """
+        :return: The view's change_count() the text was copied at (or None)
+        """
+        return self._change_count
+
+
+    @property
+    def begin(self):
+        """
+        :return: The buffer point the snapshot starts at
+        """
+        return self._begin
+
+
+    @property
+    def end(self):
+        """
+        :return: The buffer point the snapshot ends at
+        """
+        return self._begin + len(self._text)
+
+
+    def line_bounds(self, point):
+        """
+        :param point: buffer point
+        :return: tuple(begin, end) of the line containing point, clipped to
+        the snapshot. end does not include the newline.
+        """
+        index = min(max(point - self._begin, 0), len(self._text))
+        begin = self._text.rfind('\n', 0, index) + 1
+        end = self._text.find('\n', index)
+        if end == -1:
+            end = len(self._text)
+        return (begin + self._begin, end + self._begin)
+
+
+    def substr(self, begin, end):
+        """
+        :return: str of the text between the two buffer points
+        """
+        return self._text[begin - self._begin:end - self._begin]
@@ -4,6 +4,7 @@ CppToolkit
 
 
 from .tokenize import CppTokenizer
+from .mask import CommentMask
 
 class FunctionState(object):
     """
@@ -67,6 +68,7 @@ class FunctionState(object):
 
         self._lookup_state = self.STATIC_OR_VIRTUAL
         self._complete_string = ''
+        self._impl_region = None
 
 
     @property
@@ -86,6 +88,18 @@ class FunctionState(object):
         return self._impl is not None
 
 
+    @property
+    def impl_region(self):
+        """
+        :return: list[begin, end] of the implementation in the buffer, from
+        the end of the signature through the closing brace. None if we
+        have no (complete) implementation.
+        """
+        if self._impl_region is None or None in self._impl_region:
+            return None
+        return self._impl_region
+
+
     def _resolve(self, token):
         """
         Given a token and the information gathered so far,
@@ -146,6 +160,10 @@ class FunctionState(object):
                 rem_count = 0
                 found_scope = False
 
+                # A trailing const (or = 0) sends us through here again at
+                # the ';', start the arguments over rather than doubling them
+                self._args = []
+
                 for rev_token in self._type_and_name[::-1]:
                     rem_count += 1
 
@@ -237,7 +255,10 @@ class FunctionState(object):
 
     def _from_tokenizer(self, izer):
         """
-        """        
+        Feed the tokens of izer through our states, keeping track of where
+        the implementation (if any) sits in the buffer
+        """
+        code_mark = None
         with izer.include_white_space():
             for token in izer:
                 if not self._resolve(token):
@@ -246,18 +267,42 @@ class FunctionState(object):
                 if self._lookup_state == self.IMPL:
                     izer.temp_no_trim()
 
+                    if self._impl_region is None:
+                        # The impl starts right after the signature
+                        start = izer.span(code_mark)[1] if code_mark else None
+                        self._impl_region = [start, None]
+
+                    elif not self._container.valid and self._impl_region[1] is None:
+                        self._impl_region[1] = izer.current_point()
+
+                elif token.strip():
+                    code_mark = izer.mark()
+
                 self._complete_string += token
 
     @classmethod
     def from_text(cls, view, text):
         state = FunctionState()
-        izer = CppTokenizer(view, use_line=text)
+        izer = CppTokenizer(view, use_line=text, mask=CommentMask.build(text))
         state._from_tokenizer(izer)
         return state
 
     @classmethod
-    def from_position(cls, view, position):
+    def from_position(cls, view, position, snapshot=None):
+        start = view.layout_to_text((0, position[1] + 1))
+        return cls.from_point(view, start, snapshot=snapshot)
+
+    @classmethod
+    def from_point(cls, view, point, snapshot=None):
+        """
+        Parse the function starting at point (normally the start of a line)
+        :param snapshot: BufferSnapshot of the whole view to parse from
+        :return: FunctionState
+        """
         state = FunctionState()
-        izer = CppTokenizer(view, start=position[1] + 1)
+        mask = None
+        if snapshot is not None:
+            mask = CommentMask.for_view(view, snapshot)
+        izer = CppTokenizer(view, point, snapshot=snapshot, mask=mask)
         state._from_tokenizer(izer)
-        return state
\ No newline at end of file
+        return state
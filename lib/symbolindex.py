@@ -0,0 +1,378 @@
+"""
+Project symbol tables stored as fixed width records in a memory mapped file
+"""
+import os
+import sys
+import mmap
+import struct
+import tempfile
+
+from array import array
+from bisect import bisect_left
+
+from .indexer import Symbol
+
+#
+# magic, version, byte order, string count, file count, record count and
+# the size of the string blob
+#
+_HEADER = struct.Struct('<4sHHIIII')
+
+#
+# A file: its path (string id), first record and mtime
+#
+_FILE = struct.Struct('=IId')
+
+#
+# A symbol: kind, access, name and owner (string ids), file, point
+#
+_RECORD = struct.Struct('=BBxxIIII')
+
+_LITTLE = 1
+_BIG = 2
+
+KINDS = ('namespace', 'class', 'struct', 'method', 'function', 'member')
+ACCESS = (None, 'public', 'protected', 'private')
+
+
+def _align(offset):
+    return offset + (-offset % 8)
+
+
+def _layout(strings, files, records, blob):
+    """
+    :return: dict of section name to tuple(offset, size in bytes)
+    """
+    sizes = (
+        ('offsets', 4 * (strings + 1)),
+        ('blob', blob),
+        ('files', _FILE.size * files),
+        ('records', _RECORD.size * records),
+        ('name_starts', 4 * (strings + 1)),
+        ('by_name', 4 * records),
+        ('owner_starts', 4 * (strings + 1)),
+        ('by_owner', 4 * records),
+        ('by_path', 4 * files),
+    )
+    layout = {}
+    offset = _align(_HEADER.size)
+    for name, size in sizes:
+        layout[name] = (offset, size)
+        offset = _align(offset + size)
+    layout['end'] = (offset, 0)
+    return layout
+
+
+def write_symbol_index(path, files):
+    """
+    Write the symbols of many files as a MappedSymbolTable can read them.
+
+    :param path: str of the index file (replaced atomically)
+    :param files: iterable of tuple(str path, float mtime, list[Symbol])
+    :return: int of the bytes written
+    """
+    files = list(files)
+
+    #
+    # Strings are sorted so a name can be found with a binary search, and
+    # their ids line up with that order
+    #
+    unique = set()
+    for file_path, _, symbols in files:
+        unique.add(file_path)
+        for symbol in symbols:
+            unique.add(symbol.name)
+            unique.add(symbol.owner)
+    ordered = sorted(unique)
+    ids = dict((value, index) for index, value in enumerate(ordered))
+
+    offsets = array('I', [0])
+    encoded = []
+    for value in ordered:
+        data = value.encode('utf-8', 'surrogatepass')
+        encoded.append(data)
+        offsets.append(offsets[-1] + len(data))
+    blob = b''.join(encoded)
+
+    file_table = bytearray()
+    record_table = bytearray()
+    names = []
+    owners = []
+    count = 0
+    for index, (file_path, mtime, symbols) in enumerate(files):
+        file_table += _FILE.pack(ids[file_path], count, mtime)
+        for symbol in symbols:
+            record_table += _RECORD.pack(
+                KINDS.index(symbol.kind), ACCESS.index(symbol.access),
+                ids[symbol.name], ids[symbol.owner], index, symbol.point
+            )
+            names.append((ids[symbol.name], count))
+            owners.append((ids[symbol.owner], count))
+            count += 1
+
+    def _grouped(pairs):
+        """
+        :return: tuple(array of where each string's records start, array of
+        record ids grouped by string)
+        """
+        pairs.sort()
+        starts = array('I', [0] * (len(ordered) + 1))
+        for string_id, _ in pairs:
+            starts[string_id + 1] += 1
+        for i in range(len(ordered)):
+            starts[i + 1] += starts[i]
+        return starts, array('I', (record for _, record in pairs))
+
+    name_starts, by_name = _grouped(names)
+    owner_starts, by_owner = _grouped(owners)
+    by_path = array('I', sorted(range(len(files)), key=lambda i: ids[files[i][0]]))
+
+    sections = {
+        'offsets' : offsets.tobytes(),
+        'blob' : blob,
+        'files' : bytes(file_table),
+        'records' : bytes(record_table),
+        'name_starts' : name_starts.tobytes(),
+        'by_name' : by_name.tobytes(),
+        'owner_starts' : owner_starts.tobytes(),
+        'by_owner' : by_owner.tobytes(),
+        'by_path' : by_path.tobytes(),
+    }
+    layout = _layout(len(ordered), len(files), count, len(blob))
+
+    native = _LITTLE if sys.byteorder == 'little' else _BIG
+    directory = os.path.dirname(path) or '.'
+    handle, temp = tempfile.mkstemp(prefix='.index-', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(_HEADER.pack(
+                MappedSymbolTable.MAGIC, MappedSymbolTable.VERSION, native,
+                len(ordered), len(files), count, len(blob)
+            ))
+            for name in sorted(sections, key=lambda n: layout[n][0]):
+                f.write(b'\0' * (layout[name][0] - f.tell()))
+                f.write(sections[name])
+            f.write(b'\0' * (layout['end'][0] - f.tell()))
+            size = f.tell()
+        os.replace(temp, path)
+    except:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return size
+
+
+class MappedSymbolTable(object):
+    """
+    A project's symbols read straight out of a memory mapped index (see
+    write_symbol_index()). Nothing is turned into Python objects until it's
+    asked for, so holding the index of a huge project costs the pages the
+    OS keeps mapped rather than a Symbol per declaration.
+
+    Answers the same questions as SymbolTable.
+
+    ..code::python
+
+        table = MappedSymbolTable(path)
+        for symbol in table.members_of('ns::MyClass'):
+            ...
+        table.close()
+    """
+    MAGIC = b'CTSI'
+
+    # Bump whenever the layout (or what parse_symbols() finds) changes
+    VERSION = 2
+
+    def __init__(self, path):
+        """
+        :param path: str of the index file
+        :raises ValueError: if the file isn't an index we can read
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, order, strings, files, records, blob = \
+                _HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            self._map.close()
+            raise ValueError('Not a symbol index: ' + path)
+
+        native = _LITTLE if sys.byteorder == 'little' else _BIG
+        if magic != self.MAGIC or version != self.VERSION or order != native:
+            self._map.close()
+            raise ValueError('Not a symbol index we can read: ' + path)
+
+        self._counts = (strings, files, records)
+        self._layout = _layout(strings, files, records, blob)
+        self._views = []
+
+        self._offsets = self._ints('offsets')
+        self._name_starts = self._ints('name_starts')
+        self._by_name = self._ints('by_name')
+        self._owner_starts = self._ints('owner_starts')
+        self._by_owner = self._ints('by_owner')
+        self._by_path = self._ints('by_path')
+
+
+    def _ints(self, section):
+        """
+        :return: memoryview of a section as unsigned ints (no copy)
+        """
+        offset, size = self._layout[section]
+        view = memoryview(self._map)[offset:offset + size].cast('I')
+        self._views.append(view)
+        return view
+
+
+    def close(self):
+        """
+        Unmap the index
+        """
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._map.close()
+
+
+    def __len__(self):
+        return self._counts[2]
+
+
+    def _string(self, string_id):
+        start = self._layout['blob'][0]
+        return self._map[
+            start + self._offsets[string_id]:start + self._offsets[string_id + 1]
+        ].decode('utf-8', 'surrogatepass')
+
+
+    def _string_id(self, value):
+        """
+        :return: int id of value in the string table or None
+        """
+        strings = self._counts[0]
+        lo, hi = 0, strings
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < strings and self._string(lo) == value:
+            return lo
+        return None
+
+
+    def _file(self, index):
+        """
+        :return: tuple(path string id, first record, mtime)
+        """
+        return _FILE.unpack_from(
+            self._map, self._layout['files'][0] + index * _FILE.size
+        )
+
+
+    def _symbol(self, record):
+        kind, access, name, owner, index, point = _RECORD.unpack_from(
+            self._map, self._layout['records'][0] + record * _RECORD.size
+        )
+        return Symbol(
+            KINDS[kind], self._string(name), self._string(owner),
+            ACCESS[access], self._string(self._file(index)[0]), point
+        )
+
+
+    def _grouped(self, starts, grouped, value):
+        string_id = self._string_id(value)
+        if string_id is None:
+            return []
+        return [
+            self._symbol(record)
+            for record in grouped[starts[string_id]:starts[string_id + 1]]
+        ]
+
+
+    def _file_index(self, path):
+        """
+        :return: int index of path in the file table or None
+        """
+        string_id = self._string_id(path)
+        if string_id is None:
+            return None
+
+        keys = [self._file(i)[0] for i in self._by_path] \
+            if self._counts[1] < 64 else _FileKeys(self)
+        position = bisect_left(keys, string_id)
+        if position < self._counts[1] and self._file(self._by_path[position])[0] == string_id:
+            return self._by_path[position]
+        return None
+
+
+    def files(self):
+        """
+        :return: list of the files in the table
+        """
+        return [self._string(self._file(i)[0]) for i in range(self._counts[1])]
+
+
+    def mtime_of(self, path):
+        """
+        :return: float mtime the file had when it was indexed (or None)
+        """
+        index = self._file_index(path)
+        return None if index is None else self._file(index)[2]
+
+
+    def named(self, name):
+        """
+        :return: list[Symbol] with the (unqualified) name
+        """
+        return self._grouped(self._name_starts, self._by_name, name)
+
+
+    def members_of(self, owner):
+        """
+        :param owner: str of a qualified name ('ns::MyClass')
+        :return: list[Symbol] that belong directly to it
+        """
+        return self._grouped(self._owner_starts, self._by_owner, owner)
+
+
+    def find(self, qualified):
+        """
+        :param qualified: str like 'ns::MyClass::getX'
+        :return: list[Symbol] with that exact qualified name
+        """
+        owner, _, name = qualified.rpartition('::')
+        return [s for s in self.named(name) if s.owner == owner]
+
+
+    def in_file(self, path):
+        """
+        :return: list[Symbol] of the file in document order
+        """
+        index = self._file_index(path)
+        if index is None:
+            return []
+
+        first = self._file(index)[1]
+        last = self._file(index + 1)[1] if index + 1 < self._counts[1] else self._counts[2]
+        return [self._symbol(record) for record in range(first, last)]
+
+
+class _FileKeys(object):
+    """
+    The path string ids of the files in path order, read on demand so
+    bisect doesn't need them all
+    """
+    def __init__(self, table):
+        self._table = table
+
+
+    def __len__(self):
+        return self._table._counts[1]
+
+
+    def __getitem__(self, position):
+        return self._table._file(self._table._by_path[position])[0]
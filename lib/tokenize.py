@@ -4,31 +4,164 @@ import os
 import json
 from contextlib import contextmanager
 
+from .mask import CommentMask
+from .snapshot import BufferSnapshot
+from .executor import check_cancelled
+
+DELIMITS = ( '*', '=', '<', '>', '{', '}', '\'', '\"', '(', ')', ';', ':', ' ', '\n', '\t' )
+
+WHITE_SPACE = ( ' ', '\n', '\t' )
+
+
+def _build_lexer(singles):
+    """
+    Compile the master expression for a single pass over a line.
+
+    Comment markers are always their own token, every character in singles
+    is its own token and runs of anything that isn't a delimiter make up a
+    word. Delimiters that aren't in singles (whitespace when we skip it) are
+    never matched so findall() passes right over them.
+    """
+    delimits = ''.join(re.escape(d) for d in DELIMITS)
+    return re.compile(
+        r'/\*|\*/|[{singles}]|(?://|[^{delimits}/]+|/(?!\*))+'.format(
+            singles=''.join(re.escape(d) for d in singles),
+            delimits=delimits
+        )
+    )
+
+
+_WS_LEXER = _build_lexer(DELIMITS)
+_LEXER = _build_lexer([d for d in DELIMITS if d not in WHITE_SPACE])
+
+
+class Token(object):
+    """
+    A token along with where it lives in the buffer. The tokenizer itself
+    hands out plain strings for speed, these are only built on request
+    through CppTokenizer.last_token()
+    """
+    __slots__ = ('kind', 'text', 'start', 'end')
+
+    WORD          = 0
+    DELIMIT       = 1
+    WHITE_SPACE   = 2
+    COMMENT_OPEN  = 3
+    COMMENT_CLOSE = 4
+    STRING        = 5
+
+    def __init__(self, kind, text, start, end):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+
+
+    @classmethod
+    def kind_of(cls, text):
+        """
+        :param text: str of a token produced by the lexer
+        :return: int kind of token
+        """
+        if text == '/*':
+            return cls.COMMENT_OPEN
+        if text == '*/':
+            return cls.COMMENT_CLOSE
+        if len(text) > 1 and text[0] in ('\'', '"'):
+            return cls.STRING
+        if text in WHITE_SPACE:
+            return cls.WHITE_SPACE
+        if text in DELIMITS:
+            return cls.DELIMIT
+        return cls.WORD
+
+
+    def __repr__(self):
+        return 'Token({}, {!r}, {}, {})'.format(
+            self.kind, self.text, self.start, self.end
+        )
+
+
+class _LineState(object):
+    """
+    Everything we need to recover the offsets of a lexed line's tokens
+    after the fact. Only made once someone asks for a mark() on the line.
+    """
+    __slots__ = ('line', 'begin', 'trim', 'skip', 'count', 'spans')
+
+    def __init__(self, line, begin, trim, skip, count, spans=None):
+        self.line = line
+        self.begin = begin
+        self.trim = trim
+        self.skip = skip
+        self.count = count
+        self.spans = spans
+
+
 class CppTokenizer(object):
     """
     Utility for building tokens of C++ files. This is by no means complete
     but forgoes a lot of the nitty gritty to be lean and fast 
     """
-    DELIMITS = ( '*', '=', '<', '>', '{', '}', '\'', '\"', '(', ')', ';', ':', ' ', '\n', '\t' )
+    DELIMITS = DELIMITS
+
+    # Tokens of every line any tokenizer has read, only counted while
+    # count_tokens is on (the PhaseProfiler turns it on)
+    tokens_read = 0
+    count_tokens = False
 
-    def __init__(self, view, start=0, end=None, use_line=None):
+    # How many lines we lex between checks for a cancelled background job
+    CANCEL_EVERY = 0x3ff
+
+    def __init__(self, view, start=0, end=None, use_line=None, snapshot=None,
+                 mask=None):
         self._view = view
+        self._snapshot = snapshot
+        self._mask = mask
         self._current = start
-        if end:
-            self._end = end - self._view.line_height()
-        elif self._view:
-            self._end = self._view.layout_extent()[1]
+        if snapshot is None and view is not None and use_line is None:
+            #
+            # Copy what we'll walk in one go rather than stepping through
+            # the view a line at a time
+            #
+            snapshot = BufferSnapshot.from_view(view, start, end)
+            self._snapshot = snapshot
+
+        if snapshot is not None:
+            # start and end are buffer points
+            self._current = max(start, snapshot.begin)
+            self._end = snapshot.end if end is None else min(end, snapshot.end)
         self._use_line = use_line
+        self._no_more = False
+        self._lines_read = 0
         self._current_tokens = None
         self._skip_whitespace = True
         self._trim = True
 
+        # Offset tracking (see mark())
+        self._line_begin = 0
+        self._line_info = None
+        self._line_spans = None
+        self._last_info = None
+        self._last_left = 0
+        self._mark_info = None
+        self._mark_state = None
+
 
     def __iter__(self):
         return self
 
 
     def __next__(self):
+        # The common case inlined, a token of the current line that isn't
+        # a comment. Anything else goes through _next().
+        tokens = self._current_tokens
+        if tokens and (tokens[-1][0] != '/' or self._mask is not None):
+            token = tokens.pop()
+            self._last_info = self._line_info
+            self._last_left = len(tokens)
+            return token
+
         d = self._next()
         if d is not None:
             return d
@@ -43,11 +176,24 @@ class CppTokenizer(object):
         self._trim = True
 
 
-    def _context_line(self, pos: (int, float)):
+    def _read_line(self):
         """
-        Get the line of text from our current view based on a position
+        :return: str of the next line to tokenize or None once we've reached
+        the end of our range
         """
-        return self._view.substr(self._view.line(self._view.layout_to_text((0, pos))))        
+        if self._snapshot is None or self._current >= self._end:
+            return None
+
+        text = self._snapshot.text
+        base = self._snapshot.begin
+        stop = text.find('\n', self._current - base, self._end - base)
+        if stop == -1:
+            stop = self._end - base
+
+        line = text[self._current - base:stop]
+        self._line_begin = self._current
+        self._current = base + stop + 1
+        return line
 
 
     def temp_no_trim(self):
@@ -57,118 +203,262 @@ class CppTokenizer(object):
         self._trim = False
 
 
-    def _get_tokens(self, line: str) -> list:
+    @staticmethod
+    def lex(line, trim=True, skip_whitespace=True):
         """
-        Search for additional items to break up our tokens by
+        Break a single line into tokens
+        :param line: str without its newline
+        :param trim: Strip the line first, otherwise a newline is added
+        :param skip_whitespace: Drop whitespace tokens
+        :return: list[str]
         """
-        tokens = []
-        current = ''
-
-        previous = None
-        if self._trim:
+        if trim:
             line = line.strip()
         else:
             line = line + '\n'
-        spin = 0
 
-        for i, char in enumerate(line):
-            if spin > 0:
-                spin -= 1
-                continue
+        if skip_whitespace:
+            return _LEXER.findall(line)
+        return _WS_LEXER.findall(line)
 
-            if char == '*' and previous == '/':
-                # -- multi-line comment
-                tokens.append('/*')
-                continue
 
-            if char == '*' and (i + 1 < len(line)) and line[i+1] == '/':
-                tokens.append('*/')
-                spin = 1
-                continue
+    @staticmethod
+    def lex_masked(line, begin, ranges, trim=True, skip_whitespace=True):
+        """
+        Break a single line into tokens around the comments and literals a
+        CommentMask found on it. Comments are left out entirely and string
+        or character literals come back as a single token.
+
+        :param line: str without its newline
+        :param begin: The point line starts at
+        :param ranges: list[tuple(start, end, kind)] from CommentMask.ranges()
+        :param trim: Strip the line first, otherwise a newline is added
+        :param skip_whitespace: Drop whitespace tokens
+        :return: tuple(list[str], list[tuple(start, end)]) of the tokens and
+        their offsets into line
+        """
+        lexer = _LEXER if skip_whitespace else _WS_LEXER
+        if trim:
+            lo = len(line) - len(line.lstrip())
+            hi = len(line.rstrip())
+        else:
+            lo, hi = 0, len(line)
 
-            if char not in CppTokenizer.DELIMITS:
-                current += char
-            else:
-                if current:
-                    tokens.append(current)
-                current = ''
-                if self._skip_whitespace:
-                    if char not in ('\n', '\t'):
-                        tokens.append(char)
-                else:
-                    tokens.append(char)
-            previous = char
+        tokens = []
+        spans = []
+
+        def _code(pos, endpos):
+            for match in lexer.finditer(line, pos, endpos):
+                tokens.append(match.group())
+                spans.append(match.span())
+
+        pos = lo
+        for start, end, kind in ranges:
+            start = max(start - begin, lo)
+            end = min(end - begin, hi)
+            if start > pos:
+                _code(pos, start)
+
+            if kind != CommentMask.COMMENT and end > start:
+                tokens.append(line[start:end])
+                spans.append((start, end))
+            pos = max(pos, end)
+
+        if pos < hi:
+            _code(pos, hi)
+
+        if not trim and not skip_whitespace:
+            tokens.append('\n')
+            spans.append((len(line), len(line) + 1))
+
+        return tokens, spans
 
-        if current:
-            tokens.append(current)
 
-        return tokens
+    def _get_tokens(self, line: str) -> list:
+        """
+        Search for additional items to break up our tokens by
+        """
+        self._line_spans = None
+        if self._mask is not None:
+            ranges = self._mask.ranges(
+                self._line_begin, self._line_begin + len(line)
+            )
+            if ranges:
+                tokens, self._line_spans = self.lex_masked(
+                    line, self._line_begin, ranges,
+                    self._trim, self._skip_whitespace
+                )
+                return tokens
+        return self.lex(line, self._trim, self._skip_whitespace)
 
 
     def _next(self, **kwargs):
         """
         Rather than host the whole buffer in one shot, we just get a
-        line at a time and keep requesting it until we're done
+        line at a time and keep requesting it until we're done. When we
+        have a snapshot the lines come from that instead of the view.
         """
-        # Grab a token list
-        while (self._current_tokens in (None, [])):
+        in_comment = kwargs.get('in_comment')
 
-            if hasattr(self, '_no_more'):
-                return None
+        while True:
+            # Grab a token list
+            while not self._current_tokens:
 
-            if self._use_line is not None:
-                self._current_tokens = self._get_tokens(self._use_line)
-                self._use_line = None # nomnom!
-                self._no_more = True
-            else:
-                if self._current > self._end:
-                    # We've made it where we wanted to go
-                    self._current_tokens = None
+                if self._no_more:
                     return None
 
-                toks = self._get_tokens(self._context_line(self._current))
-                self._current += self._view.line_height()
-                if toks:
-                    self._current_tokens = toks
-                    break
-
-        # The active token awaits!
-        current_token = self._current_tokens.pop(0)
-
-        if kwargs.get('in_comment'):
-            return current_token # comments don't validate
-
-        if current_token in ('', ' ') and self._skip_whitespace:
-            return self._next() # Keep going
-
-        # Basic Validation
-        if current_token.startswith('//'):
-            # Line comment, skip the rest of the line
-            self.skip_line()
-            return self._next()
-
-        if current_token.startswith('/*'):
-            # We have a inner comment, just
-            # spin until we're out of tokens or
-            # we hit the other side of the comment
-            while True:
-                tok = self._next(in_comment=True)
-                if tok is None:
-                    return None
+                if self._use_line is not None:
+                    line = self._use_line
+                    self._use_line = None # nomnom!
+                    self._no_more = True
+                else:
+                    line = self._read_line()
+                    if line is None:
+                        # We've made it where we wanted to go
+                        self._current_tokens = None
+                        return None
+
+                # Background jobs stop here once they're cancelled
+                self._lines_read += 1
+                if not self._lines_read & self.CANCEL_EVERY:
+                    check_cancelled()
+
+                toks = self._get_tokens(line)
+                if CppTokenizer.count_tokens:
+                    CppTokenizer.tokens_read += len(toks)
+                # What mark() needs to make a _LineState (masked lines
+                # know their offsets up front)
+                self._line_info = (
+                    line, self._line_begin, self._trim,
+                    self._skip_whitespace, len(toks), self._line_spans
+                )
+
+                # Reversed so we can pop from the end
+                toks.reverse()
+                self._current_tokens = toks
+
+            # The active token awaits!
+            current_token = self._current_tokens.pop()
+            self._last_info = self._line_info
+            self._last_left = len(self._current_tokens)
+
+            if in_comment or current_token[0] != '/' or self._mask is not None:
+                # Comments don't validate and nothing else that
+                # isn't a comment needs to (the lexer never hands
+                # us empty tokens or skipped whitespace). With a mask
+                # the comments are already gone.
+                return current_token
+
+            # Basic Validation
+            if current_token.startswith('//'):
+                # Line comment, skip the rest of the line
+                self.skip_line()
+                continue
+
+            if current_token.startswith('/*'):
+                # We have a inner comment, just
+                # spin until we're out of tokens or
+                # we hit the other side of the comment
+                while True:
+                    tok = self._next(in_comment=True)
+                    if tok is None:
+                        return None
+
+                    if tok.endswith('*/'):
+                        # We've hit the end of the comment so whatever comes
+                        # next should be the right bit
+                        break
+                continue
+
+            return current_token
+
+    def mark(self):
+        """
+        A cheap handle on the last token we handed out. Use span() to
+        turn it into offsets only when they're actually needed.
+        :return: tuple or None if we haven't produced a token yet
+        """
+        info = self._last_info
+        if info is None:
+            return None
+
+        # One state per line, so its spans are only worked out once
+        if self._mark_info is not info:
+            self._mark_info = info
+            self._mark_state = _LineState(*info)
+        return (self._mark_state, self._last_left)
+
+
+    def span(self, mark):
+        """
+        :param mark: A handle from mark()
+        :return: tuple(start, end) buffer points of the marked token. With
+        use_line these are offsets into that line instead.
+        """
+        state, left = mark
+        if state.spans is None:
+            line = state.line
+            if state.trim:
+                lead = len(line) - len(line.lstrip())
+                line = line.strip()
+            else:
+                lead = 0
+                line = line + '\n'
+
+            lexer = _LEXER if state.skip else _WS_LEXER
+            state.spans = [
+                (lead + m.start(), lead + m.end()) for m in lexer.finditer(line)
+            ]
+
+        start, end = state.spans[state.count - 1 - left]
+        return (state.begin + start, state.begin + end)
+
+
+    def last_token(self):
+        """
+        :return: Token for the last token we handed out or None
+        """
+        mark = self.mark()
+        if mark is None:
+            return None
+
+        start, end = self.span(mark)
+        state = mark[0]
+        if end - state.begin > len(state.line):
+            text = '\n' # The newline we add when not trimming
+        else:
+            text = state.line[start - state.begin:end - state.begin]
+        return Token(Token.kind_of(text), text, start, end)
+
+
+    def line_end(self, point):
+        """
+        :param point: buffer point
+        :return: point at the end of the line containing point
+        """
+        if self._snapshot is not None:
+            return self._snapshot.line_bounds(point)[1]
+        return self._view.line(point).end()
 
-                if tok.endswith('*/'):
-                    # We've hit the end of the comment so whatever comes
-                    # next should be the right bit
-                    return self._next()
 
-        return current_token
+    def next_token(self):
+        """
+        :return: Token for the next token or None when we're out
+        """
+        if self._next() is None:
+            return None
+        return self.last_token()
+
 
     def current_point(self):
         """
-        :return: sublime point that dictates where in the file we are
+        :return: sublime point just after the last token we handed out or
+        None if we haven't produced one yet
         """
-        # FIXME: Need a better understanding of X column
-        return self._view.layout_to_text((10000, self._current))
+        mark = self.mark()
+        if mark is None:
+            return None
+        return self.span(mark)[1]
 
     def skip_line(self):
         """
@@ -203,165 +493,46 @@ class CppTokenizer(object):
         return
 
     @classmethod
-    def ownership_chain(cls, view, at_location):
+    def ownership_chain(cls, view, at_location, snapshot=None):
         """
         Build the ownership chain of the currently selected item by
         identifying the scope we fall into
+        :param at_location: tuple(x, y) layout position
+        :param snapshot: BufferSnapshot of the whole view to build the
+        ScopeTree from if it isn't cached yet
         :return: list[list[str(class|struct|namespace), str]]
         """
-        proc_tokens = ( 'class', 'struct', 'namespace' )
-        izer = cls(view, 0, at_location[1])
-
-        chain = []
-        active_proc = []
-
-        token = None
-        while True:
-            previous = token
-            token = izer._next()
-            if token is None:
-                # Nothing left
-                break
-
-            if token in proc_tokens and previous != 'using':
-
-                if active_proc:
-                    chain.append(active_proc)
-
-                active_proc = [token, None]
-                inner_tok = None
-                while True:
-                    #
-                    # Find the proc name
-                    #
-                    prev_tok = inner_tok
-                    inner_tok = izer._next()
-                    if inner_tok is None or inner_tok.endswith(';'):
-                        #
-                        # We've hit the EOF or a forward declaration,
-                        # let's skip this all together
-                        #
-                        active_proc[1] = None
-                        break;
-
-                    if inner_tok == '{':
-                        #
-                        # We should have found it
-                        #
-                        break
-
-                    if inner_tok == ':':
-                        #
-                        # We have to spin the token until we get to a scope
-                        # opener or a terminator
-                        #
-                        while True:
-                            lower_tok = izer._next()
-                            if lower_tok is None:
-                                active_proc[1] = None
-                                failed = True
-                                break
-
-                            if '{' in lower_tok or ';' in lower_tok:
-                                # We've found the opening to the class
-                                # and we can let the rest of the process
-                                # take place
-                                break
-                        break
+        return cls.ownership_chain_at(
+            view, view.layout_to_text(at_location), snapshot
+        )
 
-                    #
-                    # Edge case for 'final' decl
-                    #
-                    if inner_tok == 'final':
-                        inner_tok = prev_tok
-
-                    active_proc = [token, inner_tok]
-
-                if active_proc[1] is None:
-                    # We don't have a class defined
-                    if chain:
-                        active_proc = chain.pop()
-                    else:
-                        active_proc = []
-
-            elif '}' in token:
-                #
-                # We're at the end of a proc scope
-                #
-                if chain:
-                    active_proc = chain.pop()
-                else:
-                    active_proc = []
 
-            elif token == '{':
-                #
-                # The start of a scope that isn't tied to a proc
-                #
-                izer.spin_scope()
+    @classmethod
+    def ownership_chain_at(cls, view, point, snapshot=None):
+        """
+        ownership_chain() for a buffer point
+        :return: list[list[str(class|struct|namespace), str]]
+        """
+        from .scope import ScopeTree
+        tree = ScopeTree.for_view(view, snapshot)
 
-        return (chain + ([active_proc] if active_proc else []))
+        # Anything opened on our own line doesn't count
+        return tree.chain_at(tree.line_begin(point))
 
 
     @classmethod
-    def location_outside(cls, view, root_ownership):
+    def location_outside(cls, view, root_ownership, snapshot=None):
         """
+        :param snapshot: BufferSnapshot of the whole view to build the
+        ScopeTree from if it isn't cached yet
         :return: point - location outside of the ending scope of our class, struct,
         or namespace
         """
-        izer = cls(view)
-
-        found_proc = False
-        scope_count = 0
-
-        while True:
-            token = izer._next()
-            if token is None:
-                break # Nothing left
-
-            if not found_proc and token == root_ownership[0]:
-                #
-                # We have the right type, now we just need to check if we have the
-                # right name
-                #
-                while True:
-                    inner_tok = izer._next()
-                    if inner_tok is None or inner_tok.endswith(';'):
-                        found_proc = False
-                        break # Not the right one
-
-                    if inner_tok == root_ownership[1]:
-                        #
-                        # We have the proc name, but we still have to make sure
-                        # this isn't a forward declare
-                        #
-                        found_proc = True
-
-                    if inner_tok == '{':
-                        #
-                        # If, by this point, we have found the item, it means
-                        # we're in it's scope, we now just work until we exit
-                        # said scope
-                        #
-                        # However if we haven't found the item, it means we're
-                        # looking at another item
-                        #
-                        break
-
-            if found_proc:
-                #
-                # Now that we know about our type, we need to keep moving until
-                # we find the end of it's scope
-                #
-                if token == '{':
-                    scope_count += 1
-                if token == '}':
-                    if scope_count == 0:
-                        # We've made it!
-                        if root_ownership[0] != 'namespace':
-                            izer.spin_until(';') # Get passed the terminator
-                        return izer.current_point()
-                    else:
-                        scope_count -= 1
-
-        # We couldn't find the end of that scope
-        return None
\ No newline at end of file
+        from .scope import ScopeTree
+        tree = ScopeTree.for_view(view, snapshot)
+
+        node = tree.find(*root_ownership)
+        if node is None or node.end is None:
+            # We couldn't find the end of that scope
+            return None
+        return tree.line_end(node.end)
@@ -0,0 +1,198 @@
+"""
+Structured trace of command runs and menu builds kept on disk
+"""
+import os
+import json
+import time
+import functools
+import threading
+
+
+class TraceRecord(object):
+    """
+    One command run or menu build. Phases timed (see PhaseProfiler.phase)
+    while the record is active on this thread are added to it.
+    """
+    def __init__(self, event, view):
+        self.event = event
+        self.phases = {}
+        self.outcome = 'ok'
+        self.file = None
+        self.size = None
+        self.lines = None
+        if view is not None:
+            self.file = view.file_name()
+            self.size = view.size()
+            self.lines = view.rowcol(self.size)[0] + 1
+
+
+    def add_phase(self, name, elapsed):
+        self.phases[name] = self.phases.get(name, 0.0) + 1000.0 * elapsed
+
+
+    def to_json(self, duration):
+        return {
+            'time' : time.time(),
+            'event' : self.event,
+            'file' : self.file,
+            'size' : self.size,
+            'lines' : self.lines,
+            'duration_ms' : 1000.0 * duration,
+            'phases' : self.phases,
+            'outcome' : self.outcome
+        }
+
+
+class TraceLog(object):
+    """
+    Appends a JSON line per traced event to trace.jsonl in the plugin's
+    cache directory when the "trace_commands" setting is on. Once the file
+    passes MAX_BYTES it's rotated (trace.1.jsonl, trace.2.jsonl, ...),
+    keeping KEEP old files. tools/analyze_trace.py reads them back.
+
+    ..code::python
+
+        with tracer.record('menu', view) as record:
+            ...
+            record.outcome = 'empty'
+    """
+    FILE_NAME = 'trace.jsonl'
+    MAX_BYTES = 2 * 1024 * 1024
+    KEEP = 3
+
+    def __init__(self, directory=None):
+        """
+        :param directory: Where the trace lives (defaults to the plugin's
+        cache path)
+        """
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+    @property
+    def enabled(self):
+        try:
+            import sublime
+        except ImportError:
+            return self._directory is not None
+
+        settings = sublime.load_settings('CppToolkit.sublime-settings')
+        return bool(settings.get('trace_commands', False))
+
+
+    @property
+    def path(self):
+        """
+        :return: Path to the current trace file
+        """
+        directory = self._directory
+        if directory is None:
+            from .utils import _cache_path
+            directory = _cache_path()
+        return os.path.join(directory, self.FILE_NAME)
+
+
+    def active(self):
+        """
+        :return: TraceRecord being built on this thread or None
+        """
+        return getattr(self._local, 'record', None)
+
+
+    def record(self, event, view=None):
+        """
+        :param event: str naming what we're tracing
+        :param view: sublime.View the event is working on (if any)
+        :return: context manager handing out the TraceRecord (None when
+        tracing is off)
+        """
+        if not self.enabled or self.active() is not None:
+            # Off, or already inside a traced event
+            return _Untraced()
+        return _Traced(self, TraceRecord(event, view))
+
+
+    def write(self, entry):
+        """
+        Append an entry to the trace, rotating if it's grown too large
+        :param entry: dict that can go to JSON
+        :return: None
+        """
+        line = json.dumps(entry, sort_keys=True) + '\n'
+        path = self.path
+        with self._lock:
+            try:
+                if os.path.getsize(path) + len(line) > self.MAX_BYTES:
+                    self._rotate(path)
+            except OSError:
+                pass # No trace yet
+
+            with open(path, 'a') as f:
+                f.write(line)
+
+
+    def _rotate(self, path):
+        base, ext = os.path.splitext(path)
+        for index in range(self.KEEP - 1, 0, -1):
+            older = '{}.{}{}'.format(base, index, ext)
+            if os.path.isfile(older):
+                os.replace(older, '{}.{}{}'.format(base, index + 1, ext))
+        os.replace(path, '{}.1{}'.format(base, ext))
+
+
+class _Untraced(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Traced(object):
+    def __init__(self, log, record):
+        self._log = log
+        self._record = record
+
+
+    def __enter__(self):
+        self._log._local.record = self._record
+        self._start = time.perf_counter()
+        return self._record
+
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        self._log._local.record = None
+
+        if exc_type is not None:
+            self._record.outcome = 'error: ' + exc_type.__name__
+        try:
+            self._log.write(self._record.to_json(duration))
+        except (OSError, IOError):
+            pass # Never let the trace get in the way
+        return False
+
+
+def traced(event):
+    """
+    Decorator tracing a command's run(). The view is the command's own or
+    the window's active one.
+    """
+    def _decorate(run):
+        @functools.wraps(run)
+        def _run(self, *args, **kwargs):
+            view = getattr(self, 'view', None)
+            if view is None and getattr(self, 'window', None) is not None:
+                view = self.window.active_view()
+
+            with tracer.record(event, view):
+                return run(self, *args, **kwargs)
+        return _run
+    return _decorate
+
+
+#
+# The one the plugin writes to
+#
+tracer = TraceLog()
@@ -6,8 +6,32 @@ import json
 
 from .tokenize import CppTokenizer
 from .details import CppRefactorDetails
+from .analysis import CppRefactorAnalysis
+from .analysis import MEMBER_WITH_DEFAULT, MEMBER_NO_DEFAULT
 from .meta import _BaseCppRefactorMeta
 from .state import FunctionState
+from .snapshot import BufferSnapshot
+from .mask import CommentMask
+from .lines import LineTable
+from .scope import ScopeTree
+from .cache import ViewCache, ViewCacheManager, view_caches
+from .incremental import IncrementalIndex
+from .prefetch import ContextPrefetch
+from .buffer import StringBuffer, FileBuffer
+from .profiler import profiler, CountingView
+from .trace import tracer, traced, TraceLog
+from .dispatch import dispatcher, LoadDispatcher
+from .executor import executor, Executor, CancelToken, Cancelled
+from .executor import check_cancelled, run_on_main
+from .payload import payloads, PayloadRegistry
+from .menu import menu_writer, MenuWriter
+from .pairs import pairs, PairIndex, ProjectPairs
+from .indexer import project_symbols, ProjectIndexer, SymbolTable, Symbol
+from .indexer import parse_symbols
+from .parsecache import parse_cache, ParseCache
+from .symbolindex import MappedSymbolTable, write_symbol_index
+from .extract import extract_class, extract_definitions, Declaration
+from .extract import argument_types, scoped_types
 
 def _cache_path():
     import sublime
@@ -15,8 +39,9 @@ def _cache_path():
 
 
 def _write_menu(menu):
-    import sublime
-    menu_path = os.path.join(_cache_path(), "Context.sublime-menu")
-    with open(menu_path, "w+") as cache:
-        cache.write(json.dumps(menu, cache))
+    """
+    Write the context menu unless it's already what's on disk
+    :return: True if the file was written
+    """
+    return menu_writer.write(menu)
 
@@ -0,0 +1,129 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.buffer import StringBuffer
+from lib.cache import ViewCache, ViewCacheManager
+from lib.incremental import IncrementalIndex
+from lib.snapshot import BufferSnapshot
+
+TEXT = """class Widget
+{
+public:
+    int size() const;
+};
+"""
+
+
+class ViewCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ViewCacheManager(budget=1024 * 1024)
+        self.cache = ViewCache(size=lambda value: 100, manager=self.manager)
+
+
+    def test_hit_and_miss(self):
+        view = StringBuffer(TEXT)
+        built = []
+        build = lambda: built.append(1) or len(built)
+
+        self.assertEqual(self.cache.get(view, build), 1)
+        self.assertEqual(self.cache.get(view, build), 1)
+        self.assertEqual((self.manager.misses, self.manager.hits), (1, 1))
+
+        view.insert(None, 0, '\n')
+        self.assertIsNone(self.cache.peek(view))
+        self.assertEqual(self.cache.get(view, build, lambda old: old + 10), 11)
+        self.assertEqual(self.cache.peek(view), 11)
+
+
+    def test_keyed_on_the_snapshot_version(self):
+        view = StringBuffer(TEXT)
+        old = BufferSnapshot.from_view(view)
+        view.insert(None, view.size(), 'struct Extra {};\n')
+        new = BufferSnapshot.from_view(view)
+        self.assertEqual(old.change_count + 1, new.change_count)
+
+        # Built from the old copy, so it's kept as the old version
+        stale = self.cache.get(view, lambda: old.text, version=old.change_count)
+        self.assertEqual(stale, TEXT)
+        self.assertIsNone(self.cache.peek(view))
+
+        current = self.cache.get(view, lambda: new.text, lambda _: new.text,
+                                 version=new.change_count)
+        self.assertEqual(current, new.text)
+
+        # An older copy doesn't wind the entry back
+        again = self.cache.get(view, lambda: old.text, lambda _: old.text,
+                               version=old.change_count)
+        self.assertEqual(again, TEXT)
+        self.assertEqual(self.cache.peek(view), new.text)
+
+
+    def test_index_from_an_old_snapshot(self):
+        view = StringBuffer(TEXT)
+        old = BufferSnapshot.from_view(view)
+        view.insert(None, 0, '// moved\n')
+
+        index = IncrementalIndex.for_view(view, old)
+        self.assertEqual(index.text, TEXT)
+
+        index = IncrementalIndex.for_view(view)
+        self.assertEqual(index.text, BufferSnapshot.from_view(view).text)
+        self.assertTrue(index.verify())
+
+
+    def test_updates_once_across_threads(self):
+        view = StringBuffer(TEXT)
+        self.cache.get(view, lambda: 0)
+        view.insert(None, 0, ' ')
+
+        updates = []
+        gate = threading.Barrier(8)
+
+        def _update(old):
+            updates.append(old)
+            return old + 1
+
+        def _worker():
+            gate.wait()
+            self.cache.get(view, lambda: 0, _update)
+
+        threads = [threading.Thread(target=_worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(updates, [0])
+        self.assertEqual(self.cache.peek(view), 1)
+
+
+    def test_other_views_dont_wait(self):
+        slow, quick = StringBuffer(TEXT), StringBuffer(TEXT)
+        building = threading.Event()
+        release = threading.Event()
+
+        def _build():
+            building.set()
+            release.wait(5)
+            return 'slow'
+
+        thread = threading.Thread(target=self.cache.get, args=(slow, _build))
+        thread.start()
+        try:
+            self.assertTrue(building.wait(5))
+            # Not stuck behind the slow view's build
+            self.assertEqual(self.cache.get(quick, lambda: 'quick'), 'quick')
+            self.assertIsNone(self.cache.peek(slow))
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(self.cache.peek(slow), 'slow')
+
+
+if __name__ == '__main__':
+    unittest.main()
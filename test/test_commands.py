@@ -0,0 +1,306 @@
+import os
+import sys
+import shutil
+import tempfile
+import importlib
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import headless
+
+plugin = headless.load_plugin()
+commands = importlib.import_module(plugin.__package__ + '.cpp_refactor_commands')
+buffer = importlib.import_module(plugin.__package__ + '.lib.buffer')
+
+
+def _text(view):
+    return view.substr(buffer.Region(0, view.size()))
+
+
+def _command(cls, view):
+    """
+    :return: cls bound to view without the editor behind it
+    """
+    command = cls.__new__(cls)
+    command.view = view
+    return command
+
+
+def _detail(view, row, column=0):
+    """
+    :return: CppRefactorDetails of a right click at row and column of a
+    header, as the listener would build it
+    """
+    listener = plugin.CppRefactorListener()
+    ready = listener._row_context(view, row)
+    line, mark, impl = ready['line']
+    point = view.text_point(row, column)
+    return commands.CppRefactorDetails(
+        view=view, pos=view.text_to_layout(point), current_line=line,
+        current_file_type='header_file', header=view.file_name(),
+        source=os.path.splitext(view.file_name())[0] + '.cpp',
+        current_word=view.substr(view.word(point)), marked_position=mark,
+        impl_region=impl, snapshot=ready['snapshot']
+    )
+
+
+class GetterSetterTest(unittest.TestCase):
+
+    def _generate(self, text, row):
+        view = buffer.StringBuffer(text, file_name='/nowhere/widget.h')
+        found = commands.CppGetterSetterFunctionsCommand.get_commands(
+            _detail(view, row, 8)
+        )
+        self.assertEqual(found[0][0], 'gen_getset')
+        _command(commands.CppGetterSetterFunctionsCommand, view).run(None, **found[0][3])
+        return _text(view)
+
+
+    def test_indents_from_the_label(self):
+        output = self._generate(
+            'class Widget\n{\n  public:\n    int count;\n};\n', 3
+        )
+        self.assertIn(
+            '  public:\n      int getCount() const;\n      void setCount(int count);\n',
+            output
+        )
+
+
+    def test_label_with_extra_whitespace(self):
+        output = self._generate(
+            'class Widget\n{\npublic  slots:\n    int count;\n};\n', 3
+        )
+        self.assertIn('public  slots:\n    int getCount() const;\n', output)
+
+        output = self._generate(
+            'class Widget\n{\n\tprotected:\n    float *ratio;\n};\n', 3
+        )
+        self.assertIn('\tprotected:\n     const float *getRatio() const;\n', output)
+
+
+    def test_without_a_label(self):
+        output = self._generate('struct Point\n{\n    int x;\n};\n', 2)
+        self.assertIn('{\n    int getX() const;\n    void setX(int x);\n    int x;', output)
+
+
+WIDGET = """#pragma once
+namespace ns {
+class Widget : public QObject
+{
+    Q_OBJECT
+public:
+    Widget &operator=(const Widget &) = default;
+    bool operator==(const Widget &o) const;
+    int area(int w, int h) const;
+    int area(float w) const;
+    void set(const std::map<int, float> &m);
+signals:
+    void changed(int v);
+public slots:
+    void refresh();
+Q_SIGNALS:
+    void moved();
+private:
+    virtual void pure() = 0;
+};
+}
+
+namespace other {
+class Widget
+{
+public:
+    void only();
+};
+}
+"""
+
+
+class _SourceView(buffer.StringBuffer):
+    """
+    Just enough of a view to take the selection and scrolling after an
+    insert
+    """
+    class _Selection(list):
+        def add(self, region):
+            self.append(region)
+
+    def window(self):
+        return None
+
+    def sel(self):
+        return self._Selection()
+
+    def show_at_center(self, point):
+        pass
+
+
+class _Implementing(object):
+    """
+    Runs Implement Class on a header written out to a temporary folder
+    """
+    HEADER = WIDGET
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='cpp_toolkit_test')
+        self.header = os.path.join(self.directory, 'widget.h')
+        with open(self.header, 'w') as f:
+            f.write(self.HEADER)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def _implement(self, source, head=None):
+        view = _SourceView(source, file_name=os.path.join(self.directory, 'widget.cpp'))
+        _command(commands.CppImplementClassCommand, view).run(
+            None, header_file=self.header, class_name='Widget',
+            class_head=self.HEADER.index('class Widget') if head is None else head
+        )
+        return _text(view)[len(source):]
+
+
+    def _stubs(self, added):
+        return [line for line in added.split('\n') if line.endswith(')') or line.endswith('const')]
+
+
+
+class ImplementClassTest(_Implementing, unittest.TestCase):
+
+    def test_stubs(self):
+        added = self._implement('#include "widget.h"\n')
+        self.assertEqual(self._stubs(added), [
+            'bool ns::Widget::operator==(const Widget &o) const',
+            'int ns::Widget::area(int w, int h) const',
+            'int ns::Widget::area(float w) const',
+            'void ns::Widget::set(const std::map<int, float> &m)',
+            'void ns::Widget::refresh()',
+        ])
+        self.assertIn('\n{\n    \n}\n', added)
+
+
+    def test_skips_what_the_source_defines(self):
+        source = (
+            '#include "widget.h"\n'
+            'namespace ns {\n'
+            'int Widget::area(int width, int height) const { return 0; }\n'
+            '}\n'
+            'bool ns::Widget::operator==(const Widget &other) const { return true; }\n'
+            'void other::Widget::set(const std::map<int, float> &m) {}\n'
+        )
+        self.assertEqual(self._stubs(self._implement(source)), [
+            'int ns::Widget::area(float w) const',
+            'void ns::Widget::set(const std::map<int, float> &m)',
+            'void ns::Widget::refresh()',
+        ])
+
+
+    def test_using_namespace(self):
+        source = (
+            '#include "widget.h"\n'
+            'using namespace ns;\n'
+            'void Widget::refresh() {}\n'
+            'int Widget::area(float) const { return 0; }\n'
+        )
+        self.assertEqual(self._stubs(self._implement(source)), [
+            'bool ns::Widget::operator==(const Widget &o) const',
+            'int ns::Widget::area(int w, int h) const',
+            'void ns::Widget::set(const std::map<int, float> &m)',
+        ])
+
+
+    def test_other_class_of_the_same_name(self):
+        added = self._implement(
+            '#include "widget.h"\nvoid ns::Widget::refresh() {}\n',
+            head=WIDGET.rindex('class Widget')
+        )
+        self.assertEqual(self._stubs(added), ['void other::Widget::only()'])
+
+
+SIGNATURES = """namespace ns {
+class Other {};
+class Widget
+{
+public:
+    enum class Mode { A, B };
+    enum Color { Red };
+    struct Nested { int x; };
+    using Ptr = Widget *;
+    typedef std::vector<Nested> List;
+
+    auto trailing(int v) -> int;
+    auto modes() const noexcept -> std::vector<Mode>;
+    inline void fast();
+    constexpr int size() const;
+    int big(int a) const noexcept;
+    void maybe() noexcept(true);
+    void take() &&;
+    Widget *clone() const;
+    Mode mode() const;
+    Color color();
+    std::vector<Nested> all();
+    Ptr ptr();
+    List list();
+    Other *other();
+    std::string name() const;
+};
+}
+"""
+
+
+class ImplementSignaturesTest(_Implementing, unittest.TestCase):
+
+    HEADER = SIGNATURES
+
+    def test_stubs_match_the_declarations(self):
+        added = self._implement('')
+        self.assertEqual([line for line in added.split('\n') if '::' in line], [
+            'auto ns::Widget::trailing(int v) -> int',
+            'auto ns::Widget::modes() const noexcept -> std::vector<Mode>',
+            'int ns::Widget::big(int a) const noexcept',
+            'void ns::Widget::maybe() noexcept(true)',
+            'void ns::Widget::take() &&',
+            'ns::Widget * ns::Widget::clone() const',
+            'ns::Widget::Mode ns::Widget::mode() const',
+            'ns::Widget::Color ns::Widget::color()',
+            'std::vector<ns::Widget::Nested> ns::Widget::all()',
+            'ns::Widget::Ptr ns::Widget::ptr()',
+            'ns::Widget::List ns::Widget::list()',
+            'ns::Other * ns::Widget::other()',
+            'std::string ns::Widget::name() const',
+        ])
+
+
+    def test_noexcept_definitions_count(self):
+        source = (
+            'int ns::Widget::big(int) const noexcept { return 0; }\n'
+            'void ns::Widget::maybe() noexcept(true) {}\n'
+        )
+        added = self._implement(source)
+        self.assertNotIn('big', added)
+        self.assertNotIn('maybe', added)
+
+
+class PrefetchSizeTest(unittest.TestCase):
+
+    def test_counts_the_buffer_copy(self):
+        text = 'class Widget\n{\npublic:\n    int count;\n};\n' * 200
+        view = buffer.StringBuffer(text, file_name='/nowhere/widget.h')
+        listener = plugin.CppRefactorListener()
+        ready = listener._row_context(view, 3)
+
+        size = listener._row_context_size(ready)
+        self.assertGreater(size, len(text) + 4 * text.count('\n'))
+
+        prefetch = listener._prefetch
+        prefetch._store(view, 3, view.change_count(), ready)
+        try:
+            self.assertEqual(prefetch.size_of(view.id()), size)
+        finally:
+            prefetch.discard(view.id())
+        self.assertEqual(prefetch.size_of(view.id()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.executor import Executor
+
+
+class ExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = Executor(workers=1)
+
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+
+    def _run(self, value):
+        done = threading.Event()
+        found = []
+
+        def job():
+            found.append(value)
+            done.set()
+
+        token = self.executor.submit(job)
+        self.assertTrue(done.wait(5))
+        return token, found
+
+
+    def test_runs_jobs(self):
+        token, found = self._run(1)
+        self.assertEqual(found, [1])
+        self.assertFalse(token.cancelled)
+
+
+    def test_submit_after_shutdown(self):
+        # What a plugin reload does, the workers come back on the next job
+        self._run(1)
+        self.executor.shutdown()
+        self.assertEqual(self.executor.pending(), 0)
+
+        token, found = self._run(2)
+        self.assertEqual(found, [2])
+        self.assertFalse(token.cancelled)
+        self.assertEqual(len(self.executor._threads), 1)
+
+
+    def test_shutdown_cancels_queued_jobs(self):
+        token = self.executor.submit(lambda: None, delay=60)
+        self.executor.shutdown()
+        self.assertTrue(token.cancelled)
+        self.assertEqual(self.executor.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
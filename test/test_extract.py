@@ -0,0 +1,182 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.extract import extract_class, extract_definitions
+from lib.mask import CommentMask
+from lib.scope import ScopeTree
+from lib.snapshot import BufferSnapshot
+
+HEADER = """namespace ns {
+
+class Widget : public Base
+{
+    Q_OBJECT
+public:
+    using Base::Base;
+    explicit Widget(int size) : Base(size), size_(size) {}
+    virtual ~Widget();
+
+    // int commented(int a);
+    virtual int area(int w, int h) const = 0;
+    int size() const { return size_; }
+    auto ratio() const -> float;
+    template<typename T> T as() const;
+
+    enum class Mode { A, B };
+    struct Nested { int inner; };
+
+protected:
+    static const char *name_;
+    std::map<int, std::vector<float>> table_{};
+
+private:
+    int size_ = 0;
+    float *weights_;
+};
+
+}
+"""
+
+OPERATORS = """class A
+{
+public:
+    A &operator=(const A &) = default;
+    A &operator=(A &&other);
+    bool operator==(const A &o) const;
+    bool operator<(const A &o) const;
+    int operator()(int a, int b) const;
+    int &operator[](size_t i);
+    A *operator->();
+    explicit operator bool() const;
+    void operator delete[](void *p);
+    friend bool operator!=(const A &, const A &);
+    int operators_;
+};
+"""
+
+SOURCE = """#include "widget.h"
+
+namespace ns {
+
+Widget::~Widget() {}
+
+int Widget::area(int w, int h) const
+{
+    return w * h;
+}
+
+float
+Widget::ratio() const { return 1.0f; }
+
+bool operator==(const Widget &a, const Widget &b) { return true; }
+
+}
+
+A &A::operator=(A &&other) { return *this; }
+A::operator bool() const { return true; }
+int A::operator()(int a, int b) const { return a + b; }
+"""
+
+
+def _class(text, name):
+    snapshot = BufferSnapshot(text)
+    mask = CommentMask.build(text)
+    tree = ScopeTree.build(snapshot)
+    node = [n for n in tree.root.walk() if n.name == name][0]
+    return list(extract_class(node, snapshot, mask))
+
+
+def _definitions(text):
+    snapshot = BufferSnapshot(text)
+    return list(extract_definitions(
+        ScopeTree.build(snapshot), snapshot, CommentMask.build(text)
+    ))
+
+
+class ExtractClassTest(unittest.TestCase):
+
+    def test_declarations(self):
+        found = [(d.kind, d.name, d.access) for d in _class(HEADER, 'Widget')]
+        self.assertEqual(found, [
+            ('method', 'Widget', 'public'),
+            ('method', '~Widget', 'public'),
+            ('method', 'area', 'public'),
+            ('method', 'size', 'public'),
+            ('method', 'ratio', 'public'),
+            ('method', 'as', 'public'),
+            ('member', 'name_', 'protected'),
+            ('member', 'table_', 'protected'),
+            ('member', 'size_', 'private'),
+            ('member', 'weights_', 'private'),
+        ])
+
+
+    def test_details(self):
+        found = dict((d.name, d) for d in _class(HEADER, 'Widget'))
+
+        self.assertTrue(found['Widget'].has_impl)
+        self.assertTrue(found['size'].has_impl)
+        self.assertFalse(found['~Widget'].has_impl)
+
+        area = found['area']
+        self.assertEqual(area.default, '0')
+        self.assertEqual(area.function['args'], 'int w, int h')
+        self.assertEqual(area.function['addendum'], 'const')
+
+        self.assertEqual(found['as'].template, 'template<typename T>')
+        self.assertEqual((found['name_'].type, found['size_'].default), ('static const char*', '0'))
+        self.assertEqual(found['table_'].type, 'std::map<int, std::vector<float>>')
+
+        # Regions cover the whole statement
+        region = found['ratio'].region
+        self.assertEqual(HEADER[region[0]:region[1]], 'auto ratio() const -> float;')
+
+
+    def test_operators(self):
+        found = [(d.kind, d.name, d.default) for d in _class(OPERATORS, 'A')]
+        self.assertEqual(found, [
+            ('method', 'operator=', 'default'),
+            ('method', 'operator=', None),
+            ('method', 'operator==', None),
+            ('method', 'operator<', None),
+            ('method', 'operator()', None),
+            ('method', 'operator[]', None),
+            ('method', 'operator->', None),
+            ('method', 'operator bool', None),
+            ('method', 'operator delete[]', None),
+            ('member', 'operators_', None),
+        ])
+
+        declarations = _class(OPERATORS, 'A')
+        self.assertEqual(declarations[1].function['args'], 'A &&other')
+        self.assertEqual(declarations[4].function['args'], 'int a, int b')
+        self.assertEqual(declarations[4].function['addendum'], 'const')
+
+
+class ExtractDefinitionsTest(unittest.TestCase):
+
+    def test_definitions(self):
+        found = [(d.kind, d.owner, d.name) for d in _definitions(SOURCE)]
+        self.assertEqual(found, [
+            ('method', 'A', 'operator='),
+            ('method', 'A', 'operator bool'),
+            ('method', 'A', 'operator()'),
+            ('method', 'ns::Widget', '~Widget'),
+            ('method', 'ns::Widget', 'area'),
+            ('method', 'ns::Widget', 'ratio'),
+            ('function', 'ns', 'operator=='),
+        ])
+
+
+    def test_bodies(self):
+        found = dict((d.name, d) for d in _definitions(SOURCE))
+        begin, end = found['area'].impl_region
+        self.assertEqual(SOURCE[begin:end].strip(), '{\n    return w * h;\n}')
+        self.assertEqual(found['area'].function['args'], 'int w, int h')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.incremental import IncrementalIndex
+
+TEXT = """#include <string>
+
+namespace app {
+
+/* A block comment
+   with { braces } in it */
+class Widget : public Base
+{
+public:
+    Widget();
+    int size() const;
+
+protected slots:
+    void changed(int v);
+
+private:
+    std::string name_ = "a } b";
+};
+
+struct Point { int x; int y; };
+
+}
+"""
+
+
+class IncrementalIndexTest(unittest.TestCase):
+
+    def _edit(self, index, text, old, new):
+        self.assertIn(old, text)
+        text = text.replace(old, new, 1)
+        index.update(text)
+        self.assertTrue(index.verify(), 'after {!r} -> {!r}'.format(old, new))
+        return text
+
+
+    def test_edits_match_a_rebuild(self):
+        text = TEXT
+        index = IncrementalIndex(text)
+        index.tree
+
+        text = self._edit(index, text, 'int size()', 'long size()')
+        text = self._edit(index, text, '    Widget();\n', '')
+        text = self._edit(index, text, 'class Widget', 'class Gadget')
+        text = self._edit(index, text, '/* A block', '// /* A block')
+        text = self._edit(index, text, '// /* A block', '/* A block')
+        text = self._edit(index, text, 'private:', 'public:')
+        text = self._edit(index, text, '};\n\nstruct', '};\n\nclass Extra {};\nstruct')
+        text = self._edit(index, text, '"a } b"', '"a b"')
+        self._edit(index, text, text, '')
+
+
+    def test_shift_keeps_the_old_tree(self):
+        index = IncrementalIndex(TEXT)
+        before = index.tree
+        signature = before.signature()
+
+        index.update(TEXT.replace('int size()', 'unsigned int size()'))
+        self.assertEqual(index.shifted, 1)
+        self.assertIsNot(index.tree, before)
+        self.assertEqual(before.signature(), signature)
+        self.assertTrue(index.verify())
+
+        point = index.text.index('changed')
+        self.assertEqual(index.tree.chain_at(point), [['namespace', 'app'], ['class', 'Widget']])
+        self.assertEqual(index.tree.access_at(point).label, 'protected slots')
+
+
+    def test_structural_edit_rebuilds(self):
+        index = IncrementalIndex(TEXT)
+        index.tree
+        index.update(TEXT.replace('struct Point {', 'struct Point { struct In {};'))
+        self.assertEqual(index.rebuilt, 1)
+        self.assertTrue(index.verify())
+        self.assertIsNotNone(index.tree.find('struct', 'In'))
+
+
+    def test_signal_labels_rebuild(self):
+        text = TEXT.replace('    Widget();\n', 'foo:\n    void moved();\n')
+        index = IncrementalIndex(text)
+        index.tree
+
+        text = self._edit(index, text, 'foo:', 'signals:')
+        point = index.text.index('moved')
+        self.assertTrue(index.tree.access_at(point).signals)
+
+        text = self._edit(index, text, 'signals:', 'protecte:')
+        text = self._edit(index, text, 'protecte:', 'Q_SIGNAL:')
+        text = self._edit(index, text, 'Q_SIGNAL:', 'Q_SIGNALS:')
+        node = index.tree.find('class', 'Widget')
+        self.assertEqual(
+            [s.label for s in node.sections],
+            ['public', 'Q_SIGNALS', 'protected slots', 'private']
+        )
+
+
+    def test_relexes_only_the_edited_lines(self):
+        index = IncrementalIndex(TEXT)
+        relexed = index.relexed
+        index.update(TEXT.replace('int x;', 'int z;'))
+        self.assertEqual(index.relexed - relexed, 1)
+        self.assertIn('z', index.tokens(TEXT.count('\n', 0, TEXT.index('int x;'))))
+
+
+if __name__ == '__main__':
+    unittest.main()
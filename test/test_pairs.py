@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.pairs import PairIndex, ProjectPairs
+
+HEADERS = ['h', 'hpp']
+SOURCES = ['cpp']
+
+
+class _Settings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+
+class PairIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='cpp_toolkit_test')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+    def _touch(self, *paths):
+        for path in paths:
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+
+    def _path(self, relative):
+        return os.path.join(self.root, relative)
+
+
+    def _pair(self, index, relative):
+        found = index.pair_of(self._path(relative))
+        if found is None:
+            return None
+        return (found[0], os.path.relpath(found[1], self.root))
+
+
+    def test_side_by_side(self):
+        self._touch('a.h', 'a.hpp', 'a.cpp', 'b.h', 'sub/c.hpp', 'sub/c.cpp')
+        index = PairIndex([self.root], HEADERS, SOURCES)
+        index.build()
+
+        self.assertEqual(self._pair(index, 'a.cpp'), ('source', 'a.h'))
+        self.assertEqual(self._pair(index, 'a.hpp'), ('header', 'a.cpp'))
+        self.assertEqual(self._pair(index, 'sub/c.cpp'), ('source', os.path.join('sub', 'c.hpp')))
+        self.assertIsNone(self._pair(index, 'b.h'))
+
+
+    def test_roots(self):
+        self._touch(
+            'include/net/socket.h', 'src/net/socket.cpp',
+            'include/util.h', 'src/deep/down/util.cpp',
+            'include/a/dup.h', 'src/x/dup.cpp', 'src/y/dup.cpp'
+        )
+        index = PairIndex(
+            [self.root], HEADERS, SOURCES, [{ 'header' : 'include', 'source' : 'src' }]
+        )
+        index.build()
+
+        self.assertEqual(
+            self._pair(index, 'include/net/socket.h'),
+            ('header', os.path.join('src', 'net', 'socket.cpp'))
+        )
+        self.assertEqual(
+            self._pair(index, 'src/net/socket.cpp'),
+            ('source', os.path.join('include', 'net', 'socket.h'))
+        )
+        # The only util.cpp under src/
+        self.assertEqual(
+            self._pair(index, 'include/util.h'),
+            ('header', os.path.join('src', 'deep', 'down', 'util.cpp'))
+        )
+        # Two candidates and neither lines up
+        self.assertIsNone(self._pair(index, 'include/a/dup.h'))
+
+
+    def test_refresh_sees_new_files(self):
+        self._touch('a.h')
+        index = PairIndex([self.root], HEADERS, SOURCES)
+        index.build()
+        self.assertFalse(index.refresh())
+
+        # Directory mtimes can be coarse
+        time.sleep(0.05)
+        self._touch('a.cpp')
+        os.utime(self.root, (time.time() + 10, time.time() + 10))
+        self.assertTrue(index.refresh())
+        self.assertEqual(self._pair(index, 'a.h'), ('header', 'a.cpp'))
+
+
+    def test_probe(self):
+        self._touch('a.hpp', 'a.cpp', 'lone.h')
+        index = PairIndex([self.root], HEADERS, SOURCES)
+        self.assertEqual(index.probe(self._path('a.cpp')), ('source', self._path('a.hpp')))
+        self.assertEqual(index.probe(self._path('a.hpp')), ('header', self._path('a.cpp')))
+        self.assertIsNone(index.probe(self._path('lone.h')))
+        self.assertIsNone(index.probe(self._path('a.txt')))
+
+
+    def test_lookup_lists_directories_in_the_background(self):
+        self._touch('a.h', 'a.cpp')
+        walked = []
+        original = PairIndex._walk
+
+        def _walk(index):
+            walked.append(threading.current_thread())
+            return original(index)
+
+        PairIndex._walk = _walk
+        try:
+            pairs = ProjectPairs()
+            found = pairs.lookup(None, self._path('a.h'), _Settings())
+            self.assertEqual(found, ('header', self._path('a.cpp')))
+
+            index = pairs._directory(self.root, _Settings())
+            deadline = time.time() + 5
+            while not index.ready and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(index.ready)
+        finally:
+            PairIndex._walk = original
+
+        self.assertNotIn(threading.current_thread(), walked)
+        found = pairs.lookup(None, self._path('a.cpp'), _Settings())
+        self.assertEqual(found, ('source', self._path('a.h')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.buffer import StringBuffer
+from lib.incremental import IncrementalIndex
+from lib.indexer import Symbol
+from lib.parsecache import ParseCache, parse_cache, text_hash
+
+TEXT = """namespace ns {
+// A comment { with braces }
+class Widget : public Base
+{
+public:
+    Widget();
+    int size() const; /* not ; here */
+protected:
+    const char *name = "a { b";
+};
+}
+"""
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='cpp_toolkit_test')
+        self.cache = ParseCache(self.directory, max_bytes=1024 * 1024)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def test_no_directory_is_a_no_op(self):
+        cache = ParseCache()
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.load_symbols('/nowhere/a.h', 1.0))
+        cache.store_symbols('/nowhere/a.h', 1.0, text_hash(''), 0, [])
+        cache.clear()
+
+
+    def test_headless_view_with_a_path(self):
+        # The module's cache has no directory outside of the plugin
+        self.assertFalse(parse_cache.enabled)
+        view = StringBuffer(TEXT, file_name='/nowhere/widget.h')
+        index = IncrementalIndex.for_view(view)
+        self.assertEqual(index.text, TEXT)
+        self.assertTrue(index.verify())
+
+
+    def test_lex_round_trip(self):
+        index = IncrementalIndex(TEXT)
+        index.tree # Stored along with the rows
+        self.cache.store_lex(
+            'widget.h', None, TEXT, index._lines, index._spans,
+            index.mask, index.tree
+        )
+
+        cached = self.cache.load_lex('widget.h', TEXT)
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached['lines'], index._lines)
+        self.assertEqual(cached['spans'], index._spans)
+
+        everything = len(TEXT) + 1
+        self.assertEqual(
+            cached['mask'].ranges(0, everything), index.mask.ranges(0, everything)
+        )
+        self.assertEqual(cached['tree'].signature(), index.tree.signature())
+
+        loaded = IncrementalIndex(TEXT, cached)
+        self.assertTrue(loaded.verify())
+
+
+    def test_lex_needs_the_same_text(self):
+        index = IncrementalIndex(TEXT)
+        self.cache.store_lex(
+            'widget.h', None, TEXT, index._lines, index._spans, index.mask
+        )
+        self.assertIsNone(self.cache.load_lex('widget.h', TEXT + ' '))
+        self.assertIsNone(self.cache.load_lex('other.h', TEXT))
+        self.assertIsNone(self.cache.load_lex('widget.h', TEXT)['tree'])
+
+
+    def test_symbol_round_trip(self):
+        symbols = [
+            Symbol('class', 'Widget', 'ns', None, 'widget.h', 30),
+            Symbol('method', 'size', 'ns::Widget', 'public', 'widget.h', 90),
+            Symbol('member', 'name', 'ns::Widget', 'protected', 'widget.h', 140),
+        ]
+        self.cache.store_symbols('widget.h', 12.5, text_hash(TEXT), len(TEXT), symbols)
+
+        found = self.cache.load_symbols('widget.h', 12.5)
+        self.assertEqual(
+            [(s.kind, s.name, s.owner, s.access, s.point) for s in found],
+            [(s.kind, s.name, s.owner, s.access, s.point) for s in symbols]
+        )
+        self.assertIsNone(self.cache.load_symbols('widget.h', 13.0))
+        self.assertIsNotNone(self.cache.load_symbols('widget.h', 13.0, TEXT))
+
+
+    def test_eviction_leaves_writes_in_flight(self):
+        cache = ParseCache(self.directory, max_bytes=600)
+        pending = os.path.join(self.directory, ParseCache.TEMP_PREFIX + 'busy')
+        with open(pending, 'wb') as f:
+            f.write(b'\0' * 4096)
+
+        symbols = [Symbol('class', 'Widget', '', None, 'a.h', 0)]
+        for i in range(8):
+            path = '{}.h'.format(i)
+            cache.store_symbols(path, 1.0, text_hash(path), 1, symbols)
+
+        self.assertTrue(os.path.exists(pending))
+        self.assertGreater(cache.evicted, 0)
+        self.assertIsNotNone(cache.load_symbols('7.h', 1.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
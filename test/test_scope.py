@@ -0,0 +1,135 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.buffer import StringBuffer
+from lib.scope import ScopeTree
+from lib.snapshot import BufferSnapshot
+from lib.tokenize import CppTokenizer
+from bench.corpus import generate_header
+
+TEXT = """#include <vector>
+using namespace std;
+
+namespace outer {
+namespace inner {
+
+// class Commented { in a comment
+class Base
+{
+public:
+    virtual ~Base();
+};
+
+class Derived final : public Base, protected Other<int>
+{
+    struct Nested {
+        int value;
+    };
+
+public  slots:
+    void run() { if (true) { go(); } }
+    const char *brace = "{";
+};
+
+class Forward;
+
+}
+
+struct Point { int x; };
+}
+
+int main() { return 0; }
+"""
+
+OUTER = ['namespace', 'outer']
+INNER = ['namespace', 'inner']
+
+
+class ScopeTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.view = StringBuffer(TEXT)
+
+
+    def _chain(self, row):
+        return CppTokenizer.ownership_chain_at(self.view, self.view.text_point(row, 0))
+
+
+    def test_ownership_chain(self):
+        expected = {
+            1 : [],
+            4 : [OUTER],
+            6 : [OUTER, INNER],
+            8 : [OUTER, INNER],
+            10 : [OUTER, INNER, ['class', 'Base']],
+            13 : [OUTER, INNER],
+            15 : [OUTER, INNER, ['class', 'Derived']],
+            16 : [OUTER, INNER, ['class', 'Derived'], ['struct', 'Nested']],
+            21 : [OUTER, INNER, ['class', 'Derived']],
+            22 : [OUTER, INNER, ['class', 'Derived']],
+            24 : [OUTER, INNER],
+            27 : [OUTER],
+            28 : [OUTER],
+            31 : [],
+        }
+        for row, chain in sorted(expected.items()):
+            self.assertEqual(self._chain(row), chain, 'row {}'.format(row))
+
+
+    def test_location_outside(self):
+        end = CppTokenizer.location_outside(self.view, ['class', 'Derived'])
+        self.assertEqual(self.view.rowcol(end), (22, 2))
+        end = CppTokenizer.location_outside(self.view, ['namespace', 'outer'])
+        self.assertEqual(self.view.rowcol(end), (29, 1))
+        self.assertIsNone(CppTokenizer.location_outside(self.view, ['class', 'Forward']))
+
+
+    def test_sections_and_heads(self):
+        tree = ScopeTree.for_view(self.view)
+        node = tree.find('class', 'Derived')
+        self.assertEqual([s.label for s in node.sections], ['public slots'])
+
+        point = TEXT.index('void run')
+        self.assertEqual(tree.access_at(point).access, 'public')
+        self.assertIsNone(tree.access_at(TEXT.index('int value')))
+
+        self.assertIs(tree.head_at(TEXT.index('Derived final')), node)
+        self.assertIs(tree.head_at(TEXT.index('protected Other')), node)
+        self.assertIsNone(tree.head_at(TEXT.index('virtual')))
+
+
+    def test_signal_labels(self):
+        text = 'class W\n{\nsignals:\n    void a();\nQ_SIGNALS:\n    void b();\nprivate:\n};\n'
+        tree = ScopeTree.build(BufferSnapshot(text))
+        sections = tree.find('class', 'W').sections
+        self.assertEqual([s.label for s in sections], ['signals', 'Q_SIGNALS', 'private'])
+        self.assertEqual([s.access for s in sections], ['public', 'public', 'private'])
+        self.assertEqual([s.signals for s in sections], [True, True, False])
+
+
+    def test_matches_a_linear_scan(self):
+        text = generate_header(3000, seed=4)
+        view = StringBuffer(text)
+        tree = ScopeTree.for_view(view)
+        self.assertEqual(
+            tree.signature(), ScopeTree.build(BufferSnapshot(text)).signature()
+        )
+
+        nodes = [n for n in tree.root.walk() if n.kind is not None]
+        for row in range(text.count('\n')):
+            point = view.text_point(row, 0)
+            linear = [
+                [n.kind, n.name] for n in nodes
+                if n.contains(point) and n.name is not None
+            ]
+            self.assertEqual(
+                CppTokenizer.ownership_chain_at(view, point), linear,
+                'row {}'.format(row)
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
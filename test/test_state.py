@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.state import FunctionState
+
+
+def _parse(text):
+    return FunctionState.from_text(None, text).to_dict()
+
+
+class FunctionStateTest(unittest.TestCase):
+
+    def test_trailing_const_keeps_the_arguments(self):
+        found = _parse('int f(int) const;')
+        self.assertEqual((found['method'], found['args']), ('f', 'int'))
+        self.assertEqual(found['addendum'], 'const')
+
+        found = _parse('int f(int a, float b) const = 0;')
+        self.assertEqual(found['args'], 'int a, float b')
+        self.assertEqual(found['addendum'], 'const')
+
+
+    def test_pure_virtual_keeps_the_arguments(self):
+        found = _parse('f() = 0;')
+        self.assertEqual((found['method'], found['args']), ('f', ''))
+
+        found = _parse('virtual void f(int a) = 0;')
+        self.assertEqual((found['method'], found['args']), ('f', 'int a'))
+        self.assertEqual(found['static_or_virtual'], 'virtual')
+
+
+    def test_plain_declarations(self):
+        found = _parse('void f(int a);')
+        self.assertEqual((found['type'], found['method'], found['args']), ('void', 'f', 'int a'))
+        self.assertIsNone(found['addendum'])
+
+        found = _parse('static std::map<int, float> table(const char *name) const;')
+        self.assertEqual(found['static_or_virtual'], 'static')
+        self.assertEqual(found['args'], 'const char *name')
+
+
+if __name__ == '__main__':
+    unittest.main()
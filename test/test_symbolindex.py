@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import executor as executor_module
+from lib.executor import Cancelled, CancelToken
+from lib.indexer import ProjectIndexer, Symbol, SymbolTable, parse_symbols
+from lib.symbolindex import MappedSymbolTable, write_symbol_index
+
+HEADER = """namespace ns {
+class Widget
+{
+public:
+    int size() const;
+protected:
+    float ratio_ = 1.0f;
+};
+}
+"""
+
+SOURCE = """#include "widget.h"
+int ns::Widget::size() const { return 0; }
+"""
+
+
+VECTOR = """namespace ns {
+class Vec
+{
+public:
+    bool operator==(const Vec &o) const;
+    float length() const { return x_; }
+private:
+    union { int i; float f; } bits_;
+    float x_ = 0;
+};
+float Vec::length2() const { return x_ * x_; }
+template<typename T> T lerp(T a, T b, float t);
+}
+"""
+
+
+def _fields(symbols):
+    return sorted((s.kind, s.name, s.owner, s.access, s.path, s.point) for s in symbols)
+
+
+class ParseSymbolsTest(unittest.TestCase):
+
+    def test_symbols(self):
+        found = [(s.kind, s.qualified, s.access) for s in parse_symbols(VECTOR, 'vec.h')]
+        self.assertEqual(found, [
+            ('namespace', 'ns', None),
+            ('class', 'ns::Vec', None),
+            ('method', 'ns::Vec::operator==', 'public'),
+            ('method', 'ns::Vec::length', 'public'),
+            ('member', 'ns::Vec::x_', 'private'),
+            ('method', 'ns::Vec::length2', None),
+            ('function', 'ns::lerp', None),
+        ])
+
+
+    def test_points(self):
+        for symbol in parse_symbols(VECTOR, 'vec.h'):
+            self.assertEqual(symbol.path, 'vec.h')
+            self.assertIn(symbol.name, VECTOR[symbol.point:].split('\n', 1)[0])
+
+
+class MappedSymbolTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='cpp_toolkit_test')
+        self.path = os.path.join(self.directory, 'project.idx')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+    def _files(self, count):
+        files = []
+        for i in range(count):
+            path = '/src/file{:03}.h'.format(i)
+            files.append((path, 100.0 + i, [
+                Symbol('class', 'C{}'.format(i), 'ns', None, path, 10),
+                Symbol('method', 'get', 'ns::C{}'.format(i), 'public', path, 40),
+                Symbol('member', 'value_', 'ns::C{}'.format(i), 'private', path, 70),
+            ]))
+        return files
+
+
+    def test_lookups_match_a_symbol_table(self):
+        for count in (3, 100): # Both ways of finding a file
+            files = self._files(count)
+            write_symbol_index(self.path, files)
+
+            memory = SymbolTable()
+            for path, mtime, symbols in files:
+                memory.add_file(path, mtime, symbols)
+
+            table = MappedSymbolTable(self.path)
+            try:
+                self.assertEqual(len(table), 3 * count)
+                self.assertEqual(sorted(table.files()), sorted(memory.files()))
+                for name in ('get', 'C1', 'value_', 'missing'):
+                    self.assertEqual(_fields(table.named(name)), _fields(memory.named(name)))
+                for owner in ('ns', 'ns::C2', 'nope'):
+                    self.assertEqual(_fields(table.members_of(owner)), _fields(memory.members_of(owner)))
+                self.assertEqual(_fields(table.find('ns::C2::get')), _fields(memory.find('ns::C2::get')))
+
+                path = files[-1][0]
+                self.assertEqual(_fields(table.in_file(path)), _fields(memory.in_file(path)))
+                self.assertEqual(table.mtime_of(path), files[-1][1])
+                self.assertIsNone(table.mtime_of('/src/other.h'))
+                self.assertEqual(table.in_file('/src/other.h'), [])
+            finally:
+                table.close()
+
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not an index at all, not even close to one')
+        self.assertRaises(ValueError, MappedSymbolTable, self.path)
+
+
+class ProjectIndexerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='cpp_toolkit_test')
+        self.project = os.path.join(self.root, 'project')
+        os.makedirs(self.project)
+        self.header = os.path.join(self.project, 'widget.h')
+        with open(self.header, 'w') as f:
+            f.write(HEADER)
+        with open(os.path.join(self.project, 'widget.cpp'), 'w') as f:
+            f.write(SOURCE)
+        self.index_path = os.path.join(self.root, 'index', 'project')
+
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+    def _indexer(self, mapped=True):
+        return ProjectIndexer(
+            [self.project], ['h'], ['cpp'],
+            index_path=self.index_path if mapped else None
+        )
+
+
+    def _touch(self, text):
+        with open(self.header, 'w') as f:
+            f.write(text)
+        later = time.time() + 5
+        os.utime(self.header, (later, later))
+
+
+    def test_build_and_reload(self):
+        indexer = self._indexer()
+        indexer.build()
+        self.assertEqual(indexer.parsed, 2)
+        with indexer.reading() as table:
+            self.assertIsInstance(table, MappedSymbolTable)
+            self.assertEqual([s.kind for s in table.find('ns::Widget::size')], ['method', 'method'])
+            self.assertEqual([s.access for s in table.find('ns::Widget::ratio_')], ['protected'])
+
+        again = self._indexer()
+        again.build()
+        self.assertEqual(again.parsed, 0)
+        with again.reading() as table:
+            self.assertEqual(len(table.find('ns::Widget::size')), 2)
+
+
+    def test_old_tables_close_once_read(self):
+        indexer = self._indexer()
+        indexer.build()
+        first = indexer.table
+
+        with indexer.reading() as held:
+            self._touch(HEADER.replace('int size', 'long count'))
+            indexer.build()
+            self.assertIsNot(indexer.table, held)
+            self.assertFalse(held._map.closed)
+            self.assertEqual(len(held.find('ns::Widget::size')), 2)
+
+        self.assertTrue(first._map.closed)
+        self.assertEqual(len(indexer.table.find('ns::Widget::count')), 1)
+
+        second = indexer.table
+        self._touch(HEADER)
+        indexer.build()
+        self.assertTrue(second._map.closed)
+
+        directory, base = os.path.split(self.index_path)
+        self.assertEqual(len([n for n in os.listdir(directory) if n.startswith(base)]), 1)
+
+
+    def test_unmapped_builds_swap_tables(self):
+        indexer = self._indexer(mapped=False)
+        indexer.build()
+
+        with indexer.reading() as held:
+            self._touch(HEADER.replace('int size', 'long count'))
+            indexer.build()
+            # What we were reading wasn't touched, the new one replaced it
+            self.assertIsNot(indexer.table, held)
+            self.assertEqual(len(held.find('ns::Widget::size')), 2)
+            self.assertEqual(held.find('ns::Widget::count'), [])
+
+        table = indexer.table
+        self.assertEqual(len(table.find('ns::Widget::count')), 1)
+        self.assertEqual(len(table.find('ns::Widget::size')), 1) # The source
+        self.assertEqual(len(table.files()), 2)
+
+        indexer.build()
+        self.assertIs(indexer.table, table) # Nothing changed
+
+
+    def test_cancel_drops_chunks_not_started(self):
+        for i in range(4 * ProjectIndexer.CHUNK_SIZE):
+            with open(os.path.join(self.project, 'f{}.h'.format(i)), 'w') as f:
+                f.write('class F{} {{}};\n'.format(i))
+
+        release = threading.Event()
+        futures = []
+
+        class _Pool(ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                if futures:
+                    # Hold the worker on the second chunk
+                    def _held(*args):
+                        release.wait(5)
+                        return fn(*args)
+                    future = ThreadPoolExecutor.submit(self, _held, *args)
+                else:
+                    future = ThreadPoolExecutor.submit(self, fn, *args)
+                futures.append(future)
+                return future
+
+        indexer = self._indexer(mapped=False)
+        indexer._pool = lambda: _Pool(max_workers=1)
+        token = CancelToken()
+        token.cancel()
+        executor_module._local.token = token
+        try:
+            self.assertRaises(Cancelled, indexer.build)
+        finally:
+            executor_module._local.token = None
+            release.set()
+
+        self.assertEqual(len(futures), 5)
+        self.assertFalse(futures[0].cancelled())
+        self.assertTrue(all(f.cancelled() for f in futures[2:]))
+        self.assertEqual(len(indexer.table), 0) # Left as it was
+
+
+if __name__ == '__main__':
+    unittest.main()
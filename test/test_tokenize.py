@@ -0,0 +1,88 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.tokenize import CppTokenizer
+from lib.snapshot import BufferSnapshot
+from lib.mask import CommentMask
+from lib.profiler import PhaseProfiler
+from bench.bench_lexer import legacy_get_tokens
+
+LINES = [
+    'namespace ns { class A : public B<int> {',
+    '    virtual const char *name(int a = 0) const = 0; // why',
+    '    std::map<int, std::string> table_{};',
+    '  int x;\t// and',
+    "    char c = '{';",
+    'a/b // c',
+    '',
+    '   ',
+]
+
+TEXT = """class Widget // a { comment
+{
+public:
+    int size(const char *s = "{ ; }") const; /* a comment */
+};
+"""
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_lex_matches_the_legacy_loop(self):
+        for line in LINES:
+            for skip in (True, False):
+                legacy = legacy_get_tokens(line, skip_whitespace=skip)
+                if skip:
+                    # The old _next() passed over the spaces it kept
+                    legacy = [t for t in legacy if t != ' ']
+                self.assertEqual(
+                    CppTokenizer.lex(line, skip_whitespace=skip), legacy, repr(line)
+                )
+
+
+    def test_spans_point_at_the_tokens(self):
+        snapshot = BufferSnapshot(TEXT)
+        for mask in (None, CommentMask.build(TEXT)):
+            izer = CppTokenizer(None, snapshot=snapshot, mask=mask)
+            seen = []
+            while True:
+                token = izer._next()
+                if token is None:
+                    break
+                start, end = izer.span(izer.mark())
+                self.assertEqual(TEXT[start:end], token)
+                self.assertEqual(izer.current_point(), end)
+                seen.append(token)
+            self.assertIn('"{ ; }"' if mask else 'size', seen)
+            self.assertNotIn('comment', seen)
+
+
+    def test_marks_outlive_their_line(self):
+        izer = CppTokenizer(None, snapshot=BufferSnapshot(TEXT))
+        izer._next()
+        first = izer.mark()
+        for _ in range(5):
+            izer._next()
+        self.assertEqual(izer.span(first), (0, 5))
+        self.assertEqual(izer.last_token().text, 'int')
+
+
+    def test_counts_tokens_only_while_profiling(self):
+        profiler = PhaseProfiler()
+        before = CppTokenizer.tokens_read
+        list(CppTokenizer(None, snapshot=BufferSnapshot(TEXT)))
+        self.assertEqual(CppTokenizer.tokens_read, before)
+
+        profiler.enabled = True
+        try:
+            tokens = list(CppTokenizer(None, snapshot=BufferSnapshot(TEXT)))
+            self.assertGreaterEqual(CppTokenizer.tokens_read - before, len(tokens))
+        finally:
+            profiler.enabled = False
+
+
+if __name__ == '__main__':
+    unittest.main()
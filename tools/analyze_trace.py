@@ -0,0 +1,214 @@
+"""
+Summarize the CppToolkit command trace (see lib/trace.py).
+
+    python tools/analyze_trace.py [trace.jsonl ...] [--buckets 1000,10000,50000]
+                                  [--json]
+
+Without paths every trace*.jsonl in the directories given by --dir (the
+plugin's cache directory by default on each platform) is read. Records are
+grouped by event (menu, cpp_refactor, ...) and by the line count of the
+file they ran on, and each group reports its latency percentiles, a
+histogram and the phases that took the most time.
+"""
+import os
+import sys
+import glob
+import json
+import math
+import argparse
+
+from collections import defaultdict
+
+#
+# Upper edges (ms) of the histogram bins, the last bin is everything above
+#
+BINS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+def _default_dirs():
+    """
+    :return: list of where Sublime Text keeps the plugin's cache on this
+    platform
+    """
+    home = os.path.expanduser('~')
+    candidates = [
+        os.path.join(home, '.cache', 'sublime-text', 'Cache', 'CppRefactor'),
+        os.path.join(home, '.config', 'sublime-text-3', 'Cache', 'CppRefactor'),
+        os.path.join(home, 'Library', 'Caches', 'Sublime Text', 'Cache', 'CppRefactor'),
+        os.path.join(home, 'Library', 'Application Support', 'Sublime Text 3', 'Cache', 'CppRefactor'),
+    ]
+    local = os.environ.get('LOCALAPPDATA')
+    if local:
+        candidates.append(os.path.join(local, 'Sublime Text', 'Cache', 'CppRefactor'))
+        candidates.append(os.path.join(local, 'Sublime Text 3', 'Cache', 'CppRefactor'))
+    return [c for c in candidates if os.path.isdir(c)]
+
+
+def read_records(paths):
+    """
+    :param paths: list of trace files
+    :return: generator of dict records (lines that don't parse are skipped)
+    """
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue # A partial write
+
+
+def _bucket_name(lines, buckets):
+    """
+    :return: str label of the line count bucket lines falls in
+    """
+    if lines is None:
+        return 'unknown'
+
+    lower = 0
+    for upper in buckets:
+        if lines < upper:
+            return '{}-{}'.format(lower, upper)
+        lower = upper
+    return '{}+'.format(lower)
+
+
+def _percentile(ordered, percent):
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[min(max(rank - 1, 0), len(ordered) - 1)]
+
+
+def _histogram(durations):
+    """
+    :return: list[int] of counts per BINS (with a final overflow bin)
+    """
+    counts = [0] * (len(BINS) + 1)
+    for duration in durations:
+        for index, upper in enumerate(BINS):
+            if duration < upper:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+def aggregate(records, buckets):
+    """
+    :param records: iterable of trace records
+    :param buckets: list[int] of line count bucket edges
+    :return: dict mapping (event, bucket) to its summary
+    """
+    groups = defaultdict(list)
+    for record in records:
+        key = (record.get('event', '?'), _bucket_name(record.get('lines'), buckets))
+        groups[key].append(record)
+
+    output = {}
+    for key, group in groups.items():
+        durations = sorted(r.get('duration_ms', 0.0) for r in group)
+
+        phases = defaultdict(list)
+        outcomes = defaultdict(int)
+        for record in group:
+            outcomes[record.get('outcome', '?')] += 1
+            for name, elapsed in record.get('phases', {}).items():
+                phases[name].append(elapsed)
+
+        output[key] = {
+            'count' : len(durations),
+            'p50_ms' : _percentile(durations, 50),
+            'p90_ms' : _percentile(durations, 90),
+            'p99_ms' : _percentile(durations, 99),
+            'max_ms' : durations[-1],
+            'histogram' : _histogram(durations),
+            'outcomes' : dict(outcomes),
+            'phases' : dict(
+                (name, {
+                    'p50_ms' : _percentile(sorted(values), 50),
+                    'p99_ms' : _percentile(sorted(values), 99),
+                }) for name, values in phases.items()
+            )
+        }
+    return output
+
+
+def _bucket_order(name):
+    if name == 'unknown':
+        return float('inf')
+    return int(name.split('-')[0].rstrip('+'))
+
+
+def format_report(summary, width=40):
+    """
+    :return: str of the summary for a terminal
+    """
+    labels = ['<{}ms'.format(BINS[0])]
+    labels += ['{}-{}ms'.format(lo, hi) for lo, hi in zip(BINS, BINS[1:])]
+    labels.append('>{}ms'.format(BINS[-1]))
+
+    lines = []
+    for key in sorted(summary, key=lambda k: (k[0], _bucket_order(k[1]))):
+        stats = summary[key]
+        lines.append('{} ({} lines) - {} runs'.format(key[0], key[1], stats['count']))
+        lines.append('    p50 {:.2f} ms  p90 {:.2f} ms  p99 {:.2f} ms  max {:.2f} ms'.format(
+            stats['p50_ms'], stats['p90_ms'], stats['p99_ms'], stats['max_ms']
+        ))
+        lines.append('    outcomes: ' + ', '.join(
+            '{} {}'.format(k, v) for k, v in sorted(stats['outcomes'].items())
+        ))
+
+        peak = max(stats['histogram']) or 1
+        for label, count in zip(labels, stats['histogram']):
+            if count:
+                bar = '#' * max(1, int(round(width * count / float(peak))))
+                lines.append('    {:>12} {:6} {}'.format(label, count, bar))
+
+        slowest = sorted(
+            stats['phases'].items(), key=lambda i: -i[1]['p99_ms']
+        )[:5]
+        for name, phase in slowest:
+            lines.append('    phase {:48} p50 {:8.2f} ms  p99 {:8.2f} ms'.format(
+                name, phase['p50_ms'], phase['p99_ms']
+            ))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('paths', nargs='*', help='Trace files to read')
+    parser.add_argument('--dir', action='append', default=None,
+                        help='Directory holding trace*.jsonl (repeatable)')
+    parser.add_argument('--buckets', default='1000,10000,50000',
+                        help='Comma separated line count bucket edges')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    paths = list(args.paths)
+    if not paths:
+        for directory in (args.dir or _default_dirs()):
+            paths.extend(sorted(glob.glob(os.path.join(directory, 'trace*.jsonl'))))
+
+    if not paths:
+        print('No trace files found (is "trace_commands" on?)')
+        return 1
+
+    buckets = [int(b) for b in args.buckets.split(',') if b]
+    summary = aggregate(read_records(paths), buckets)
+
+    if args.json:
+        print(json.dumps(dict(
+            ('{}/{}'.format(*key), value) for key, value in summary.items()
+        ), indent=2, sort_keys=True))
+    else:
+        print(format_report(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())